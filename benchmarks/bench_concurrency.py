@@ -0,0 +1,83 @@
+"""
+Concurrency benchmark: multi-threaded CREATE throughput in disjoint subtrees,
+with and without a long-running LIST in another thread, for a plain
+DirectoryStructure behind one global lock versus ConcurrentDirectoryStructure.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_concurrency [--threads T] [--operations N] [--list-size N]
+"""
+import argparse
+import threading
+import time
+
+from concurrency import ConcurrentDirectoryStructure
+from directory_structure import DirectoryStructure
+
+
+class GloballyLocked:
+    """A DirectoryStructure with every call wrapped in one global lock."""
+
+    def __init__(self):
+        self.structure = DirectoryStructure()
+        self.lock = threading.Lock()
+
+    def create_directory(self, path):
+        with self.lock:
+            self.structure.create_directory(path)
+
+    def iter_directory(self):
+        # A LIST holds the lock for the whole listing
+        with self.lock:
+            yield from self.structure.iter_directory()
+
+
+def run(structure, threads: int, operations: int, list_size: int) -> float:
+    """Returns the CREATE throughput of the writer threads."""
+    for i in range(list_size):
+        structure.create_directory(f"listed/dir{i // 100}/leaf{i}")
+    stop = threading.Event()
+
+    def lister():
+        while not stop.is_set():
+            for _ in structure.iter_directory():
+                pass
+
+    def writer(index):
+        for i in range(operations):
+            structure.create_directory(f"writer{index}/dir{i // 100}/leaf{i}")
+
+    for index in range(threads):
+        structure.create_directory(f"writer{index}")
+    background = threading.Thread(target=lister) if list_size else None
+    if background:
+        background.start()
+    workers = [threading.Thread(target=writer, args=(index,)) for index in range(threads)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - start
+    stop.set()
+    if background:
+        background.join()
+    return threads * operations / elapsed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--operations", type=int, default=20_000)
+    parser.add_argument("--list-size", type=int, default=200_000)
+    options = parser.parse_args(argv)
+
+    for list_size in (0, options.list_size):
+        scenario = f"with LIST of {list_size} nodes" if list_size else "writers only"
+        for label, factory in (("global lock", GloballyLocked), ("subtree locks", ConcurrentDirectoryStructure)):
+            rate = run(factory(), options.threads, options.operations, list_size)
+            print(f"{scenario:>26}, {label:>13}: {rate:10.0f} creates/s")
+
+
+if __name__ == "__main__":
+    main()
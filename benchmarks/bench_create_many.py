@@ -0,0 +1,45 @@
+"""
+Bulk CREATE benchmark: create_many versus a create_directory loop on
+sibling-heavy paths (many leaves below a few deep parents).
+
+Run from the repository root:
+
+    python -m benchmarks.bench_create_many [--paths N] [--depth D]
+"""
+import argparse
+import time
+
+from directory_structure import DirectoryStructure
+
+
+def sibling_paths(count: int, depth: int, parents: int = 100) -> list:
+    """Generates count leaves spread over a number of parent directories of the given depth."""
+    prefixes = ["/".join(f"p{p}l{level}" for level in range(depth)) for p in range(parents)]
+    per_parent = count // parents
+    return [f"{prefix}/leaf{i}" for prefix in prefixes for i in range(per_parent)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--paths", type=int, default=100_000)
+    parser.add_argument("--depth", type=int, default=20)
+    options = parser.parse_args(argv)
+
+    paths = sibling_paths(options.paths, options.depth)
+    for label, cache_size in (("loop, no cache", 0), ("loop, path cache", DirectoryStructure.PATH_CACHE_SIZE)):
+        structure = DirectoryStructure(path_cache_size=cache_size)
+        start = time.perf_counter()
+        for path in paths:
+            structure.create_directory(path)
+        elapsed = time.perf_counter() - start
+        print(f"{label:>18}: {len(paths) / elapsed:10.0f} creates/s")
+
+    structure = DirectoryStructure()
+    start = time.perf_counter()
+    structure.create_many(paths)
+    elapsed = time.perf_counter() - start
+    print(f"{'create_many':>18}: {len(paths) / elapsed:10.0f} creates/s")
+
+
+if __name__ == "__main__":
+    main()
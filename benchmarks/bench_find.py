@@ -0,0 +1,60 @@
+"""
+FIND benchmark: name and prefix lookups through the name index versus a
+full walk of the tree matching every directory name.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_find [--nodes N] [--fanout F] [--repeats R]
+"""
+import argparse
+import time
+from fnmatch import fnmatchcase
+
+from benchmarks.bench_memory import generate_paths
+from directory_structure import DirectoryStructure
+
+
+def find_by_walk(structure: DirectoryStructure, pattern: str) -> list:
+    """Finds matching directories the only way possible without an index: walking everything."""
+    found = []
+    stack = [("", structure.directory)]
+    while stack:
+        prefix, node = stack.pop()
+        for name, child in node.items():
+            path = prefix + name
+            if fnmatchcase(name, pattern):
+                found.append(path)
+            if child.children:
+                stack.append((path + "/", child))
+    found.sort()
+    return found
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--nodes", type=int, default=200_000)
+    parser.add_argument("--fanout", type=int, default=10)
+    parser.add_argument("--repeats", type=int, default=5)
+    options = parser.parse_args(argv)
+
+    structure = DirectoryStructure()
+    for index, path in enumerate(generate_paths(options.nodes, options.fanout)):
+        # Give every directory a unique leaf-level name as well, so exact
+        # lookups have one match and prefix lookups have a few
+        structure.create_directory(f"{path}/n{index}")
+
+    start = time.perf_counter()
+    structure.find_directories("n0")
+    print(f"{'index build':>22}: {time.perf_counter() - start:8.4f} s (first FIND only)")
+
+    for pattern in ("n12345", "n1234*", "dir3"):
+        for label, finder in (("walk", find_by_walk), ("index", DirectoryStructure.find_directories)):
+            start = time.perf_counter()
+            for _ in range(options.repeats):
+                found = finder(structure, pattern)
+            elapsed = (time.perf_counter() - start) / options.repeats
+            print(f"{label + ' ' + pattern:>22}: {elapsed:8.4f} s ({len(found)} matches)")
+
+
+if __name__ == "__main__":
+    main()
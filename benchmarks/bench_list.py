@@ -0,0 +1,64 @@
+"""
+LIST benchmark: repeated full listings of a tree with wide directories,
+re-sorting every directory on each LIST versus the cached sorted views.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_list [--width W] [--repeats N]
+"""
+import argparse
+import time
+
+from directory_structure import DirectoryStructure
+
+
+def build_wide_tree(width: int) -> DirectoryStructure:
+    """Builds a tree with one directory of width children, each with a few children."""
+    structure = DirectoryStructure()
+    for i in range(width):
+        structure.create_directory(f"wide/child{(i * 7919) % width}")
+    for i in range(0, width, 10):
+        for j in range(5):
+            structure.create_directory(f"wide/child{i}/sub{j}")
+    return structure
+
+
+def list_resorting(structure: DirectoryStructure) -> int:
+    """Produces the listing the way LIST used to: sorting every directory each time."""
+    count = 0
+    stack = [iter(sorted(structure.directory.items()))]
+    while stack:
+        entry = next(stack[-1], None)
+        if entry is None:
+            stack.pop()
+            continue
+        name, contents = entry
+        "  " * (len(stack) - 1) + name
+        count += 1
+        if contents.children:
+            stack.append(iter(sorted(contents.items())))
+    return count
+
+
+def list_cached(structure: DirectoryStructure) -> int:
+    """Produces the listing through iter_directory."""
+    return sum(1 for _ in structure.iter_directory())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--width", type=int, default=20_000)
+    parser.add_argument("--repeats", type=int, default=20)
+    options = parser.parse_args(argv)
+
+    structure = build_wide_tree(options.width)
+    for label, lister in (("re-sorting", list_resorting), ("cached", list_cached)):
+        start = time.perf_counter()
+        for _ in range(options.repeats):
+            lister(structure)
+        elapsed = time.perf_counter() - start
+        print(f"{label:>10}: {elapsed / options.repeats * 1000:8.2f} ms per LIST")
+
+
+if __name__ == "__main__":
+    main()
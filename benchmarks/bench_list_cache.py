@@ -0,0 +1,88 @@
+"""
+LIST cache benchmark: repeats a LIST of the whole tree, as a monitor
+polling it would, with a few random CREATEs, MOVEs and DELETEs between
+listings, walking the tree for every LIST versus splicing the cached
+rendering of the unchanged subtrees. Reports the time per LIST and the
+memory the cache holds.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_list_cache [--nodes N ...] [--changes N] [--lists N]
+"""
+import argparse
+import gc
+import random
+import time
+import tracemalloc
+from contextlib import redirect_stdout, suppress
+
+from benchmarks.bench_list_format import build
+from benchmarks.suite import NullWriter
+from directory_structure import DirectoryStructure
+
+
+def change(structure: DirectoryStructure, rng: random.Random, paths: list) -> None:
+    """Applies one random CREATE, MOVE or DELETE to the tree."""
+    operation = rng.random()
+    path = rng.choice(paths)
+    with suppress(Exception):
+        if operation < 0.6:
+            structure.create_directory(f"{path}/n{rng.randrange(1_000_000)}")
+        elif operation < 0.8:
+            structure.move_directory(path, rng.choice(paths).rsplit("/", 1)[0])
+        else:
+            structure.delete_directory(path)
+
+
+def run(structure: DirectoryStructure, lists: int, changes: int, seed: int) -> float:
+    """
+    Lists the tree, then makes some changes and lists it again, lists times.
+
+    Returns:
+        float: Average seconds per LIST, the first one excluded
+    """
+    rng = random.Random(seed)
+    paths = list(structure._iter_paths("", structure.directory))[1:]
+    paths = [path.lstrip("/") for path in rng.sample(paths, min(len(paths), 1000))]
+    elapsed = 0.0
+    with redirect_stdout(NullWriter()):
+        structure.print_directory()
+        for _ in range(lists):
+            for _ in range(changes):
+                change(structure, rng, paths)
+            start = time.perf_counter()
+            structure.print_directory()
+            elapsed += time.perf_counter() - start
+    return elapsed / lists
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--nodes", type=int, nargs="+", default=[100_000, 400_000])
+    parser.add_argument("--changes", type=int, default=10, help="changes between two listings")
+    parser.add_argument("--lists", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    options = parser.parse_args(argv)
+
+    for nodes in options.nodes:
+        print(f"{nodes} directories, {options.changes} changes between listings:")
+        walking = build(nodes, options.seed)
+        walking.CACHE_LISTINGS = False
+        elapsed = run(walking, options.lists, options.changes, options.seed)
+        print(f"  {'walked':>8}: {elapsed * 1000:8.1f} ms per LIST")
+
+        cached = build(nodes, options.seed)
+        elapsed = run(cached, options.lists, options.changes, options.seed)
+        cached._listing = None
+        gc.collect()
+        tracemalloc.start()
+        with redirect_stdout(NullWriter()):
+            cached.print_directory()
+        held, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"  {'cached':>8}: {elapsed * 1000:8.1f} ms per LIST, "
+              f"{len(cached._listing)} blocks holding {held / 2 ** 20:.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
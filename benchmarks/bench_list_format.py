@@ -0,0 +1,95 @@
+"""
+LIST --format benchmark: serialises a large tree to JSON the naive way
+(copying it into nested lists and dicts and calling json.dumps on the
+result) and with the streaming formats of print_directory, reporting the
+time taken and the peak memory allocated while serialising.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_list_format [--nodes N ...] [--seed S]
+"""
+import argparse
+import gc
+import json
+import random
+import time
+import tracemalloc
+from contextlib import redirect_stdout
+
+from benchmarks.suite import NullWriter
+from directory_structure import DirectoryStructure
+from exceptions import DirectoryAlreadyExistsError
+
+
+def build(nodes: int, seed: int) -> DirectoryStructure:
+    """Builds a tree of nodes directories, up to six levels deep."""
+    rng = random.Random(seed)
+    structure = DirectoryStructure()
+    paths = [""]
+    while len(paths) <= nodes:
+        parent = rng.choice(paths)
+        if parent.count("/") >= 5:
+            parent = ""
+        path = f"{parent}/d{rng.randrange(1_000_000)}".lstrip("/")
+        try:
+            structure.create_directory(path)
+        except DirectoryAlreadyExistsError:
+            continue
+        paths.append(path)
+    return structure
+
+
+def nested(node) -> list:
+    """Copies a directory into the nested lists and dicts LIST --format json prints."""
+    return [{"name": name, "children": nested(child)} for name, child in node.sorted_items()]
+
+
+def dump_naive(structure: DirectoryStructure) -> None:
+    """Serialises the whole tree with one json.dumps call and writes it out."""
+    NullWriter().write(json.dumps(nested(structure.directory)) + "\n")
+
+
+def dump_streaming(list_format: str):
+    """Returns a function printing the whole tree in the given LIST format."""
+    def dump(structure: DirectoryStructure) -> None:
+        with redirect_stdout(NullWriter()):
+            structure.print_directory(list_format=list_format)
+    return dump
+
+
+def measure(dump, structure: DirectoryStructure) -> tuple:
+    """
+    Runs one serialisation.
+
+    Returns:
+        tuple: Seconds taken, and peak memory allocated meanwhile in bytes
+    """
+    gc.collect()
+    start = time.perf_counter()
+    dump(structure)
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    dump(structure)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--nodes", type=int, nargs="+", default=[100_000, 400_000])
+    parser.add_argument("--seed", type=int, default=0)
+    options = parser.parse_args(argv)
+
+    dumps = [("json.dumps", dump_naive)] + [(f"--format {name}", dump_streaming(name))
+                                            for name in ("json", "ndjson", "paths")]
+    for nodes in options.nodes:
+        structure = build(nodes, options.seed)
+        print(f"{nodes} directories:")
+        for label, dump in dumps:
+            elapsed, peak = measure(dump, structure)
+            print(f"  {label:>16}: {elapsed:7.3f} s, peak {peak / 2 ** 20:8.2f} MiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Memory benchmark: bytes per directory for the legacy nested-dict tree versus
+the slotted Node tree used by DirectoryStructure.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_memory [--nodes N] [--fanout F]
+"""
+import argparse
+import gc
+import tracemalloc
+
+from directory_structure import DirectoryStructure
+
+
+def generate_paths(nodes: int, fanout: int) -> list:
+    """
+    Generates paths for a tree of the given size where every directory has up
+    to fanout children, named so that names repeat across the tree.
+    """
+    paths = []
+    queue = [""]
+    while queue and len(paths) < nodes:
+        parent = queue.pop(0)
+        for i in range(fanout):
+            if len(paths) >= nodes:
+                break
+            path = f"{parent}/dir{i}" if parent else f"dir{i}"
+            paths.append(path)
+            queue.append(path)
+    return paths
+
+
+def build_dict_tree(paths: list) -> dict:
+    """Builds the tree the way DirectoryStructure used to: nested dicts."""
+    tree = {}
+    for path in paths:
+        current = tree
+        for folder in path.split("/"):
+            if folder not in current:
+                current[folder] = {}
+            current = current[folder]
+    return tree
+
+
+def build_node_tree(paths: list) -> DirectoryStructure:
+    """Builds the tree through DirectoryStructure.create_directory."""
+    structure = DirectoryStructure()
+    for path in paths:
+        structure.create_directory(path)
+    return structure
+
+
+def measure(builder, paths: list) -> int:
+    """Returns the number of bytes still allocated by the result of builder."""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = builder(paths)
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del result
+    return after - before
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--nodes", type=int, default=200_000)
+    parser.add_argument("--fanout", type=int, default=10)
+    options = parser.parse_args(argv)
+
+    paths = generate_paths(options.nodes, options.fanout)
+    for label, builder in (("nested dict", build_dict_tree), ("Node", build_node_tree)):
+        total = measure(builder, paths)
+        print(f"{label:>12}: {total / len(paths):8.1f} bytes/node ({total / 2 ** 20:.1f} MiB for {len(paths)} nodes)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+MOVE benchmark on deep trees: moves half of a chain of directories back and
+forth between two branches, so every MOVE resolves paths and checks ancestry
+over thousands of levels and relinks a subtree thousands of levels deep.
+Nothing in the tree code recurses, so depths far beyond the recursion limit
+work.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_move [--depths D ...] [--moves N]
+"""
+import argparse
+import time
+
+from directory_structure import DirectoryStructure
+from persistent_structure import PersistentDirectoryStructure
+
+
+def chain(top: str, depth: int) -> str:
+    """Returns the path of the directory depth levels down a chain starting at top."""
+    return "/".join([top] + ["n"] * (depth - 1))
+
+
+def run_moves(structure, depth: int, moves: int) -> float:
+    """
+    Builds a chain of depth directories under 'left' and an equally deep one
+    under 'right', then moves the lower half of the left chain to the bottom
+    of the right one and back, moves times.
+
+    Returns:
+        float: Seconds per MOVE
+    """
+    half = depth // 2
+    structure.create_directory(chain("left", depth))
+    structure.create_directory(chain("right", depth))
+    # The lower half of the left chain, and where it ends up under 'right'
+    away = (chain("left", half + 1), chain("right", depth))
+    back = (chain("right", depth + 1), chain("left", half))
+    start = time.perf_counter()
+    for i in range(moves):
+        structure.move_directory(*(away if i % 2 == 0 else back))
+    elapsed = time.perf_counter() - start
+    if moves % 2 == 0:
+        assert structure.stat_directory("left")[1] == depth - 1
+    return elapsed / moves
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--depths", type=int, nargs="+", default=[100, 1_000, 10_000])
+    parser.add_argument("--moves", type=int, default=100)
+    options = parser.parse_args(argv)
+
+    for depth in options.depths:
+        for label, engine in (("mutable", DirectoryStructure), ("persistent", PersistentDirectoryStructure)):
+            per_move = run_moves(engine(), depth, options.moves)
+            print(f"{label:>10} depth {depth:>6}: {per_move * 1e6:10.1f} us per MOVE")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+Path parsing microbenchmark: per-command overhead of validating and
+splitting path arguments, before (scan + normalize with a regex compiled on
+every call + split in the structure) and after (one cached parse), plus
+end-to-end DirectoryManager.process throughput.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_parse [--commands N] [--distinct N]
+"""
+import argparse
+import io
+import time
+from contextlib import redirect_stdout
+
+from directory_manager import DirectoryManager
+from paths import parse_path
+
+
+def legacy_parse(path: str) -> tuple:
+    """The path handling DirectoryManager.process used to do for each argument."""
+    import re
+    if not path or any(char in path for char in set('<>:"|?*')):
+        return None
+    normalized = path.strip()
+    if normalized.startswith('/'):
+        normalized = normalized[1:]
+    if normalized.endswith('/'):
+        normalized = normalized[:-1]
+    normalized = re.sub(r'/{2,}', '/', normalized)
+    if not all(part and not part.isspace() for part in normalized.split('/')):
+        return None
+    return tuple(path.split("/"))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--commands", type=int, default=200_000)
+    parser.add_argument("--distinct", type=int, default=1_000)
+    options = parser.parse_args(argv)
+
+    paths = [f"projects/team{i % 10}/service{i}/src/module" for i in range(options.distinct)]
+    workload = [paths[i % len(paths)] for i in range(options.commands)]
+    for label, parser_function in (("legacy", legacy_parse), ("cached parse", lambda path: parse_path(path).parts)):
+        start = time.perf_counter()
+        for path in workload:
+            parser_function(path)
+        elapsed = time.perf_counter() - start
+        print(f"{label:>14}: {elapsed / len(workload) * 1e9:8.0f} ns per path")
+
+    manager = DirectoryManager()
+    start = time.perf_counter()
+    with redirect_stdout(io.StringIO()):
+        for path in workload:
+            manager.process("CREATE", [path])
+    elapsed = time.perf_counter() - start
+    print(f"{'process CREATE':>14}: {elapsed / len(workload) * 1e9:8.0f} ns per command")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""
+Path cache benchmark: CREATE/DELETE/MOVE throughput on deep paths with and
+without the path -> Node lookup cache.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_path_index [--depth D] [--operations N]
+"""
+import argparse
+import time
+
+from directory_structure import DirectoryStructure
+
+
+def deep_workload(structure: DirectoryStructure, depth: int, operations: int) -> None:
+    """
+    Creates, moves and deletes many leaves below a handful of deep prefixes,
+    so the same long parent paths are resolved over and over.
+    """
+    prefixes = ["/".join(f"p{branch}l{level}" for level in range(depth)) for branch in range(4)]
+    for prefix in prefixes:
+        structure.create_directory(prefix)
+    for i in range(operations):
+        prefix = prefixes[i % len(prefixes)]
+        structure.create_directory(f"{prefix}/leaf{i}")
+    for i in range(0, operations, 2):
+        source = prefixes[i % len(prefixes)]
+        dest = prefixes[(i + 1) % len(prefixes)]
+        structure.move_directory(f"{source}/leaf{i}", dest)
+    for i in range(1, operations, 2):
+        structure.delete_directory(f"{prefixes[i % len(prefixes)]}/leaf{i}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--depth", type=int, default=100)
+    parser.add_argument("--operations", type=int, default=50_000)
+    options = parser.parse_args(argv)
+
+    total_ops = options.operations * 2
+    for label, cache_size in (("no cache", 0), ("path cache", DirectoryStructure.PATH_CACHE_SIZE)):
+        structure = DirectoryStructure(path_cache_size=cache_size)
+        start = time.perf_counter()
+        deep_workload(structure, options.depth, options.operations)
+        elapsed = time.perf_counter() - start
+        print(f"{label:>10}: {total_ops / elapsed:10.0f} ops/s at depth {options.depth}")
+
+
+if __name__ == "__main__":
+    main()
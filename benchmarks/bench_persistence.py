@@ -0,0 +1,73 @@
+"""
+Persistence benchmark: CREATE overhead of the mutation log at several group
+commit sizes, and recovery time from a snapshot plus a log tail.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_persistence [--nodes N] [--writes N] [--tail N]
+"""
+import argparse
+import tempfile
+import time
+
+from benchmarks.bench_memory import generate_paths
+from directory_structure import DirectoryStructure
+from persistence import Journal
+
+
+def time_writes(paths: list, data_dir: str = None, fsync_every: int = 1) -> float:
+    """Returns the seconds taken to create every path, optionally journaled."""
+    structure = DirectoryStructure()
+    journal = None
+    if data_dir is not None:
+        journal = Journal(data_dir, fsync_every=fsync_every)
+        journal.open(structure)
+    start = time.perf_counter()
+    for path in paths:
+        structure.create_directory(path)
+    if journal is not None:
+        journal.close()
+    return time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--nodes", type=int, default=1_000_000)
+    parser.add_argument("--writes", type=int, default=20_000)
+    parser.add_argument("--tail", type=int, default=50_000)
+    options = parser.parse_args(argv)
+
+    paths = generate_paths(options.writes, 10)
+    baseline = time_writes(paths)
+    print(f"{'no journal':>20}: {len(paths) / baseline:10.0f} creates/s")
+    for fsync_every in (1, 100, 10_000, 0):
+        writes = paths[:2_000] if fsync_every == 1 else paths
+        with tempfile.TemporaryDirectory() as data_dir:
+            elapsed = time_writes(writes, data_dir, fsync_every)
+        label = f"fsync every {fsync_every}" if fsync_every else "fsync on close"
+        print(f"{label:>20}: {len(writes) / elapsed:10.0f} creates/s")
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        structure = DirectoryStructure()
+        journal = Journal(data_dir, fsync_every=0)
+        journal.open(structure)
+        for path in generate_paths(options.nodes, 10):
+            structure.create_directory(path)
+        start = time.perf_counter()
+        journal.snapshot()
+        print(f"snapshot of {options.nodes} nodes: {time.perf_counter() - start:.2f}s")
+        for i in range(options.tail):
+            structure.create_directory(f"tail/dir{i}")
+        journal.close()
+
+        start = time.perf_counter()
+        restored = DirectoryStructure()
+        journal = Journal(data_dir)
+        replayed = journal.open(restored)
+        journal.close()
+        print(f"recovery of {options.nodes + options.tail + 1} nodes "
+              f"({replayed} log records): {time.perf_counter() - start:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
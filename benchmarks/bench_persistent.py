@@ -0,0 +1,72 @@
+"""
+Write cost benchmark: bytes allocated and time per CREATE for the mutable
+Node engine versus the persistent (path-copying) engine.
+
+The persistent engine's allocations are measured while every previous root
+is kept alive, as it would be by readers holding snapshots, so the numbers
+include everything each write copies.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_persistent [--nodes N] [--fanout F] [--writes W]
+"""
+import argparse
+import gc
+import random
+import time
+import tracemalloc
+
+from benchmarks.bench_memory import generate_paths
+from directory_structure import DirectoryStructure
+from persistent_structure import PersistentDirectoryStructure
+
+
+def write_paths(existing: list, writes: int, seed: int = 0) -> list:
+    """Generates new leaves below randomly chosen existing directories."""
+    rng = random.Random(seed)
+    return [f"{rng.choice(existing)}/new{i}" for i in range(writes)]
+
+
+def measure(structure, paths: list, keep_snapshots: bool) -> tuple:
+    """Returns the bytes allocated and the seconds taken per create."""
+    snapshots = []
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    for path in paths:
+        structure.create_directory(path)
+        if keep_snapshots:
+            snapshots.append(structure.snapshot())
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    # The snapshot list itself is not part of the write cost
+    allocated = after - before - (len(snapshots) * 8 if keep_snapshots else 0)
+
+    start = time.perf_counter()
+    for path in paths:
+        structure.create_directory(path + "t")
+    elapsed = time.perf_counter() - start
+    return allocated / len(paths), elapsed / len(paths)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--nodes", type=int, default=100_000)
+    parser.add_argument("--fanout", type=int, default=10)
+    parser.add_argument("--writes", type=int, default=2_000)
+    options = parser.parse_args(argv)
+
+    existing = generate_paths(options.nodes, options.fanout)
+    paths = write_paths(existing, options.writes)
+    engines = (("mutable", DirectoryStructure, False), ("persistent", PersistentDirectoryStructure, True))
+    for label, engine, keep_snapshots in engines:
+        structure = engine()
+        for path in existing:
+            structure.create_directory(path)
+        allocated, elapsed = measure(structure, paths, keep_snapshots)
+        print(f"{label:>10}: {allocated:8.0f} bytes/write, {elapsed * 1e6:6.1f} us/write")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""
+Replica read-scaling benchmark: builds a tree on a primary that publishes
+its change feed, starts more and more replica processes following it, and
+has every replica answer the same stream of read commands (COUNT, STATS,
+FIND and short LISTs) while the primary keeps writing. Reports the total
+read throughput of all replicas and how far behind they were at the end.
+
+Each replica is a separate process, so the total only grows with the
+number of replicas on a machine with enough free CPU cores.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_replicas [--nodes N] [--reads N] [--writes N] [--replicas R ...]
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+from contextlib import redirect_stdout
+
+from benchmarks.suite import NullWriter
+from directory_manager import DirectoryManager
+from directory_structure import DirectoryStructure
+from replication import ChangeFeed, ReplicaDirectoryStructure
+
+
+def build(nodes: int, seed: int) -> tuple:
+    """
+    Builds a tree of about nodes directories, three levels deep.
+
+    Returns:
+        tuple: The structure and the paths of its directories
+    """
+    rng = random.Random(seed)
+    structure = DirectoryStructure()
+    paths = []
+    while len(paths) < nodes:
+        path = "/".join(f"d{rng.randrange(32)}" for _ in range(rng.randint(1, 3)))
+        try:
+            structure.create_directory(path)
+        except Exception:
+            continue
+        paths.append(path)
+    return structure, paths
+
+
+def read_commands(paths: list, count: int, seed: int) -> list:
+    """
+    Generates count read commands over the given directories.
+    """
+    rng = random.Random(seed)
+    commands = []
+    for _ in range(count):
+        path = rng.choice(paths)
+        kind = rng.randrange(4)
+        if kind == 0:
+            commands.append(f"COUNT {path}")
+        elif kind == 1:
+            commands.append(f"STATS {path}")
+        elif kind == 2:
+            commands.append(f"FIND d{rng.randrange(32)} under {path.split('/')[0]}")
+        else:
+            commands.append(f"LIST {path} --depth 1")
+    return commands
+
+
+def serve_reads(feed_path: str, commands: list, start, results) -> None:
+    """
+    Replica process: follows the feed, waits for the other replicas, runs
+    the read commands and reports how long they took and the lag left.
+    """
+    replica = ReplicaDirectoryStructure.connect(feed_path)
+    replica.wait()
+    manager = DirectoryManager(replica)
+    start.wait()
+    began = time.perf_counter()
+    with redirect_stdout(NullWriter()):
+        manager.run_batch(commands)
+    elapsed = time.perf_counter() - began
+    results.put((elapsed, replica.lag()[0]))
+    replica.close()
+
+
+def run(structure, paths: list, feed_path: str, replicas: int, commands: list, writes: int,
+        seed: int) -> tuple:
+    """
+    Runs the read commands on replicas replica processes while the primary
+    writes.
+
+    Returns:
+        tuple: Reads per second over all replicas, and the largest lag (in
+        events) a replica had when it finished
+    """
+    context = multiprocessing.get_context("spawn")
+    start = context.Barrier(replicas + 1)
+    results = context.Queue()
+    processes = [context.Process(target=serve_reads, args=(feed_path, commands, start, results))
+                 for _ in range(replicas)]
+    for process in processes:
+        process.start()
+    start.wait()
+    rng = random.Random(seed)
+    began = time.perf_counter()
+    for i in range(writes):
+        structure.create_directory(f"{rng.choice(paths)}/w{seed}_{i}")
+    outcomes = [results.get() for _ in processes]
+    elapsed = time.perf_counter() - began
+    for process in processes:
+        process.join()
+    return replicas * len(commands) / elapsed, max(lag for _, lag in outcomes)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--nodes", type=int, default=20_000)
+    parser.add_argument("--reads", type=int, default=20_000)
+    parser.add_argument("--writes", type=int, default=10_000)
+    parser.add_argument("--replicas", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--seed", type=int, default=0)
+    options = parser.parse_args(argv)
+
+    structure, paths = build(options.nodes, options.seed)
+    commands = read_commands(paths, options.reads, options.seed)
+    print(f"{os.cpu_count()} CPUs, {options.nodes} directories, {options.reads} reads per replica, "
+          f"{options.writes} concurrent writes")
+    with tempfile.TemporaryDirectory() as tmp:
+        feed = ChangeFeed()
+        feed.attach(structure)
+        feed.listen(os.path.join(tmp, "feed.sock"))
+        try:
+            for index, replicas in enumerate(options.replicas):
+                rate, lag = run(structure, paths, os.path.join(tmp, "feed.sock"), replicas, commands,
+                                options.writes, options.seed + index)
+                print(f"{replicas:>3} replicas: {rate:12.0f} reads/s, lag at the end: {lag} events")
+        finally:
+            feed.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Server load generator: starts `directories.py --port` in a subprocess, opens
+many client connections that each pipeline CREATE/LIST commands with a
+bounded number in flight, and reports requests/sec and latency percentiles.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_server [--clients N] [--requests N] [--window N]
+"""
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+from collections import deque
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def wait_for_server(port: int, timeout: float = 10.0) -> None:
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            _, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            await asyncio.sleep(0.05)
+
+
+async def client(port: int, index: int, requests: int, window: int, latencies: list) -> None:
+    """Pipelines requests on one connection, keeping at most window of them in flight."""
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    in_flight = asyncio.Semaphore(window)
+    sent = deque()
+
+    async def send():
+        for i in range(requests):
+            await in_flight.acquire()
+            command = f"LIST client{index} --limit 5\n" if i % 10 == 9 else f"CREATE client{index}/dir{i // 100}/leaf{i}\n"
+            sent.append(time.perf_counter())
+            writer.write(command.encode())
+            if len(sent) >= window:
+                await writer.drain()
+        await writer.drain()
+
+    async def receive():
+        for _ in range(requests):
+            count = int(await reader.readline())
+            for _ in range(count):
+                await reader.readline()
+            latencies.append(time.perf_counter() - sent.popleft())
+            in_flight.release()
+
+    await asyncio.gather(send(), receive())
+    writer.close()
+
+
+async def run(port: int, clients: int, requests: int, window: int) -> None:
+    await wait_for_server(port)
+    latencies = []
+    start = time.perf_counter()
+    await asyncio.gather(*(client(port, index, requests, window, latencies) for index in range(clients)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+
+    def percentile(fraction):
+        return latencies[min(len(latencies) - 1, int(len(latencies) * fraction))] * 1000
+
+    print(f"{clients} clients x {requests} requests (window {window}): "
+          f"{len(latencies) / elapsed:.0f} requests/s, "
+          f"p50 {percentile(0.5):.2f}ms, p99 {percentile(0.99):.2f}ms, max {latencies[-1] * 1000:.2f}ms")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=5_000)
+    parser.add_argument("--window", type=int, default=32)
+    options = parser.parse_args(argv)
+
+    port = free_port()
+    server = subprocess.Popen([sys.executable, os.path.join(ROOT, "directories.py"), "--port", str(port)],
+                              cwd=ROOT, stderr=subprocess.DEVNULL)
+    try:
+        asyncio.run(run(port, options.clients, options.requests, options.window))
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    main()
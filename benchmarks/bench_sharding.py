@@ -0,0 +1,84 @@
+"""
+Sharding scaling benchmark: replays the same CREATE-heavy command stream
+(spread over many top-level directories, with a LIST of the whole tree at
+the end) through the mutable engine and through the sharded engine with
+more and more worker processes, and reports the throughput of each.
+
+The shards only run in parallel on separate cores, so the speedup is
+bounded by the number of CPUs the machine actually has.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_sharding [--commands N] [--workers W ...] [--seed S]
+"""
+import argparse
+import os
+import random
+import time
+from contextlib import redirect_stdout
+
+from benchmarks.suite import NullWriter
+from directory_manager import DirectoryManager
+from directory_structure import DirectoryStructure
+from paths import parse_path
+from sharding import ShardedDirectoryStructure
+
+
+def commands(count: int, seed: int) -> list:
+    """
+    Generates count commands: CREATEs of paths up to four levels deep under
+    256 top-level directories, with some DELETEs and MOVEs mixed in, and a
+    final LIST.
+    """
+    rng = random.Random(seed)
+    tops = [f"top{i}" for i in range(256)]
+    created = []
+    lines = []
+    for i in range(count - 1):
+        roll = rng.random()
+        if created and roll < 0.05:
+            lines.append(f"DELETE {rng.choice(created)}")
+        elif created and roll < 0.10:
+            lines.append(f"MOVE {rng.choice(created)} {rng.choice(tops)}")
+        else:
+            path = "/".join([rng.choice(tops)] + [f"d{rng.randrange(64)}" for _ in range(rng.randint(1, 3))])
+            created.append(path)
+            lines.append(f"CREATE {path}")
+    lines.append("LIST")
+    return lines
+
+
+def throughput(structure, lines: list) -> float:
+    """
+    Returns the commands per second of a batch run on structure.
+    """
+    parse_path.cache_clear()
+    manager = DirectoryManager(structure)
+    start = time.perf_counter()
+    with redirect_stdout(NullWriter()):
+        manager.run_batch(lines)
+    return len(lines) / (time.perf_counter() - start)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--commands", type=int, default=200_000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--seed", type=int, default=0)
+    options = parser.parse_args(argv)
+
+    lines = commands(options.commands, options.seed)
+    print(f"{os.cpu_count()} CPUs, {len(lines)} commands")
+    baseline = throughput(DirectoryStructure(), lines)
+    print(f"{'mutable':>12}: {baseline:12.0f} commands/s")
+    for workers in options.workers:
+        structure = ShardedDirectoryStructure(workers)
+        try:
+            rate = throughput(structure, lines)
+        finally:
+            structure.close()
+        print(f"{f'{workers} shards':>12}: {rate:12.0f} commands/s ({rate / baseline:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
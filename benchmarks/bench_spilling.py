@@ -0,0 +1,108 @@
+"""
+Memory budget benchmark: builds the same tree with no budget and with
+budgets that are a fraction of its size, then runs a skewed stream of
+commands (most of them in a few hot subtrees, as in trees where most
+subtrees are rarely touched). Reports the memory the tree holds at the
+end, the command throughput, the hit rate and the page-in latency.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_spilling [--nodes N] [--commands N] [--budgets F ...]
+"""
+import argparse
+import gc
+import random
+import time
+import tracemalloc
+
+from directory_structure import DirectoryStructure
+from exceptions import DirectoryAlreadyExistsError
+from spilling import SpillingDirectoryStructure
+
+
+def paths_of(nodes: int, seed: int) -> list:
+    """Generates nodes distinct paths, four levels deep, below 32 x 32 units."""
+    rng = random.Random(seed)
+    paths = set()
+    while len(paths) < nodes:
+        paths.add(f"t{rng.randrange(32)}/u{rng.randrange(32)}/d{rng.randrange(16)}/e{rng.randrange(16)}")
+    return sorted(paths)
+
+
+def commands_of(paths: list, count: int, seed: int) -> list:
+    """
+    Generates count (operation, path) commands; a unit's chance of being
+    used falls off with its rank, so a few units get most of them.
+    """
+    rng = random.Random(seed)
+    units = sorted({path.rsplit("/", 2)[0] for path in paths})
+    rng.shuffle(units)
+    weights = [1 / (rank + 1) for rank in range(len(units))]
+    commands = []
+    for unit in rng.choices(units, weights, k=count):
+        operation = rng.choice(("CREATE", "STATS", "LIST"))
+        commands.append((operation, f"{unit}/n{rng.randrange(1000)}" if operation == "CREATE" else unit))
+    return commands
+
+
+def run(structure: DirectoryStructure, paths: list, commands: list) -> tuple:
+    """
+    Builds the tree and runs the commands.
+
+    Returns:
+        tuple: Memory held by the structure at the end and at its peak in
+        bytes, and seconds taken by the commands
+    """
+    gc.collect()
+    tracemalloc.start()
+    structure.create_many(paths)
+    start = time.perf_counter()
+    for operation, path in commands:
+        if operation == "CREATE":
+            try:
+                structure.create_directory(path)
+            except DirectoryAlreadyExistsError:
+                pass
+        elif operation == "STATS":
+            structure.stat_directory(path)
+        else:
+            for _ in structure.iter_directory(path):
+                pass
+    elapsed = time.perf_counter() - start
+    gc.collect()
+    held, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return held, peak, elapsed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--nodes", type=int, default=200_000)
+    parser.add_argument("--commands", type=int, default=50_000)
+    parser.add_argument("--budgets", type=float, nargs="+", default=[0.5, 0.2, 0.05],
+                        help="budgets as fractions of the number of directories")
+    parser.add_argument("--seed", type=int, default=0)
+    options = parser.parse_args(argv)
+
+    paths = paths_of(options.nodes, options.seed)
+    commands = commands_of(paths, options.commands, options.seed)
+    held, peak, elapsed = run(DirectoryStructure(), paths, commands)
+    print(f"{'no budget':>12}: {held / 2 ** 20:6.1f} MiB (peak {peak / 2 ** 20:6.1f} MiB), "
+          f"{len(commands) / elapsed:7.0f} commands/s")
+    for fraction in options.budgets:
+        structure = SpillingDirectoryStructure(int(fraction * options.nodes))
+        try:
+            held, peak, elapsed = run(structure, paths, commands)
+            stats = structure.memory_stats()
+        finally:
+            structure.close()
+        reached = stats["hits"] + stats["misses"]
+        average = stats["page_in_seconds"] / stats["page_ins"] if stats["page_ins"] else 0.0
+        print(f"{fraction:>11.0%} : {held / 2 ** 20:6.1f} MiB (peak {peak / 2 ** 20:6.1f} MiB), "
+              f"{len(commands) / elapsed:7.0f} commands/s, "
+              f"hit rate {stats['hits'] / reached:.1%}, {stats['evictions']} evictions, "
+              f"page-in avg {average * 1e6:.0f} us")
+
+
+if __name__ == "__main__":
+    main()
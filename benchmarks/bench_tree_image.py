@@ -0,0 +1,57 @@
+"""
+Tree image benchmark: startup time of a multi-million-node tree loaded from
+the binary image (memory-mapped, lazily materialised) versus the text
+snapshot and versus replaying CREATEs.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_tree_image [--nodes N]
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from benchmarks.bench_memory import generate_paths
+from directory_structure import DirectoryStructure
+from persistence import load_snapshot, write_snapshot
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--nodes", type=int, default=2_000_000)
+    options = parser.parse_args(argv)
+
+    paths = generate_paths(options.nodes, 20)
+    start = time.perf_counter()
+    structure = DirectoryStructure()
+    for path in paths:
+        structure.create_directory(path)
+    print(f"{'replay CREATEs':>22}: {time.perf_counter() - start:9.3f}s for {len(paths)} nodes")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        image = os.path.join(tmp, "tree.img")
+        snapshot = os.path.join(tmp, "snapshot")
+        start = time.perf_counter()
+        structure.save(image)
+        print(f"{'SAVE':>22}: {time.perf_counter() - start:9.3f}s ({os.path.getsize(image) / 2 ** 20:.1f} MiB)")
+        write_snapshot(structure.directory, snapshot, 0)
+        del structure
+
+        start = time.perf_counter()
+        load_snapshot(snapshot)
+        print(f"{'text snapshot load':>22}: {time.perf_counter() - start:9.3f}s")
+
+        start = time.perf_counter()
+        loaded = DirectoryStructure()
+        loaded.load(image)
+        print(f"{'LOAD (lazy)':>22}: {(time.perf_counter() - start) * 1000:9.3f}ms")
+
+        start = time.perf_counter()
+        loaded.create_directory(paths[-1] + "/new")
+        lines = sum(1 for _ in loaded.iter_directory(paths[len(paths) // 2]))
+        print(f"{'first deep CREATE+LIST':>22}: {(time.perf_counter() - start) * 1000:9.3f}ms ({lines} lines)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,245 @@
+"""
+Benchmark suite: runs the seeded workloads from benchmarks.workloads against
+DirectoryStructure directly and end to end through DirectoryManager.process,
+and reports throughput, latency percentiles and peak memory as JSON.
+
+Run from the repository root:
+
+    python -m benchmarks.suite [--nodes N] [--seed S] [--workloads NAME ...]
+                               [--output FILE] [--baseline FILE] [--tolerance T]
+
+With --baseline, the results are compared against a file written earlier by
+--output and the exit status is 1 if any workload got slower (or used more
+memory) by more than the tolerance. Throughput depends on the machine, so a
+baseline should be recorded on the machine it is compared on.
+"""
+import argparse
+import gc
+import io
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+from benchmarks.workloads import WORKLOADS
+from directory_manager import DirectoryManager
+from directory_structure import DirectoryStructure
+from paths import parse_path
+
+PERCENTILES = (50, 90, 99)
+
+
+class NullWriter(io.TextIOBase):
+    """Discards everything written to it, so LIST output costs no memory."""
+
+    def write(self, text: str) -> int:
+        return len(text)
+
+
+def structure_driver():
+    """
+    Returns a function that applies one command to a fresh DirectoryStructure.
+    """
+    structure = DirectoryStructure()
+
+    def run_list(path):
+        for _ in structure.iter_directory(path):
+            pass
+
+    def run_create(*paths):
+        if len(paths) == 1:
+            structure.create_directory(paths[0])
+        else:
+            structure.create_many(paths)
+
+    handlers = {
+        "CREATE": run_create,
+        "MOVE": structure.move_directory,
+        "DELETE": structure.delete_directory,
+        "LIST": run_list,
+    }
+    return lambda command, args: handlers[command](*args)
+
+
+def manager_driver():
+    """
+    Returns a function that runs one command through DirectoryManager.process
+    on a fresh manager.
+    """
+    return DirectoryManager().process
+
+
+DRIVERS = {
+    "structure": structure_driver,
+    "manager": manager_driver,
+}
+
+
+def percentile(ordered: list, percent: float) -> float:
+    """
+    Returns the given percentile of an already sorted list (nearest rank).
+    """
+    rank = max(int(len(ordered) * percent / 100 + 0.5), 1)
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def time_workload(workload, make_driver) -> dict:
+    """
+    Builds the setup tree and times each measured command separately.
+
+    Returns:
+        dict: Throughput and latency figures for the measured commands
+    """
+    # Every run starts cold, whatever ran before it
+    parse_path.cache_clear()
+    apply = make_driver()
+    for command, args in workload.setup:
+        apply(command, args)
+    latencies = []
+    clock = time.perf_counter_ns
+    gc.collect()
+    start = clock()
+    for command, args in workload.operations:
+        began = clock()
+        apply(command, args)
+        latencies.append(clock() - began)
+    elapsed = (clock() - start) / 1e9
+    latencies.sort()
+    return {
+        "operations": len(latencies),
+        "seconds": round(elapsed, 6),
+        "ops_per_sec": round(len(latencies) / elapsed, 1),
+        "latency_us": {
+            **{f"p{percent}": round(percentile(latencies, percent) / 1000, 3) for percent in PERCENTILES},
+            "max": round(latencies[-1] / 1000, 3),
+        },
+    }
+
+
+def peak_memory(workload, make_driver) -> int:
+    """
+    Runs the whole workload under tracemalloc (separately from the timed run,
+    which tracing would slow down).
+
+    Returns:
+        int: Peak number of bytes allocated while running it
+    """
+    parse_path.cache_clear()
+    gc.collect()
+    tracemalloc.start()
+    apply = make_driver()
+    for command, args in workload.setup:
+        apply(command, args)
+    for command, args in workload.operations:
+        apply(command, args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+def run_suite(nodes: int, seed: int = 0, workloads=None, drivers=None, memory: bool = True) -> dict:
+    """
+    Runs every selected workload with every selected driver.
+
+    Args:
+        nodes (int): Size parameter passed to the workload generators
+        seed (int, optional): Seed for the workload generators
+        workloads (list, optional): Workload names. Defaults to all of them.
+        drivers (list, optional): Driver names. Defaults to all of them.
+        memory (bool, optional): Whether to measure peak memory as well
+
+    Returns:
+        dict: The report, ready to be written as JSON
+    """
+    results = []
+    # LIST output is printed by the manager: throw it away
+    stdout, sys.stdout = sys.stdout, NullWriter()
+    try:
+        for name in workloads or WORKLOADS:
+            workload = WORKLOADS[name](nodes, seed)
+            for driver in drivers or DRIVERS:
+                result = {"workload": name, "driver": driver}
+                result.update(time_workload(workload, DRIVERS[driver]))
+                if memory:
+                    result["peak_memory_bytes"] = peak_memory(workload, DRIVERS[driver])
+                results.append(result)
+    finally:
+        sys.stdout = stdout
+    return {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "nodes": nodes,
+        "seed": seed,
+        "results": results,
+    }
+
+
+def compare(report: dict, baseline: dict, tolerance: float) -> list:
+    """
+    Compares a report against a baseline report.
+
+    Args:
+        report (dict): The current results
+        baseline (dict): Results recorded earlier
+        tolerance (float): Allowed relative change (e.g. 0.1 for 10%)
+
+    Returns:
+        list: A description of every regression found
+    """
+    previous = {(result["workload"], result["driver"]): result for result in baseline["results"]}
+    regressions = []
+    for result in report["results"]:
+        key = (result["workload"], result["driver"])
+        before = previous.get(key)
+        if before is None:
+            continue
+        label = "/".join(key)
+        if result["ops_per_sec"] < before["ops_per_sec"] * (1 - tolerance):
+            regressions.append(f"{label}: {result['ops_per_sec']:.0f} ops/s, "
+                               f"baseline {before['ops_per_sec']:.0f} ops/s")
+        if "peak_memory_bytes" in result and "peak_memory_bytes" in before \
+                and result["peak_memory_bytes"] > before["peak_memory_bytes"] * (1 + tolerance):
+            regressions.append(f"{label}: peak memory {result['peak_memory_bytes']} bytes, "
+                               f"baseline {before['peak_memory_bytes']} bytes")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--nodes", type=int, default=100_000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workloads", nargs="+", choices=sorted(WORKLOADS))
+    parser.add_argument("--drivers", nargs="+", choices=sorted(DRIVERS))
+    parser.add_argument("--no-memory", dest="memory", action="store_false",
+                        help="skip the (slow) tracemalloc pass")
+    parser.add_argument("--output", help="write the JSON report to this file instead of stdout")
+    parser.add_argument("--baseline", help="JSON report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.1)
+    options = parser.parse_args(argv)
+
+    baseline = None
+    if options.baseline:
+        with open(options.baseline) as f:
+            baseline = json.load(f)
+        if (baseline["nodes"], baseline["seed"]) != (options.nodes, options.seed):
+            parser.error(f"the baseline was recorded with --nodes {baseline['nodes']} --seed {baseline['seed']}")
+
+    report = run_suite(options.nodes, options.seed, options.workloads, options.drivers, options.memory)
+    text = json.dumps(report, indent=2)
+    if options.output:
+        with open(options.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    if baseline is not None:
+        regressions = compare(report, baseline, options.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+Seeded synthetic workloads for the benchmark suite.
+
+A workload is a list of setup commands that build the starting tree and a
+list of measured commands run against it, each command being a
+(COMMAND, [arguments]) pair exactly as DirectoryManager.process takes it.
+Every generator keeps a model of the tree it is describing, so all the
+commands it emits are valid (no MOVE into a missing directory, no DELETE of
+something already gone), and the same seed always gives the same workload.
+"""
+import random
+from collections import namedtuple
+
+Workload = namedtuple("Workload", ["name", "setup", "operations"])
+
+
+def wide(nodes: int, seed: int = 0, parents: int = 10) -> Workload:
+    """
+    CREATEs spread over a few directories that end up with nodes / parents
+    children each.
+    """
+    rng = random.Random(seed)
+    setup = [("CREATE", [f"wide{i}"]) for i in range(parents)]
+    names = list(range(nodes))
+    rng.shuffle(names)
+    operations = [("CREATE", [f"wide{rng.randrange(parents)}/n{name}"]) for name in names]
+    return Workload("wide", setup, operations)
+
+
+def deep(nodes: int, seed: int = 0, depth: int = 200) -> Workload:
+    """
+    CREATEs that each extend a chain of directories by one level, starting a
+    new chain every depth levels, so paths get up to depth components long.
+    """
+    rng = random.Random(seed)
+    operations = []
+    path = ""
+    for index in range(nodes):
+        if index % depth == 0:
+            path = f"chain{index // depth}"
+        else:
+            path = f"{path}/d{rng.randrange(10)}"
+        operations.append(("CREATE", [path]))
+    return Workload("deep", [], operations)
+
+
+def _items(count: int, buckets: int) -> tuple:
+    """
+    Setup commands for count items spread round-robin over buckets, each item
+    with two subdirectories, and the bucket each item is in.
+    """
+    setup = [("CREATE", [f"bucket{i}" for i in range(buckets)])]
+    location = []
+    for item in range(count):
+        bucket = item % buckets
+        location.append(bucket)
+        setup.append(("CREATE", [f"bucket{bucket}/item{item}/src", f"bucket{bucket}/item{item}/docs"]))
+    return setup, location
+
+
+def move_heavy(nodes: int, seed: int = 0, buckets: int = 100) -> Workload:
+    """
+    MOVEs of small subtrees between buckets, over a tree of about nodes
+    directories.
+    """
+    rng = random.Random(seed)
+    count = max(nodes // 3, 1)
+    setup, location = _items(count, buckets)
+    operations = []
+    for _ in range(nodes):
+        item = rng.randrange(count)
+        source = location[item]
+        dest = (source + rng.randrange(1, buckets)) % buckets
+        operations.append(("MOVE", [f"bucket{source}/item{item}", f"bucket{dest}"]))
+        location[item] = dest
+    return Workload("move_heavy", setup, operations)
+
+
+def delete_heavy(nodes: int, seed: int = 0, buckets: int = 100) -> Workload:
+    """
+    DELETEs of small subtrees, with one in five operations re-creating an
+    item deleted earlier, over a tree of about nodes directories.
+    """
+    rng = random.Random(seed)
+    count = max(nodes // 3, 1)
+    setup, location = _items(count, buckets)
+    present = list(range(count))
+    rng.shuffle(present)
+    deleted = []
+    operations = []
+    while present:
+        if deleted and rng.random() < 0.2:
+            item = deleted.pop(rng.randrange(len(deleted)))
+            bucket = location[item]
+            operations.append(("CREATE", [f"bucket{bucket}/item{item}/src", f"bucket{bucket}/item{item}/docs"]))
+            present.append(item)
+        else:
+            item = present.pop()
+            operations.append(("DELETE", [f"bucket{location[item]}/item{item}"]))
+            deleted.append(item)
+    return Workload("delete_heavy", setup, operations)
+
+
+def list_heavy(nodes: int, seed: int = 0, buckets: int = 100) -> Workload:
+    """
+    LISTs of single buckets, with one in ten operations a CREATE that
+    invalidates a bucket's cached listing, over a tree of about nodes
+    directories.
+    """
+    rng = random.Random(seed)
+    count = max(nodes // 3, 1)
+    setup, _ = _items(count, buckets)
+    operations = []
+    for index in range(max(nodes // 100, 1)):
+        bucket = rng.randrange(buckets)
+        if rng.random() < 0.1:
+            operations.append(("CREATE", [f"bucket{bucket}/new{index}"]))
+        else:
+            operations.append(("LIST", [f"bucket{bucket}"]))
+    return Workload("list_heavy", setup, operations)
+
+
+# Workload name -> generator(nodes, seed)
+WORKLOADS = {
+    "wide": wide,
+    "deep": deep,
+    "move_heavy": move_heavy,
+    "delete_heavy": delete_heavy,
+    "list_heavy": list_heavy,
+}
@@ -0,0 +1,312 @@
+import threading
+from contextlib import contextmanager
+
+from directory_structure import DirectoryStructure
+from exceptions import TransactionError
+from filesystem import TRANSFER_WORKERS
+
+
+class ReadWriteLock:
+    """
+    A lock that admits any number of readers or a single writer. Waiting
+    writers take precedence over new readers, so a steady stream of LISTs
+    cannot starve writers.
+    """
+
+    def __init__(self):
+        self._mutex = threading.Lock()
+        self._condition = threading.Condition(self._mutex)
+        self._readers = 0
+        self._writer = False
+        self._waiting_writers = 0
+
+    def acquire_read(self) -> None:
+        with self._mutex:
+            while self._writer or self._waiting_writers:
+                self._condition.wait()
+            self._readers += 1
+
+    def release_read(self) -> None:
+        with self._mutex:
+            self._readers -= 1
+            if not self._readers and self._waiting_writers:
+                self._condition.notify_all()
+
+    def acquire_write(self) -> None:
+        with self._mutex:
+            self._waiting_writers += 1
+            while self._writer or self._readers:
+                self._condition.wait()
+            self._waiting_writers -= 1
+            self._writer = True
+
+    def release_write(self) -> None:
+        with self._mutex:
+            self._writer = False
+            self._condition.notify_all()
+
+    @contextmanager
+    def read_locked(self):
+        """
+        Holds the lock as a reader for the duration of the with block.
+        """
+        self.acquire_read()
+        try:
+            yield
+        finally:
+            self.release_read()
+
+    @contextmanager
+    def write_locked(self):
+        """
+        Holds the lock as the writer for the duration of the with block.
+        """
+        self.acquire_write()
+        try:
+            yield
+        finally:
+            self.release_write()
+
+
+class ConcurrentDirectoryStructure(DirectoryStructure):
+    """
+    A DirectoryStructure that can be shared between threads.
+
+    Locking is two-level. A tree lock guards the set of top-level
+    directories, and each top-level directory has its own reader-writer
+    lock for its subtree. Operations inside existing top-level directories
+    hold the tree lock as readers and lock only the subtrees they touch, so
+    CREATE/DELETE/MOVE in disjoint subtrees run side by side. Only
+    operations that add or remove top-level directories take the tree lock
+    exclusively. A MOVE locks its source and destination subtrees in name
+    order, so two opposing MOVEs cannot deadlock. LIST locks one top-level
+    subtree at a time as a reader, so a long listing only holds up writers
+    in the subtree it is currently printing.
+
+    Shared bookkeeping (the path cache, the name index and listener
+    notifications) is serialised by an internal mutex. FIND holds the whole
+    tree exclusively. Transactions are not supported: undoing one could
+    overwrite changes that other threads made in the meantime. Automatic
+    journal snapshots are not supported in this mode. Take them from a
+    maintenance thread with `with structure.exclusive(): journal.snapshot()`
+    instead. Listings are not cached, since the cache could not be shared by
+    the threads.
+    """
+    CACHE_LISTINGS = False
+
+    def __init__(self, path_cache_size: int = DirectoryStructure.PATH_CACHE_SIZE):
+        self._tree_lock = ReadWriteLock()
+        self._subtree_locks = {}
+        self._shared = threading.RLock()
+        super().__init__(path_cache_size)
+
+    def _subtree_lock(self, name: str) -> ReadWriteLock:
+        """
+        Returns the lock of a top-level directory, creating it on first use.
+        """
+        lock = self._subtree_locks.get(name)
+        if lock is None:
+            with self._shared:
+                lock = self._subtree_locks.setdefault(name, ReadWriteLock())
+        return lock
+
+    def _lock_for_writing(self, *paths) -> tuple:
+        """
+        Locks everything a mutation of the given paths can modify: the
+        subtrees of their top-level directories as writer, and the tree lock
+        as reader, or as writer if the mutation adds or removes a top-level
+        directory.
+
+        Returns:
+            tuple: The subtree locks taken and whether the tree lock is held as
+            writer, to be passed to _unlock
+        """
+        parts = [self._split(path) for path in paths]
+        tops = sorted({path_parts[0] for path_parts in parts})
+        structural = any(len(path_parts) <= 1 for path_parts in parts)
+        while True:
+            if structural:
+                self._tree_lock.acquire_write()
+                break
+            self._tree_lock.acquire_read()
+            if all(top in self.directory for top in tops):
+                break
+            # A top-level directory would have to be created: start over exclusively
+            self._tree_lock.release_read()
+            structural = True
+
+        locks = [self._subtree_lock(top) for top in tops]
+        for lock in locks:
+            lock.acquire_write()
+        return locks, structural
+
+    def _unlock(self, locks: list, structural: bool) -> None:
+        """
+        Releases the locks taken by _lock_for_writing.
+        """
+        for lock in reversed(locks):
+            lock.release_write()
+        if structural:
+            self._tree_lock.release_write()
+        else:
+            self._tree_lock.release_read()
+
+    @contextmanager
+    def exclusive(self):
+        """
+        Holds the whole tree exclusively for the duration of the with block
+        (apart from LISTs that already started reading a subtree).
+        """
+        with self._tree_lock.write_locked():
+            yield
+
+    def _cached(self, parts: tuple):
+        with self._shared:
+            return super()._cached(parts)
+
+    def _remember(self, parts: tuple, node) -> None:
+        with self._shared:
+            super()._remember(parts, node)
+
+    def _invalidate(self, parts: tuple) -> None:
+        with self._shared:
+            super()._invalidate(parts)
+
+    def _indexed(self, node) -> None:
+        with self._shared:
+            super()._indexed(node)
+
+    def _indexed_subtree(self, node) -> None:
+        with self._shared:
+            super()._indexed_subtree(node)
+
+    def _unindexed(self, node) -> None:
+        with self._shared:
+            super()._unindexed(node)
+
+    def _notify(self, operation: str, *paths) -> None:
+        with self._shared:
+            super()._notify(operation, *paths)
+
+    def begin(self) -> None:
+        raise TransactionError("Transactions are not supported on a shared tree")
+
+    def create_directory(self, path: str) -> None:
+        held = self._lock_for_writing(path)
+        try:
+            super().create_directory(path)
+        finally:
+            self._unlock(*held)
+
+    def create_many(self, paths) -> list:
+        with self.exclusive():
+            return super().create_many(paths)
+
+    def move_directory(self, source_path: str, dest_path: str) -> None:
+        held = self._lock_for_writing(source_path, dest_path)
+        try:
+            super().move_directory(source_path, dest_path)
+        finally:
+            self._unlock(*held)
+
+    def delete_directory(self, path: str) -> None:
+        held = self._lock_for_writing(path)
+        try:
+            super().delete_directory(path)
+        finally:
+            self._unlock(*held)
+
+    def graft(self, dest_path: str, node) -> None:
+        held = self._lock_for_writing(f"{dest_path}/{node.name}" if dest_path else node.name)
+        try:
+            super().graft(dest_path, node)
+        finally:
+            self._unlock(*held)
+
+    def add_tree(self, path: str, node) -> None:
+        held = self._lock_for_writing(path)
+        try:
+            super().add_tree(path, node)
+        finally:
+            self._unlock(*held)
+
+    def save(self, path: str) -> None:
+        with self.exclusive():
+            super().save(path)
+
+    def load(self, path: str) -> None:
+        with self.exclusive():
+            super().load(path)
+
+    def find_directories(self, pattern: str, path: str = None) -> list:
+        with self.exclusive():
+            return super().find_directories(pattern, path)
+
+    def stat_directory(self, path: str = None) -> tuple:
+        if not path:
+            with self._tree_lock.read_locked():
+                return super().stat_directory(path)
+        top = self._split(path)[0]
+        with self._tree_lock.read_locked():
+            with self._subtree_lock(top).read_locked():
+                return super().stat_directory(path)
+
+    def export_directory(self, path: str, os_path: str, workers: int = TRANSFER_WORKERS, progress=None) -> tuple:
+        """
+        Exports a directory to disk holding a read lock on its top-level
+        subtree, or the whole tree exclusively for the root. See
+        DirectoryStructure.export_directory.
+        """
+        if not path:
+            with self.exclusive():
+                return super().export_directory(path, os_path, workers, progress)
+        top = self._split(path)[0]
+        with self._tree_lock.read_locked():
+            with self._subtree_lock(top).read_locked():
+                return super().export_directory(path, os_path, workers, progress)
+
+    def iter_directory(self, path: str = None, max_depth: int = None):
+        """
+        Lazily yields the lines of a directory listing, holding a read lock
+        on one top-level subtree at a time.
+        """
+        if path:
+            top = self._split(path)[0]
+            with self._tree_lock.read_locked():
+                lock = self._subtree_lock(top)
+                lock.acquire_read()
+            try:
+                yield from super().iter_directory(path, max_depth)
+            finally:
+                lock.release_read()
+            return
+
+        with self._tree_lock.read_locked():
+            tops = self.directory.sorted_items()
+        for name, node in tops:
+            with self._subtree_lock(name).read_locked():
+                yield name
+                yield from self._iter_lines(node, max_depth, 1)
+
+    def iter_entries(self, path: str = None, max_depth: int = None):
+        """
+        Lazily yields the (depth, name) entries of a directory listing,
+        holding a read lock on one top-level subtree at a time.
+        """
+        if path:
+            top = self._split(path)[0]
+            with self._tree_lock.read_locked():
+                lock = self._subtree_lock(top)
+                lock.acquire_read()
+            try:
+                yield from super().iter_entries(path, max_depth)
+            finally:
+                lock.release_read()
+            return
+
+        with self._tree_lock.read_locked():
+            tops = self.directory.sorted_items()
+        for name, node in tops:
+            with self._subtree_lock(name).read_locked():
+                yield 0, name
+                yield from self._iter_entries(node, max_depth, 1)
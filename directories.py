@@ -1,12 +1,302 @@
+import argparse
+import io
+import os
+import sys
+import time
+from contextlib import redirect_stdout
+
 from directory_manager import DirectoryManager
+from directory_structure import DirectoryStructure
+from metrics import Metrics
+from persistence import Journal
+from persistent_structure import PersistentDirectoryStructure
+from profiling import PROFILE_ENV, Profiler
+from replication import ChangeFeed, ReplicaDirectoryStructure
+from server import serve
+from sharding import ShardedDirectoryStructure
+from spilling import SpillingDirectoryStructure
+
+# Size of the read and write buffers used in batch mode
+BATCH_BUFFER_SIZE = 1 << 20
+# Tree implementations selectable with --engine
+ENGINES = {
+    "mutable": DirectoryStructure,
+    "persistent": PersistentDirectoryStructure,
+    "sharded": ShardedDirectoryStructure,
+}
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    """
+    Parses the command-line options.
+
+    Args:
+        argv (list, optional): Arguments to parse. Defaults to sys.argv[1:].
+
+    Returns:
+        argparse.Namespace: The parsed options
+    """
+    parser = argparse.ArgumentParser(description="Directory management system")
+    parser.add_argument(
+        "--batch",
+        metavar="FILE",
+        help="replay commands from FILE ('-' for stdin) without prompting",
+    )
+    parser.add_argument(
+        "--engine",
+        choices=sorted(ENGINES),
+        default="mutable",
+        help="tree implementation: 'persistent' gives LISTs a snapshot that concurrent writes "
+             "never change, at a higher cost per write; 'sharded' splits the tree by top-level "
+             "directory over worker processes (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--shards",
+        type=int,
+        metavar="N",
+        help="with --engine sharded, the number of worker processes (default: number of CPUs)",
+    )
+    parser.add_argument(
+        "--memory-budget",
+        type=int,
+        metavar="N",
+        help="with --engine mutable, keep at most N directories in memory, spilling the least "
+             "recently used subtrees to disk (shown by the MEMORY command)",
+    )
+    parser.add_argument(
+        "--spill-dir",
+        metavar="DIR",
+        help="with --memory-budget, where to create the spill file (default: the temporary directory)",
+    )
+    parser.add_argument(
+        "--port",
+        type=int,
+        help="serve commands over TCP on PORT instead of reading them from the terminal",
+    )
+    parser.add_argument(
+        "--host",
+        default="127.0.0.1",
+        help="with --port, the address to listen on (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--unix",
+        metavar="PATH",
+        help="serve commands over a Unix socket at PATH",
+    )
+    parser.add_argument(
+        "--data-dir",
+        metavar="DIR",
+        help="persist the tree in DIR (snapshot + mutation log) and restore it on startup",
+    )
+    parser.add_argument(
+        "--fsync-every",
+        type=int,
+        default=1,
+        metavar="N",
+        help="with --data-dir, fsync the log after every N mutations (0: only on interval/exit)",
+    )
+    parser.add_argument(
+        "--fsync-interval",
+        type=float,
+        metavar="SECONDS",
+        help="with --data-dir, also fsync the log when SECONDS have passed since the last sync",
+    )
+    parser.add_argument(
+        "--snapshot-every",
+        type=int,
+        default=100_000,
+        metavar="N",
+        help="with --data-dir, write a compacted snapshot every N mutations (0: never)",
+    )
+    parser.add_argument(
+        "--feed",
+        metavar="PATH",
+        help="publish every change to the tree on a Unix socket at PATH, for replicas to follow",
+    )
+    parser.add_argument(
+        "--replica-of",
+        metavar="PATH",
+        help="run as a read-only replica of the primary publishing its --feed at PATH",
+    )
+    parser.add_argument(
+        "--metrics",
+        action="store_true",
+        help="record per-command counts, errors and latencies (shown by the METRICS command)",
+    )
+    parser.add_argument(
+        "--metrics-file",
+        metavar="FILE",
+        help="record metrics and write them to FILE in the Prometheus text format (implies --metrics)",
+    )
+    parser.add_argument(
+        "--metrics-interval",
+        type=float,
+        default=10.0,
+        metavar="SECONDS",
+        help="with --metrics-file, rewrite FILE every SECONDS (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        default=bool(os.environ.get(PROFILE_ENV)),
+        help=f"profile every command with cProfile and print the top functions on exit or on "
+             f"PROFILE DUMP (also enabled by setting {PROFILE_ENV})",
+    )
+    parser.add_argument(
+        "--profile-allocations",
+        action="store_true",
+        help="with --profile, also trace allocations with tracemalloc (slow)",
+    )
+    parser.add_argument(
+        "--profile-top",
+        type=int,
+        default=25,
+        metavar="N",
+        help="number of functions and allocation sites in a profile report (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--slow-log",
+        metavar="FILE",
+        help="append every command slower than --slow-threshold to FILE",
+    )
+    parser.add_argument(
+        "--slow-threshold",
+        type=float,
+        default=100.0,
+        metavar="MS",
+        help="with --slow-log, the latency in milliseconds above which a command is logged "
+             "(default: %(default)s)",
+    )
+    options = parser.parse_args(argv)
+    if options.replica_of is not None and options.data_dir is not None:
+        parser.error("--replica-of cannot be combined with --data-dir")
+    if options.memory_budget is not None and (options.engine != "mutable" or options.replica_of is not None):
+        parser.error("--memory-budget only works with --engine mutable")
+    return options
+
 
-def main():
+def run_batch(manager: DirectoryManager, lines, output, report=sys.stderr) -> int:
+    """
+    Streams commands through the manager, sending all command output to a
+    (buffered) writer instead of the terminal, and reports the throughput.
+
+    Args:
+        manager (DirectoryManager): The manager that processes the commands
+        lines (iterable): Raw command lines
+        output (io.TextIOBase): Stream that receives the command output
+        report (io.TextIOBase, optional): Stream that receives the throughput
+            summary. Pass None to disable it. Defaults to sys.stderr.
+
+    Returns:
+        int: The number of commands processed
+    """
+    start = time.perf_counter()
+    with redirect_stdout(output):
+        count = manager.run_batch(lines)
+    output.flush()
+    elapsed = time.perf_counter() - start
+    if report is not None:
+        rate = count / elapsed if elapsed > 0 else float("inf")
+        print(f"Processed {count} commands in {elapsed:.3f}s ({rate:.0f} commands/s)", file=report)
+    return count
+
+
+def open_batch_output(stream) -> io.TextIOBase:
+    """
+    Opens a large-buffer text writer over the file descriptor of a stream,
+    so that output is flushed in big blocks instead of once per line.
+
+    Args:
+        stream (io.TextIOBase): The stream to write to (usually sys.stdout)
+
+    Returns:
+        io.TextIOBase: The buffered writer
+    """
+    stream.flush()
+    return open(stream.fileno(), "w", buffering=BATCH_BUFFER_SIZE,
+                encoding=stream.encoding, closefd=False)
+
+
+def main(argv=None):
     """
     Entry point for the program. Creates a DirectoryManager instance
-    and starts the command processing loop.
+    (restoring its tree when --data-dir is given) and starts the command
+    processing loop, replays a command file when --batch is given, or
+    serves clients when --port or --unix is given.
     """
-    manager = DirectoryManager()
-    manager.run()
+    options = parse_args(argv)
+    if options.replica_of is not None:
+        structure = ReplicaDirectoryStructure.connect(options.replica_of)
+        # Serve nothing until the copy has caught up once
+        structure.wait()
+    elif options.engine == "sharded":
+        structure = ShardedDirectoryStructure(options.shards)
+    elif options.memory_budget is not None:
+        structure = SpillingDirectoryStructure(options.memory_budget, options.spill_dir)
+    else:
+        structure = ENGINES[options.engine]()
+    journal = None
+    if options.data_dir is not None:
+        journal = Journal(options.data_dir, options.fsync_every, options.fsync_interval,
+                          options.snapshot_every)
+        journal.open(structure)
+
+    feed = None
+    if options.feed is not None:
+        feed = ChangeFeed()
+        feed.attach(structure)
+        feed.listen(options.feed)
+
+    metrics = None
+    if options.metrics or options.metrics_file is not None:
+        metrics = Metrics(options.metrics_file, options.metrics_interval)
+
+    profiler = None
+    slow_log = None
+    if options.profile or options.slow_log is not None:
+        if options.slow_log is not None:
+            slow_log = open(options.slow_log, "a")
+        profiler = Profiler(options.profile, options.profile and options.profile_allocations,
+                            options.profile_top, slow_log, options.slow_threshold / 1000)
+
+    manager = DirectoryManager(structure, metrics, profiler)
+    if metrics is not None:
+        metrics.start(manager.node_count)
+    try:
+        if options.port is not None or options.unix is not None:
+            serve(manager, options.host, options.port, options.unix)
+            return
+
+        if options.batch is None:
+            manager.run()
+            return
+
+        output = open_batch_output(sys.stdout)
+        try:
+            if options.batch == "-":
+                run_batch(manager, sys.stdin, output)
+            else:
+                with open(options.batch, "r", buffering=BATCH_BUFFER_SIZE) as source:
+                    run_batch(manager, source, output)
+        finally:
+            output.close()
+    finally:
+        if metrics is not None:
+            metrics.close()
+        manager.write_metrics()
+        if profiler is not None:
+            if options.profile:
+                for line in profiler.iter_report():
+                    print(line, file=sys.stderr)
+            profiler.close()
+        if slow_log is not None:
+            slow_log.close()
+        if feed is not None:
+            feed.close()
+        if journal is not None:
+            journal.close()
+        if hasattr(structure, "close"):
+            structure.close()
 
 
 if __name__ == "__main__":
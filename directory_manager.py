@@ -1,22 +1,88 @@
+import re
+import sys
+import time
+
 from directory_structure import DirectoryStructure
-from exceptions import EmptyStatementError
+from exceptions import DirectoryAlreadyExistsError, DirectoryNotFoundError, EmptyStatementError, \
+    InvalidArgumentError, InvalidPathError
+from filesystem import scan_tree
+from listing import LIST_FORMATS
+from metrics import Metrics
+from profiling import Profiler
+from paths import parse_path
+
+# Runs of two or more slashes, collapsed by normalize_path
+_REPEATED_SLASHES = re.compile(r'/{2,}')
 
 
 class DirectoryManager:
-    def __init__(self):
+    # Options accepted by LIST, mapped to the print_directory argument they set
+    # and the smallest value they accept (or the values they accept)
+    LIST_OPTIONS = {
+        "--depth": ("max_depth", 1),
+        "--offset": ("offset", 0),
+        "--limit": ("limit", 0),
+        "--format": ("list_format", LIST_FORMATS),
+    }
+
+    # Commands still accepted after an error rolled back the open transaction
+    TRANSACTION_END = ("COMMIT", "ROLLBACK", "EXIT")
+
+    # Commands run_batch hands to a sharded structure without waiting for
+    # them, mapped to the structure method they run
+    PIPELINED = {
+        "CREATE": "create_directory",
+        "DELETE": "delete_directory",
+        "MOVE": "move_directory",
+    }
+    # Number of pipelined commands sent to the shards before their results are collected
+    PIPELINE_WINDOW = 1024
+
+    def __init__(self, structure: DirectoryStructure = None, metrics: Metrics = None,
+                 profiler: Profiler = None):
         """
         Initializes the DirectoryManager with a DirectoryStructure instance
         and a command map for user commands.
+
+        Args:
+            structure (DirectoryStructure, optional): The structure to operate on,
+                e.g. one restored from disk. Defaults to a new, empty structure.
+            metrics (Metrics, optional): Where to record per-command counts, errors
+                and latencies. Defaults to None (nothing is recorded).
+            profiler (Profiler, optional): Profiler to run around every command.
+                Defaults to None (no profiling).
         """
-        self.structure = DirectoryStructure()
+        self.structure = DirectoryStructure() if structure is None else structure
+        self.metrics = metrics
+        self.profiler = profiler
         self.command_map = {
-            "CREATE": self.structure.create_directory,
+            "CREATE": self.create_directories,
             "MOVE": self.structure.move_directory,
             "DELETE": self.structure.delete_directory,
-            "LIST": self.structure.print_directory,
+            "LIST": self.list_directory,
+            "COUNT": self.count_directory,
+            "STATS": self.print_stats,
+            "FIND": self.find_directories,
+            "BEGIN": self.begin_transaction,
+            "COMMIT": self.commit_transaction,
+            "ROLLBACK": self.rollback_transaction,
+            "METRICS": self.print_metrics,
+            "LAG": self.print_lag,
+            "MEMORY": self.print_memory,
+            "PROFILE": self.profile,
+            "IMPORT": self.import_tree,
+            "EXPORT": self.export_tree,
+            "SAVE": self.structure.save,
+            "LOAD": self.structure.load,
             "HELP": self.print_help,
             "EXIT": self.exit_program,
         }
+        # Set when an error rolled back a transaction, until its COMMIT or ROLLBACK
+        self._rolled_back = False
+        # Name of the error type the command being processed failed with
+        self._error = None
+        # Pipelined commands not collected yet, as (command, submit time) pairs
+        self._in_flight = []
 
     def print_help(self, command: str = None) -> None:
         """
@@ -26,7 +92,8 @@ class DirectoryManager:
         Args:
             command (str, optional): The command to get help for. If provided, shows help
             for that specific command only. Must be one of: CREATE, DELETE, MOVE,
-            LIST, HELP, or EXIT. Defaults to None.
+            LIST, COUNT, STATS, FIND, BEGIN, COMMIT, ROLLBACK, METRICS, LAG, MEMORY,
+            PROFILE, IMPORT, EXPORT, SAVE, LOAD, HELP, or EXIT. Defaults to None.
         """
         if command:
             command = command.upper()
@@ -42,6 +109,344 @@ class DirectoryManager:
             for command, function in self.command_map.items():
                 print(f"{command}: {self.command_map[command].__doc__}")
 
+    def create_directories(self, *paths) -> None:
+        """
+        Creates a new directory at each of the specified paths.
+        If intermediate directories don't exist, they will be created.
+        Usage: CREATE <path> [<path> ...]
+
+        Args:
+            paths (str): Paths where directories should be created (e.g., 'root/folder1/folder2').
+                Several paths are created in one pass that shares their common prefixes;
+                an error for one path is printed and does not stop the others.
+        """
+        if len(paths) == 1:
+            self.structure.create_directory(paths[0])
+            return
+        failed = False
+        for error in self.structure.create_many(paths):
+            if error is not None:
+                print(str(error))
+                self._error = type(error).__name__
+                failed = True
+        if failed:
+            self._abort_transaction()
+
+    def list_directory(self, *args) -> None:
+        """
+        Lists the directory structure, or only the contents of the given path.
+        Usage: LIST [path] [--depth N] [--offset N] [--limit N] [--format text|paths|ndjson|json]
+
+        Args:
+            path (str, optional): Directory to list. Defaults to the whole tree.
+            --depth N: Only list N levels below the listed directory.
+            --offset N: Skip the first N lines of the listing.
+            --limit N: Print at most N lines.
+            --format F: text (indented names, the default), paths (one full path
+                per line), ndjson (one JSON object per line) or json (one nested
+                JSON document, which cannot be combined with --offset or --limit).
+        """
+        path, options = self._parse_list_args(args)
+        self.structure.print_directory(path, **options)
+
+    def find_directories(self, pattern: str, *args) -> None:
+        """
+        Prints the full path of every directory whose name matches a pattern,
+        looked up in the name index instead of walking the tree.
+        Usage: FIND <pattern> [under <path>]
+
+        Args:
+            pattern (str): A directory name, or a glob pattern ('*' matches any text,
+                '?' any one character), e.g. 'src*'
+            under <path> (optional): Only find directories below this path.
+        """
+        path = None
+        if args:
+            if args[0].lower() != "under":
+                raise InvalidArgumentError(args[0], "Unexpected argument")
+            path = self._parse_path_arg(args[1])
+        found = self.structure.find_directories(pattern, path)
+        if found:
+            print("\n".join(found))
+
+    @staticmethod
+    def _parse_path_arg(path: str) -> str:
+        """
+        Parses a tree path argument of a command that also takes other arguments.
+
+        Raises:
+            InvalidPathError: If the path is invalid
+        """
+        parsed = parse_path(path)
+        if parsed is None:
+            raise InvalidPathError(f"Invalid path: {path}")
+        return parsed
+
+    @staticmethod
+    def _report_progress(action: str):
+        """
+        Returns a progress callback for IMPORT and EXPORT that reports to stderr.
+        """
+        def report(count: int, seconds: float) -> None:
+            print(f"{action} {count} directories so far ({count / seconds:.0f} directories/s)",
+                  file=sys.stderr)
+        return report
+
+    @staticmethod
+    def _print_transfer(action: str, count: int, skipped: int, seconds: float) -> None:
+        """
+        Prints the outcome and throughput of an IMPORT or EXPORT.
+        """
+        rate = count / seconds if seconds > 0 else float("inf")
+        note = f", skipped {skipped}" if skipped else ""
+        print(f"{action} {count} directories in {seconds:.3f}s ({rate:.0f} directories/s){note}")
+
+    def import_tree(self, os_path: str, path: str) -> None:
+        """
+        Copies a directory hierarchy from disk into the tree as a new directory.
+        The directories on disk are listed in parallel and added in one step.
+        Usage: IMPORT <os_path> <path>
+
+        Args:
+            os_path (str): The directory on disk (symbolic links are not followed)
+            path (str): Path of the new directory in the tree, which stands for os_path
+        """
+        path = self._parse_path_arg(path)
+        # Fail before walking what may be a very large hierarchy
+        try:
+            self.structure.stat_directory(path)
+        except DirectoryNotFoundError:
+            pass
+        else:
+            raise DirectoryAlreadyExistsError(path)
+        start = time.perf_counter()
+        root, count, skipped = scan_tree(os_path, progress=self._report_progress("Imported"))
+        self.structure.add_tree(path, root)
+        self._print_transfer("Imported", count, skipped, time.perf_counter() - start)
+
+    def export_tree(self, path: str, os_path: str) -> None:
+        """
+        Creates the directories below a directory of the tree on disk, below
+        os_path (created if needed). Each level is created in parallel;
+        directories that already exist are kept.
+        Usage: EXPORT <path> <os_path>
+
+        Args:
+            path (str): The directory of the tree to export
+            os_path (str): The directory on disk that stands for it
+        """
+        path = self._parse_path_arg(path)
+        start = time.perf_counter()
+        count, skipped = self.structure.export_directory(path, os_path, progress=self._report_progress("Exported"))
+        self._print_transfer("Exported", count, skipped, time.perf_counter() - start)
+
+    def count_directory(self, path: str = None) -> None:
+        """
+        Prints the number of directories below a directory, without walking it.
+        Usage: COUNT [path]
+
+        Args:
+            path (str, optional): The directory. Defaults to the whole tree.
+        """
+        descendants, _ = self.structure.stat_directory(path)
+        print(descendants)
+
+    def print_stats(self, path: str = None) -> None:
+        """
+        Prints the number of directories below a directory and how many
+        levels deep it goes, without walking it.
+        Usage: STATS [path]
+
+        Args:
+            path (str, optional): The directory. Defaults to the whole tree.
+        """
+        descendants, height = self.structure.stat_directory(path)
+        print(f"descendants: {descendants}, depth: {height}")
+
+    def node_count(self) -> int:
+        """
+        Returns the number of directories in the tree (read from the root's
+        counters, not counted).
+        """
+        return self.structure.stat_directory()[0]
+
+    def print_metrics(self) -> None:
+        """
+        Prints the number of directories and, for each command processed so
+        far, how often it ran, its average and 99th percentile latency and
+        the errors it failed with.
+        Usage: METRICS
+        """
+        if self.metrics is None:
+            print("Metrics are not enabled")
+            return
+        for line in self.metrics.iter_summary(self.node_count()):
+            print(line)
+
+    def print_lag(self) -> None:
+        """
+        Prints how far this read-only replica is behind its primary: the
+        number of changes not applied yet and for how long it has been behind.
+        Usage: LAG
+        """
+        if not hasattr(self.structure, "lag"):
+            print("Not a replica")
+            return
+        events, seconds = self.structure.lag()
+        state = "" if self.structure.connected else " (disconnected)"
+        print(f"lag: {events} events, {seconds:.3f}s{state}")
+
+    def print_memory(self) -> None:
+        """
+        Prints how the memory budget is kept: the directories in memory and
+        on disk, how often commands found the subtree they reached in memory,
+        and how many subtrees were spilled and paged back in (and how long
+        paging in took).
+        Usage: MEMORY
+        """
+        if not hasattr(self.structure, "memory_stats"):
+            print("No memory budget")
+            return
+        stats = self.structure.memory_stats()
+        reached = stats["hits"] + stats["misses"]
+        rate = stats["hits"] / reached if reached else 1.0
+        average = stats["page_in_seconds"] / stats["page_ins"] if stats["page_ins"] else 0.0
+        print(f"resident: {stats['resident']} of {stats['directories']} directories (budget {stats['budget']})")
+        print(f"spilled: {stats['spilled_units']} subtrees, {stats['spill_bytes']} bytes")
+        print(f"hit rate: {rate:.1%} ({stats['hits']} hits, {stats['misses']} misses)")
+        print(f"evictions: {stats['evictions']}, page-ins: {stats['page_ins']} "
+              f"(avg {average * 1e6:.1f} us, max {stats['page_in_max'] * 1e6:.1f} us)")
+
+    def profile(self, action: str) -> None:
+        """
+        Prints the profiling report so far: the functions that took the most
+        time and, when allocations are traced, where the most memory was
+        allocated.
+        Usage: PROFILE DUMP
+
+        Args:
+            action (str): DUMP
+        """
+        if action.upper() != "DUMP":
+            raise InvalidArgumentError(action, "Unknown PROFILE action")
+        if self.profiler is None:
+            print("Profiling is not enabled")
+            return
+        # Leave the report itself out of the profile
+        self.profiler.disable()
+        for line in self.profiler.iter_report():
+            print(line)
+
+    def write_metrics(self) -> None:
+        """
+        Writes the metrics file now, if one is configured.
+        """
+        if self.metrics is not None and self.metrics.path is not None:
+            self.metrics.write(self.node_count())
+
+    @classmethod
+    def _parse_list_args(cls, args) -> tuple:
+        """
+        Parses the arguments of a LIST command.
+
+        Args:
+            args (list): The arguments to parse
+
+        Returns:
+            tuple: The normalized path (or None) and the print_directory keyword arguments
+
+        Raises:
+            InvalidPathError: If the path is invalid
+            InvalidArgumentError: If an option is unknown, repeated or has an invalid value
+        """
+        path = None
+        options = {}
+        args = iter(args)
+        for arg in args:
+            if not arg.startswith("--"):
+                if path is not None:
+                    raise InvalidArgumentError(arg, "Unexpected argument")
+                path = parse_path(arg)
+                if path is None:
+                    raise InvalidPathError(f"Invalid path: {arg}")
+                continue
+
+            if arg not in cls.LIST_OPTIONS:
+                raise InvalidArgumentError(arg, "Unknown option")
+            keyword, accepted = cls.LIST_OPTIONS[arg]
+            if keyword in options:
+                raise InvalidArgumentError(arg, "Repeated option")
+            value = next(args, None)
+            if isinstance(accepted, tuple):
+                if value is None or value.lower() not in accepted:
+                    raise InvalidArgumentError(f"{arg} {value or ''}".strip(), "Invalid option value")
+                options[keyword] = value.lower()
+                continue
+            if value is None or not value.isdecimal() or int(value) < accepted:
+                raise InvalidArgumentError(f"{arg} {value or ''}".strip(), "Invalid option value")
+            options[keyword] = int(value)
+        if options.get("list_format") == "json" and ("offset" in options or "limit" in options):
+            raise InvalidArgumentError("--format json", "Not supported with --offset or --limit")
+        return path, options
+
+    @property
+    def in_transaction(self) -> bool:
+        """
+        True from BEGIN until the matching COMMIT or ROLLBACK, even if an
+        error already rolled the transaction back.
+        """
+        return self._rolled_back or self.structure.in_transaction
+
+    def begin_transaction(self) -> None:
+        """
+        Starts a transaction: the following commands are applied all or nothing.
+        Usage: BEGIN
+
+        The first command that fails rolls back every change made since BEGIN,
+        and the remaining commands up to COMMIT or ROLLBACK are ignored.
+        Leaving the program with a transaction open also rolls it back.
+        """
+        self.structure.begin()
+
+    def commit_transaction(self) -> None:
+        """
+        Keeps the changes made since BEGIN (and logs them as one batch with --data-dir).
+        Usage: COMMIT
+        """
+        if self._rolled_back:
+            self._rolled_back = False
+            print("Transaction was rolled back, nothing committed")
+            return
+        self.structure.commit()
+
+    def rollback_transaction(self) -> None:
+        """
+        Undoes every change made since BEGIN.
+        Usage: ROLLBACK
+        """
+        if self._rolled_back:
+            self._rolled_back = False
+            return
+        self.structure.rollback()
+
+    def _abort_transaction(self) -> None:
+        """
+        Rolls back the open transaction, if any, after a command failed.
+        """
+        if self.structure.in_transaction:
+            self.structure.rollback()
+            self._rolled_back = True
+            print("Transaction rolled back")
+
+    def close_transaction(self) -> None:
+        """
+        Rolls back a transaction left open when the session ends.
+        """
+        self._rolled_back = False
+        if self.structure.in_transaction:
+            self.structure.rollback()
+            print("Transaction rolled back")
+
     def exit_program(self) -> None:
         """
         Terminates the program execution by raising an EOFError.
@@ -65,10 +470,24 @@ class DirectoryManager:
             bool: True if arguments are valid, False otherwise
         """
         command_args = {
-            'CREATE': [1],
+            'CREATE': range(1, sys.maxsize),
             'DELETE': [1],
             'MOVE': [2],
-            'LIST': [0],
+            'LIST': range(10),
+            'COUNT': [0, 1],
+            'STATS': [0, 1],
+            'FIND': [1, 3],
+            'BEGIN': [0],
+            'COMMIT': [0],
+            'ROLLBACK': [0],
+            'METRICS': [0],
+            'LAG': [0],
+            'MEMORY': [0],
+            'PROFILE': [1],
+            'IMPORT': [2],
+            'EXPORT': [2],
+            'SAVE': [1],
+            'LOAD': [1],
             'HELP': [0, 1],
             'EXIT': [0]
         }
@@ -86,13 +505,12 @@ class DirectoryManager:
         Returns:
             str: The normalized path
         """
-        import re
         path = path.strip()
         if path.startswith('/'):
             path = path[1:]
         if path.endswith('/'):
             path = path[:-1]
-        return re.sub(r'/{2,}', '/', path)
+        return _REPEATED_SLASHES.sub('/', path)
 
     @staticmethod
     def _validate_path(path: str) -> bool:
@@ -105,18 +523,7 @@ class DirectoryManager:
         Returns:
             bool: True if path is valid, False otherwise
         """
-        if not path:
-            return False
-
-        # Check for invalid characters
-        invalid_chars = set('<>:"|?*')
-        if any(char in path for char in invalid_chars):
-            return False
-
-        # Check path components
-        path = DirectoryManager.normalize_path(path)
-        parts = path.split('/')
-        return all(part and not part.isspace() for part in parts)
+        return parse_path(path) is not None
 
     @staticmethod
     def _get_command_usage(command: str) -> str:
@@ -130,10 +537,24 @@ class DirectoryManager:
             str: Usage string for the command
         """
         usage = {
-            'CREATE': 'CREATE <path>',
+            'CREATE': 'CREATE <path> [<path> ...]',
             'DELETE': 'DELETE <path>',
             'MOVE': 'MOVE <source_path> <destination_path>',
-            'LIST': 'LIST',
+            'LIST': 'LIST [path] [--depth N] [--offset N] [--limit N] [--format text|paths|ndjson|json]',
+            'COUNT': 'COUNT [path]',
+            'STATS': 'STATS [path]',
+            'FIND': 'FIND <pattern> [under <path>]',
+            'BEGIN': 'BEGIN',
+            'COMMIT': 'COMMIT',
+            'ROLLBACK': 'ROLLBACK',
+            'METRICS': 'METRICS',
+            'LAG': 'LAG',
+            'MEMORY': 'MEMORY',
+            'PROFILE': 'PROFILE DUMP',
+            'IMPORT': 'IMPORT <os_path> <path>',
+            'EXPORT': 'EXPORT <path> <os_path>',
+            'SAVE': 'SAVE <file>',
+            'LOAD': 'LOAD <file>',
             'HELP': 'HELP [command]',
             'EXIT': 'EXIT'
         }
@@ -164,7 +585,41 @@ class DirectoryManager:
 
     def process(self, command: str, args: list) -> None:
         """
-        Processes user commands with input validation and error handling.
+        Processes user commands with input validation and error handling,
+        recording the outcome and latency of each one when metrics are enabled
+        and profiling it when a profiler is set.
+
+        Args:
+            command (str): The command to process
+            args (list): Arguments for the command
+        """
+        metrics = self.metrics
+        profiler = self.profiler
+        if metrics is None and profiler is None:
+            self._process(command, args)
+            return
+
+        self._error = None
+        if profiler is not None:
+            profiler.enable()
+        start = time.perf_counter()
+        try:
+            self._process(command, args)
+        finally:
+            elapsed = time.perf_counter() - start
+            if profiler is not None:
+                profiler.disable()
+                profiler.command_done(command, args, elapsed)
+            if metrics is not None:
+                command = command.upper()
+                # Unknown names are not recorded one by one, so that typos cannot
+                # create an unbounded number of series
+                metrics.record(command if command in self.command_map else "UNKNOWN", elapsed, self._error)
+
+    def _process(self, command: str, args: list) -> None:
+        """
+        Validates and runs one command, printing any error, and sets _error
+        to the name of the error type if it failed.
 
         Args:
             command (str): The command to process
@@ -172,23 +627,38 @@ class DirectoryManager:
         """
         try:
             command = command.upper()
+            if self._rolled_back and command not in self.TRANSACTION_END:
+                print(f"Ignored, the transaction was rolled back: {command}")
+                return
+
             if command not in self.command_map:
                 print(f"Unknown command: {command}")
                 print("Use HELP to see available commands")
+                self._error = "UnknownCommand"
+                self._abort_transaction()
                 return
 
             # Validate argument count
             if not self._validate_command_args(command, args):
                 print(f"Invalid number of arguments for {command}")
                 print(f"Usage: {self._get_command_usage(command)}")
+                self._error = InvalidArgumentError.__name__
+                self._abort_transaction()
                 return
 
-            # Validate paths for commands that require them
-            if command in ['CREATE', 'DELETE', 'MOVE']:
+            # Validate paths for commands that require them, parsing each one
+            # into its components exactly once
+            if command in ('CREATE', 'DELETE', 'MOVE', 'COUNT', 'STATS'):
+                parsed = []
                 for path in args:
-                    if not self._validate_path(path):
+                    parsed_path = parse_path(path)
+                    if parsed_path is None:
                         print(f"Invalid path: {path}")
+                        self._error = InvalidPathError.__name__
+                        self._abort_transaction()
                         return
+                    parsed.append(parsed_path)
+                args = parsed
 
             # Execute command
             command_function = self.command_map[command]
@@ -197,6 +667,101 @@ class DirectoryManager:
             raise
         except Exception as e:
             print(str(e))
+            self._error = type(e).__name__
+            self._abort_transaction()
+
+    @staticmethod
+    def iter_statements(lines):
+        """
+        Lazily turns raw input lines into parsed statements.
+        Blank lines are skipped.
+
+        Args:
+            lines (iterable): Raw command lines (e.g., an open file or sys.stdin)
+
+        Yields:
+            tuple: A tuple containing the command and its arguments
+        """
+        for line in lines:
+            statement = line.strip()
+            if statement:
+                yield DirectoryManager.parse_statement(statement)
+
+    def run_batch(self, lines) -> int:
+        """
+        Processes every command from an iterable of lines without prompting.
+        Produces exactly the same output as the interactive loop, including
+        the final "Exiting..." once the input is exhausted or EXIT is reached.
+
+        Args:
+            lines (iterable): Raw command lines (e.g., an open file or sys.stdin)
+
+        Returns:
+            int: The number of commands processed
+
+        On a sharded structure (one with submit()), CREATE, DELETE and MOVE
+        commands whose paths all belong to one shard are sent to their shard
+        without waiting, so the shards work in parallel; their output is
+        printed, in order, before the next command that has to wait.
+        """
+        count = 0
+        pipeline = hasattr(self.structure, "submit") and self.profiler is None
+        try:
+            for command, args in self.iter_statements(lines):
+                count += 1
+                if not (pipeline and self._submit(command, args)):
+                    self.process(command, args)
+        except (EOFError, KeyboardInterrupt):
+            pass
+        self._collect()
+        self.close_transaction()
+        print("Exiting...")
+        return count
+
+    def _submit(self, command: str, args: list) -> bool:
+        """
+        Sends a command to the shard that owns its paths without waiting for
+        it, if it can be pipelined. Otherwise waits for the commands sent so
+        far, so that the command can be processed as usual.
+
+        Args:
+            command (str): The command
+            args (list): Its arguments
+
+        Returns:
+            bool: True if the command was sent
+        """
+        operation = self.PIPELINED.get(command.upper())
+        if operation is not None and not self._rolled_back and \
+                len(args) == (2 if operation == "move_directory" else 1):
+            paths = [parse_path(path) for path in args]
+            if None not in paths and self.structure.same_shard(*paths):
+                self.structure.submit(operation, *paths)
+                self._in_flight.append((command.upper(), time.perf_counter()))
+                if len(self._in_flight) >= self.PIPELINE_WINDOW:
+                    self._collect()
+                return True
+        self._collect()
+        return False
+
+    def _collect(self) -> None:
+        """
+        Waits for the pipelined commands, printing their errors in order and
+        recording their outcome when metrics are enabled (latency counts from
+        when the command was sent).
+        """
+        if not self._in_flight:
+            return
+        in_flight = self._in_flight
+        self._in_flight = []
+        errors = self.structure.collect()
+        end = time.perf_counter()
+        metrics = self.metrics
+        for (command, start), error in zip(in_flight, errors):
+            if error is not None:
+                print(str(error))
+            if metrics is not None:
+                metrics.record(command, end - start, None if error is None else type(error).__name__)
 
     def run(self) -> None:
         """
@@ -209,5 +774,6 @@ class DirectoryManager:
                 command, args = self.parse_statement(statement)
                 self.process(command, args)
             except (EOFError, KeyboardInterrupt):
+                self.close_transaction()
                 print("Exiting...")
                 break
@@ -1,13 +1,199 @@
+import sys
+from bisect import bisect_left, insort
+from collections import OrderedDict
+from itertools import islice
+
 from exceptions import InvalidPathError, DirectoryNotFoundError, CannotMoveDirectoryError, RootDirectoryError, \
-    CannotDeleteDirectoryError, DirectoryAlreadyExistsError
+    CannotDeleteDirectoryError, DirectoryAlreadyExistsError, TransactionError
+from filesystem import TRANSFER_WORKERS, export_tree
+from listing import iter_listing
+from listing_cache import ListingCache
+from name_index import NameIndex
+from node import Node
+from paths import ParsedPath
+from tree_image import load_image, write_image
 
 
 class DirectoryStructure:
-    def __init__(self):
+    # Default number of resolved directory paths kept in the lookup cache
+    PATH_CACHE_SIZE = 4096
+    # Number of LIST lines written to the output stream at a time
+    LIST_CHUNK_LINES = 1024
+    # Whether full text listings are kept in a ListingCache between LISTs
+    CACHE_LISTINGS = True
+
+    def __init__(self, path_cache_size: int = PATH_CACHE_SIZE):
+        """
+        Initializes the directory structure as a tree of Node objects,
+        rooted at an unnamed node.
+
+        Args:
+            path_cache_size (int, optional): Number of resolved paths kept in the
+                path -> Node lookup cache. 0 disables the cache. Defaults to 4096.
+        """
+        self.directory = Node()
+        self.path_cache_size = path_cache_size
+        self._path_cache = OrderedDict()
+        # The cached paths in sorted order, so every path below a given prefix
+        # forms one contiguous run that can be dropped without a full scan
+        self._cached_paths = []
+        # Callables notified as listener(operation, *paths) after every
+        # successful CREATE, MOVE or DELETE
+        self.listeners = []
+        # Name -> nodes index for FIND, built on first use
+        self._name_index = None
+        # Rendered text of full listings, per subtree, built on first use
+        self._listing = None
+        # While a transaction is open: the undo log, one (parent, name,
+        # previous child) entry per child slot changed, and the
+        # notifications held back until COMMIT
+        self._undo = None
+        self._held = None
+
+    def reset(self, root: Node = None) -> None:
+        """
+        Replaces the whole tree, e.g. with one loaded from a snapshot.
+
+        Args:
+            root (Node, optional): The new (unnamed) root node. Defaults to an empty tree.
+        """
+        self.directory = Node() if root is None else root
+        self._path_cache.clear()
+        self._cached_paths.clear()
+        self._name_index = None
+        self._listing = None
+
+    def _notify(self, operation: str, *paths) -> None:
+        """
+        Reports a successful mutation to every registered listener, or holds
+        it back until COMMIT while a transaction is open.
+        """
+        if self._held is not None:
+            self._held.append((operation, paths))
+            return
+        for listener in self.listeners:
+            listener(operation, *paths)
+
+    @staticmethod
+    def _split(path: str) -> tuple:
+        """
+        Returns the components of a path. A ParsedPath already carries them,
+        so only raw strings are split.
+        """
+        if path.__class__ is ParsedPath:
+            return path.parts
+        return tuple(path.split("/"))
+
+    def _cached(self, parts: tuple):
+        """
+        Returns the cached node for a tuple of path components, or None.
+        """
+        node = self._path_cache.get(parts)
+        if node is not None:
+            self._path_cache.move_to_end(parts)
+        return node
+
+    def _remember(self, parts: tuple, node: Node) -> None:
+        """
+        Caches the node a tuple of path components resolved to, evicting the
+        least recently used entry once the cache is full.
+        """
+        if not self.path_cache_size or not parts:
+            return
+        if parts not in self._path_cache:
+            insort(self._cached_paths, parts)
+        self._path_cache[parts] = node
+        if len(self._path_cache) > self.path_cache_size:
+            evicted, _ = self._path_cache.popitem(last=False)
+            del self._cached_paths[bisect_left(self._cached_paths, evicted)]
+
+    def _invalidate(self, parts: tuple) -> None:
+        """
+        Drops every cached path at or below the given path, after the
+        directory it names has been moved, replaced or deleted.
+        """
+        depth = len(parts)
+        start = end = bisect_left(self._cached_paths, parts)
+        while end < len(self._cached_paths) and self._cached_paths[end][:depth] == parts:
+            del self._path_cache[self._cached_paths[end]]
+            end += 1
+        del self._cached_paths[start:end]
+
+    def _indexed(self, node: Node) -> None:
+        """
+        Adds a new directory to the name index.
+        """
+        self._name_index.add(node)
+
+    def _indexed_subtree(self, node: Node) -> None:
+        """
+        Adds a directory that joined the tree, and everything below it, to
+        the name index.
+        """
+        self._name_index.add_subtree(node)
+
+    def _unindexed(self, node: Node) -> None:
+        """
+        Removes a directory that left the tree, and everything below it, from
+        the name index.
+        """
+        self._name_index.remove_subtree(node)
+
+    def _find(self, parts: tuple):
+        """
+        Resolves a tuple of path components to its node, or None if any
+        component does not exist.
+        """
+        node = self._cached(parts)
+        if node is not None:
+            return node
+        node = self.directory
+        for folder in parts:
+            node = node.get(folder)
+            if node is None:
+                return None
+        self._remember(parts, node)
+        return node
+
+    def _find_prefix(self, parts: tuple) -> tuple:
+        """
+        Resolves as many leading components of a path as exist.
+
+        Returns:
+            tuple: The deepest existing node and the number of components it
+            accounts for
         """
-        Initializes the directory structure as a nested dictionary.
+        node = self._cached(parts)
+        if node is not None:
+            return node, len(parts)
+        node = self.directory
+        for depth, folder in enumerate(parts):
+            child = node.get(folder)
+            if child is None:
+                return node, depth
+            node = child
+        self._remember(parts, node)
+        return node, len(parts)
+
+    def _create_below(self, node: Node, parts: tuple, depth: int) -> Node:
+        """
+        Creates the components of a path from depth on under node, the
+        directory the components before depth resolved to.
+
+        Returns:
+            Node: The directory the whole path resolves to
         """
-        self.directory = {}
+        if depth == len(parts):
+            return node
+        if self._undo is not None:
+            self._undo.append((node, parts[depth], None))
+        created = node.add_chain(parts[depth:])
+        if self._name_index is not None:
+            for child in created:
+                self._indexed(child)
+        node = created[-1]
+        self._remember(parts, node)
+        return node
 
     def create_directory(self, path: str) -> None:
         """
@@ -21,20 +207,135 @@ class DirectoryStructure:
             InvalidPathError: If the path is empty or invalid
             DirectoryAlreadyExistsError: If attempting to create a directory that already exists
         """
-        current = self.directory
-        path_parts = path.split("/")
-        for i, folder in enumerate(path_parts):
+        path_parts = self._split(path)
+        parent = self._cached(path_parts[:-1])
+        if parent is not None:
+            # Fast path: the parent directory was resolved recently
+            folder = path_parts[-1]
             if not folder:
                 raise InvalidPathError("Invalid path: empty folder name")
-            if i == len(path_parts) - 1 and folder in current:
+            if folder in parent:
                 raise DirectoryAlreadyExistsError(path)
-            if folder not in current:
-                current[folder] = {}
-            current = current[folder]
+            child = parent.add_child(folder)
+            if self._name_index is not None:
+                self._indexed(child)
+            if self._listing is not None:
+                self._listing.invalidate(parent)
+            if self._undo is not None:
+                self._undo.append((parent, folder, None))
+        else:
+            # Check every component first so a bad path leaves no partial result
+            if "" in path_parts:
+                raise InvalidPathError("Invalid path: empty folder name")
+            current, depth = self._find_prefix(path_parts)
+            if depth == len(path_parts):
+                raise DirectoryAlreadyExistsError(path)
+            if self._undo is not None:
+                self._undo.append((current, path_parts[depth], None))
+            created = current.add_chain(path_parts[depth:])
+            if self._name_index is not None:
+                for child in created:
+                    self._indexed(child)
+            if self._listing is not None:
+                self._listing.invalidate(current)
+            if len(path_parts) > 1:
+                self._remember(path_parts[:-1], created[-2] if len(created) > 1 else current)
+
+        if self.listeners:
+            self._notify("CREATE", path)
+
+    def create_many(self, paths) -> list:
+        """
+        Creates many directories, with exactly the same results as calling
+        create_directory for each path in order, but sharing the traversal
+        between consecutive paths: the nodes along the previous path are kept
+        as a cursor and each path is only walked from where it diverges from
+        the previous one (siblings reuse the parent directly). Paths are
+        processed in the given order, since results can depend on it
+        (e.g. 'a/b/c' followed by 'a/b').
+
+        Args:
+            paths (iterable): Paths of the directories to create
+
+        Returns:
+            list: For each path, None if it was created, or the exception
+            create_directory would have raised for it
+        """
+        results = []
+        # Components of the previous valid path and the nodes they resolved to
+        # (cursor_nodes[0] is the root, cursor_nodes[i] is cursor_parts[i - 1])
+        cursor_parts = []
+        cursor_nodes = [self.directory]
+        previous_parent = None
+        for path in paths:
+            separator = path.rfind("/")
+            parent_path = path[:separator] if separator >= 0 else ""
+            if parent_path == previous_parent:
+                # Sibling of the previous path: its parent is already resolved
+                # and validated, so only the last component needs any work
+                folder = path[separator + 1:]
+                if not folder:
+                    results.append(InvalidPathError("Invalid path: empty folder name"))
+                    continue
+                cursor_parts[-1] = folder
+                parent = cursor_nodes[-2]
+                child = parent.get(folder)
+                if child is None:
+                    child = cursor_nodes[-1] = parent.add_child(folder)
+                    if self._name_index is not None:
+                        self._indexed(child)
+                    if self._listing is not None:
+                        self._listing.invalidate(parent)
+                    if self._undo is not None:
+                        self._undo.append((parent, folder, None))
+                    error = None
+                else:
+                    cursor_nodes[-1] = child
+                    error = DirectoryAlreadyExistsError(path)
+            else:
+                path_parts = self._split(path)
+                if "" in path_parts:
+                    results.append(InvalidPathError("Invalid path: empty folder name"))
+                    continue
+                common = 0
+                limit = min(len(path_parts) - 1, len(cursor_parts))
+                while common < limit and path_parts[common] == cursor_parts[common]:
+                    common += 1
+                del cursor_parts[common:]
+                del cursor_nodes[common + 1:]
+
+                current = cursor_nodes[-1]
+                error = None
+                for i in range(common, len(path_parts)):
+                    folder = path_parts[i]
+                    child = current.get(folder)
+                    if child is None:
+                        child = current.add_child(folder)
+                        if self._name_index is not None:
+                            self._indexed(child)
+                        if self._listing is not None:
+                            self._listing.invalidate(current)
+                        if self._undo is not None:
+                            self._undo.append((current, folder, None))
+                    elif i == len(path_parts) - 1:
+                        error = DirectoryAlreadyExistsError(path)
+                    cursor_parts.append(folder)
+                    cursor_nodes.append(child)
+                    current = child
+                previous_parent = parent_path
+
+            results.append(error)
+            if error is None and self.listeners:
+                self._notify("CREATE", path)
+        return results
 
     def move_directory(self, source_path: str, dest_path: str) -> None:
         """
-        Moves a directory from source path to destination path.
+        Moves a directory from source path to destination path. Both paths
+        are resolved once; whether the destination lies inside the source is
+        decided by walking up the destination's parents, and the subtree is
+        relinked without copying. Moving a directory into its own parent
+        changes nothing.
 
         Args:
             source_path (str): Path of directory to move
@@ -44,36 +345,134 @@ class DirectoryStructure:
             CannotMoveDirectoryError: If the source is moved into itself
             DirectoryNotFoundError: If the source path doesn't exist
         """
-        if dest_path.startswith(source_path):
-            raise CannotMoveDirectoryError(source_path, dest_path)
-
-        source = source_path.split("/")
-        dest = dest_path.split("/")
+        source = self._split(source_path)
+        dest = self._split(dest_path)
 
         # Find source and its parent
-        current = self.directory
-        source_parent = current
-        for folder in source[:-1]:
-            if folder not in current:
-                raise DirectoryNotFoundError(source_path)
-            current = current[folder]
-            source_parent = current
-
-        if source[-1] not in current:
-            raise DirectoryNotFoundError(source[-1])
+        source_parent = self._find(source[:-1])
+        if source_parent is None:
+            raise DirectoryNotFoundError(source_path)
 
-        source_item = current[source[-1]]
+        source_item = source_parent.get(source[-1])
+        if source_item is None:
+            raise DirectoryNotFoundError(source[-1])
 
-        # Find destination
-        current = self.directory
-        for folder in dest:
-            if folder not in current:
-                current[folder] = {}
-            current = current[folder]
+        # Find as much of the destination as exists, and make sure the
+        # source is not on its way to the root
+        current, depth = self._find_prefix(dest)
+        ancestor = current
+        while ancestor is not None:
+            if ancestor is source_item:
+                raise CannotMoveDirectoryError(source_path, dest_path)
+            ancestor = ancestor.parent
+        if current is source_parent and depth == len(dest):
+            return
+        current = self._create_below(current, dest, depth)
 
         # Move the directory
-        current[source[-1]] = source_item
-        del source_parent[source[-1]]
+        self._invalidate(source)
+        self._invalidate(dest + (source[-1],))
+        if self._undo is not None:
+            self._undo.append((current, source[-1], current.get(source[-1])))
+            self._undo.append((source_parent, source[-1], source_item))
+        replaced = current.attach(source_item)
+        source_parent.detach(source[-1])
+        if replaced is not None and self._name_index is not None:
+            # A directory the source replaced at the destination is gone
+            self._unindexed(replaced)
+        if self._listing is not None:
+            # The moved directory keeps its blocks, whatever its new depth
+            self._listing.invalidate(source_parent)
+            self._listing.invalidate(current)
+            if replaced is not None:
+                self._listing.discard(replaced)
+
+        if self.listeners:
+            self._notify("MOVE", source_path, dest_path)
+
+    def graft(self, dest_path: str, node: Node) -> None:
+        """
+        Attaches a detached subtree (e.g. one taken from another tree) inside
+        a directory, creating the directory if needed and replacing any
+        directory with the same name there. This is one half of a MOVE
+        between two trees, so it is not reported to the listeners: whoever
+        performs the whole MOVE reports it.
+
+        Args:
+            dest_path (str): Path of the directory to attach the subtree in
+            node (Node): The root of the subtree
+        """
+        dest = self._split(dest_path)
+        current, depth = self._find_prefix(dest)
+        current = self._create_below(current, dest, depth)
+        self._invalidate(dest + (node.name,))
+        if self._undo is not None:
+            self._undo.append((current, node.name, current.get(node.name)))
+        replaced = current.attach(node)
+        if self._name_index is not None:
+            if replaced is not None:
+                self._unindexed(replaced)
+            self._indexed_subtree(node)
+        if self._listing is not None:
+            self._listing.invalidate(current)
+            if replaced is not None:
+                self._listing.discard(replaced)
+
+    def add_tree(self, path: str, node: Node) -> None:
+        """
+        Creates a directory together with a whole subtree below it in one
+        step (e.g. one read from disk), as if the directory and then every
+        directory below it had been created one by one. Missing parent
+        directories are created too.
+
+        Args:
+            path (str): Path of the new directory
+            node (Node): Detached root of the subtree; it takes the last
+                component of path as its name
+
+        Raises:
+            InvalidPathError: If the path is empty or invalid
+            DirectoryAlreadyExistsError: If the directory already exists
+        """
+        parts = self._split(path)
+        if "" in parts:
+            raise InvalidPathError("Invalid path: empty folder name")
+        current, depth = self._find_prefix(parts)
+        if depth == len(parts):
+            raise DirectoryAlreadyExistsError(path)
+        current = self._create_below(current, parts[:-1], depth)
+        node.name = sys.intern(parts[-1])
+        if self._undo is not None:
+            self._undo.append((current, node.name, None))
+        current.attach(node)
+        if self._name_index is not None:
+            self._indexed_subtree(node)
+        if self._listing is not None:
+            self._listing.invalidate(current)
+
+        if self.listeners:
+            for created in self._iter_paths(path, node):
+                self._notify("CREATE", created)
+
+    @staticmethod
+    def _iter_paths(path: str, node: Node):
+        """
+        Yields the path of a directory and then of every directory below it,
+        parents before their children.
+        """
+        yield path
+        stack = [(path, iter(node.sorted_items()))]
+        while stack:
+            parent_path, children = stack[-1]
+            entry = next(children, None)
+            if entry is None:
+                stack.pop()
+                continue
+            name, child = entry
+            child_path = f"{parent_path}/{name}"
+            yield child_path
+            if child.children:
+                stack.append((child_path, iter(child.sorted_items())))
 
     def delete_directory(self, path: str) -> None:
         """
@@ -87,28 +486,370 @@ class DirectoryStructure:
             RootDirectoryError: If attempting to delete the root directory
             CannotDeleteDirectoryError: If the specified path doesn't exist
         """
-        path_parts = path.split("/")
+        path_parts = self._split(path)
         if not path:
             raise RootDirectoryError()
 
-        current = self.directory
-        for folder in path_parts[:-1]:
-            if folder not in current:
-                raise CannotDeleteDirectoryError(path, folder)
-            current = current[folder]
+        current = self._find(path_parts[:-1])
+        if current is None:
+            # Walk again to report the first missing component
+            current = self.directory
+            for folder in path_parts[:-1]:
+                current = current.get(folder)
+                if current is None:
+                    raise CannotDeleteDirectoryError(path, folder)
+
+        self._invalidate(path_parts)
+        removed = current.detach(path_parts[-1])
+        if self._undo is not None:
+            self._undo.append((current, path_parts[-1], removed))
+        if self._name_index is not None:
+            self._unindexed(removed)
+        if self._listing is not None:
+            self._listing.invalidate(current)
+            self._listing.discard(removed)
+
+        if self.listeners:
+            self._notify("DELETE", path)
+
+    def find_directories(self, pattern: str, path: str = None) -> list:
+        """
+        Finds every directory whose name matches a glob pattern, using the
+        name index instead of walking the tree. The index is built by one walk
+        of the whole tree on the first call (which also loads every directory
+        of a LOADed image) and is kept up to date by every later change.
+
+        Args:
+            pattern (str): A directory name, or a glob pattern such as 'src*' or '*.d'
+            path (str, optional): Only find directories below this one. Defaults to the root.
+
+        Returns:
+            list: The full paths of the matching directories, sorted
+
+        Raises:
+            DirectoryNotFoundError: If the path doesn't exist
+        """
+        under = self.directory
+        if path:
+            under = self._find(self._split(path))
+            if under is None:
+                raise DirectoryNotFoundError(path)
+        if self._name_index is None:
+            self._name_index = NameIndex.of_tree(self.directory)
+
+        found = []
+        for node in self._name_index.match(pattern):
+            names = []
+            inside = under is self.directory
+            while node.parent is not None:
+                names.append(node.name)
+                node = node.parent
+                inside = inside or node is under
+            if inside:
+                found.append("/".join(reversed(names)))
+        found.sort()
+        return found
+
+    def stat_directory(self, path: str = None) -> tuple:
+        """
+        Returns the subtree counters of a directory in O(1) (after resolving
+        the path).
+
+        Args:
+            path (str, optional): The directory. Defaults to the root.
+
+        Returns:
+            tuple: The number of directories below it and the number of levels below it
+
+        Raises:
+            DirectoryNotFoundError: If the path doesn't exist
+        """
+        node = self.directory
+        if path:
+            node = self._find(self._split(path))
+            if node is None:
+                raise DirectoryNotFoundError(path)
+        return node.descendants, node.height
+
+    def export_directory(self, path: str, os_path: str, workers: int = TRANSFER_WORKERS, progress=None) -> tuple:
+        """
+        Creates the directories below a directory on disk, below os_path.
+        See filesystem.export_tree.
+
+        Args:
+            path (str): The directory to export, or None for the whole tree
+            os_path (str): The directory on disk that stands for it
+            workers (int, optional): Number of threads creating directories
+            progress (callable, optional): Called as progress(directories, seconds)
+                at most once a second
+
+        Returns:
+            tuple: The number of directories created (or already there) and the
+            number of directories skipped
+
+        Raises:
+            DirectoryNotFoundError: If the path doesn't exist
+        """
+        node = self.directory
+        if path:
+            node = self._find(self._split(path))
+            if node is None:
+                raise DirectoryNotFoundError(path)
+        return export_tree(node, os_path, workers, progress)
+
+    @property
+    def in_transaction(self) -> bool:
+        """
+        True between begin() and the matching commit() or rollback().
+        """
+        return self._undo is not None
+
+    def begin(self) -> None:
+        """
+        Opens a transaction. Until commit() or rollback(), every change is
+        recorded in an undo log and listeners are not notified.
+
+        Raises:
+            TransactionError: If a transaction is already open
+        """
+        if self._undo is not None:
+            raise TransactionError("Transaction already in progress")
+        self._undo = []
+        self._held = []
+
+    def commit(self) -> None:
+        """
+        Closes the transaction, keeping its changes. Listeners are then
+        notified of all of them at once, between a BEGIN and a COMMIT
+        notification, so e.g. a Journal can log and sync them as one batch.
+
+        Raises:
+            TransactionError: If no transaction is open
+        """
+        if self._undo is None:
+            raise TransactionError("No transaction in progress")
+        held = self._held
+        self._undo = self._held = None
+        if held and self.listeners:
+            self._notify("BEGIN")
+            for operation, paths in held:
+                self._notify(operation, *paths)
+            self._notify("COMMIT")
+
+    def rollback(self) -> None:
+        """
+        Closes the transaction, undoing its changes. The undo log is replayed
+        backwards, so this takes time proportional to the number of changes
+        made in the transaction, not to the size of the tree.
+
+        Raises:
+            TransactionError: If no transaction is open
+        """
+        if self._undo is None:
+            raise TransactionError("No transaction in progress")
+        undo = self._undo
+        self._undo = self._held = None
+        index = self._name_index
+        for parent, name, previous in reversed(undo):
+            current = parent.get(name)
+            if current is previous:
+                continue
+            if previous is None:
+                parent.detach(name)
+            else:
+                returning = previous.parent is None
+                parent.attach(previous)
+                if returning and index is not None:
+                    index.add_subtree(previous)
+            if current is not None and current.parent is None and index is not None:
+                index.remove_subtree(current)
+        self._path_cache.clear()
+        self._cached_paths.clear()
+        self._listing = None
+
+    def save(self, path: str) -> None:
+        """
+        Saves the whole tree to a file in a compact binary format.
+
+        Args:
+            path (str): The file to write (replaced atomically if it exists)
+
+        Raises:
+            TransactionError: If a transaction is open
+        """
+        if self._undo is not None:
+            raise TransactionError("SAVE is not allowed in a transaction")
+        write_image(self.directory, path)
 
-        del current[path_parts[-1]]
+    def load(self, path: str) -> None:
+        """
+        Replaces the whole tree with one saved by SAVE. The file is
+        memory-mapped and directories are only read from it when a command
+        or LIST first reaches them.
+
+        Args:
+            path (str): The file to load
+
+        Raises:
+            CorruptDataError: If the file is not a saved tree
+            TransactionError: If a transaction is open
+        """
+        if self._undo is not None:
+            raise TransactionError("LOAD is not allowed in a transaction")
+        self.reset(load_image(path))
+        if self.listeners:
+            self._notify("LOAD", path)
 
-    def print_directory(self, directory=None, indent: int = 0) -> None:
+    def iter_directory(self, path: str = None, max_depth: int = None):
         """
-        Recursively prints the contents of a directory with proper indentation.
+        Lazily yields the lines of a directory listing, one per directory, in
+        sorted order with two spaces of indentation per level. The tree is
+        walked with an explicit stack, so arbitrarily deep trees are fine.
 
         Args:
-            directory (dict): The directory structure to print
-            indent (int, optional): The current indentation level. Defaults to 0.
+            path (str, optional): Directory whose contents are listed. Defaults to the root.
+            max_depth (int, optional): Number of levels to list. Defaults to all levels.
+
+        Yields:
+            str: One line of the listing
+
+        Raises:
+            DirectoryNotFoundError: If the path doesn't exist
+        """
+        start = self.directory
+        if path:
+            start = self._find(self._split(path))
+            if start is None:
+                raise DirectoryNotFoundError(path)
+        return self._iter_lines(start, max_depth)
+
+    @staticmethod
+    def _iter_lines(start: Node, max_depth: int = None, depth: int = 0):
+        """
+        Yields the listing lines for the contents of start, which sit at the
+        given depth of the listing.
+        """
+        if max_depth is not None and depth >= max_depth:
+            return
+        stack = [iter(start.sorted_items())]
+        while stack:
+            entry = next(stack[-1], None)
+            if entry is None:
+                stack.pop()
+                continue
+            name, contents = entry
+            line_depth = depth + len(stack) - 1
+            yield "  " * line_depth + name
+            if (max_depth is None or line_depth + 1 < max_depth) and contents.children:
+                stack.append(iter(contents.sorted_items()))
+
+    def iter_entries(self, path: str = None, max_depth: int = None):
+        """
+        Lazily yields the directories of a listing as (depth, name) pairs, in
+        the order of iter_directory, depth 0 being the directories directly
+        inside the listed one.
+
+        Args:
+            path (str, optional): Directory whose contents are listed. Defaults to the root.
+            max_depth (int, optional): Number of levels to list. Defaults to all levels.
+
+        Yields:
+            tuple: The depth and name of one directory
+
+        Raises:
+            DirectoryNotFoundError: If the path doesn't exist
+        """
+        start = self.directory
+        if path:
+            start = self._find(self._split(path))
+            if start is None:
+                raise DirectoryNotFoundError(path)
+        return self._iter_entries(start, max_depth)
+
+    @staticmethod
+    def _iter_entries(start: Node, max_depth: int = None, depth: int = 0):
+        """
+        Yields the (depth, name) entries for the contents of start, which sit
+        at the given depth of the listing.
+        """
+        if max_depth is not None and depth >= max_depth:
+            return
+        stack = [iter(start.sorted_items())]
+        while stack:
+            entry = next(stack[-1], None)
+            if entry is None:
+                stack.pop()
+                continue
+            name, contents = entry
+            entry_depth = depth + len(stack) - 1
+            yield entry_depth, name
+            if (max_depth is None or entry_depth + 1 < max_depth) and contents.children:
+                stack.append(iter(contents.sorted_items()))
+
+    def _rendered_chunks(self, path: str = None):
+        """
+        Renders the full text listing of a directory through the
+        ListingCache. The returned chunks stay valid while the tree changes.
+
+        Returns:
+            iterator: The text of the listing, in chunks
+
+        Raises:
+            DirectoryNotFoundError: If the path doesn't exist
+        """
+        start, depth = self.directory, 0
+        if path:
+            parts = self._split(path)
+            start = self._find(parts)
+            if start is None:
+                raise DirectoryNotFoundError(path)
+            depth = len(parts)
+        if self._listing is None:
+            self._listing = ListingCache()
+        return self._listing.iter_chunks(start, depth, self.LIST_CHUNK_LINES)
+
+    def print_directory(self, path: str = None, max_depth: int = None, offset: int = 0, limit: int = None,
+                        list_format: str = "text") -> None:
+        """
+        Prints the contents of a directory, writing the output in chunks as
+        the tree is walked. The text format indents each directory by level;
+        the paths and ndjson formats print one full path or one JSON object
+        per line; the json format prints the whole listing as one nested JSON
+        document, encoded as it goes (see listing.iter_json). A full text
+        listing is rendered through a ListingCache, so only the subtrees that
+        changed since the previous LIST are walked again.
+
+        Args:
+            path (str, optional): Directory whose contents are listed. Defaults to the root.
+            max_depth (int, optional): Number of levels to list. Defaults to all levels.
+            offset (int, optional): Number of leading lines to skip. Defaults to 0.
+            limit (int, optional): Maximum number of lines to print. Defaults to no limit.
+            list_format (str, optional): text, paths, ndjson or json. Defaults to text.
+
+        Raises:
+            DirectoryNotFoundError: If the path doesn't exist
+            ValueError: If the format is json and an offset or limit is given
         """
-        if directory is None:
-            directory = self.directory
-        for name, contents in sorted(directory.items()):
-            print("  " * indent + name)
-            self.print_directory(contents, indent + 1)
+        if list_format == "text" and self.CACHE_LISTINGS and max_depth is None and not offset and limit is None:
+            for chunk in self._rendered_chunks(path):
+                sys.stdout.write(chunk)
+            return
+        if list_format == "text":
+            lines = self.iter_directory(path, max_depth)
+        else:
+            lines = iter_listing(self.iter_entries(path, max_depth), list_format, str(path or ""))
+        if list_format == "json":
+            if offset or limit is not None:
+                raise ValueError("A json listing cannot be paginated")
+            chunk = "".join(islice(lines, self.LIST_CHUNK_LINES))
+            while chunk:
+                sys.stdout.write(chunk)
+                chunk = "".join(islice(lines, self.LIST_CHUNK_LINES))
+            sys.stdout.write("\n")
+            return
+        if offset or limit is not None:
+            lines = islice(lines, offset, None if limit is None else offset + limit)
+        chunk = list(islice(lines, self.LIST_CHUNK_LINES))
+        while chunk:
+            sys.stdout.write("\n".join(chunk) + "\n")
+            chunk = list(islice(lines, self.LIST_CHUNK_LINES))
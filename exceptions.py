@@ -92,3 +92,58 @@ class EmptyStatementError(Exception):
   def __init__(self, message="Empty statement"):
     self.message = message
     super().__init__(self.message)
+
+
+class InvalidArgumentError(Exception):
+  """
+  Raised when a command option or argument has an invalid value.
+
+  Attributes:
+      argument (str): The offending argument.
+      message (str): Explanation of the error.
+  """
+  def __init__(self, argument, message="Invalid argument"):
+    self.argument = argument
+    self.message = f"{message}: {argument}"
+    super().__init__(self.message)
+
+
+class CorruptDataError(Exception):
+  """
+  Raised when a persisted snapshot or log file cannot be read back.
+
+  Attributes:
+      path (str): The file that could not be read.
+      message (str): Explanation of the error.
+  """
+  def __init__(self, path, message="Corrupt data file"):
+    self.path = path
+    self.message = f"{message}: {path}"
+    super().__init__(self.message)
+
+
+class TransactionError(Exception):
+  """
+  Raised when BEGIN, COMMIT or ROLLBACK is used out of order, or a command
+  is not allowed inside a transaction.
+
+  Attributes:
+      message (str): Explanation of the error.
+  """
+  def __init__(self, message="Transaction error"):
+    self.message = message
+    super().__init__(self.message)
+
+
+class ReadOnlyError(Exception):
+  """
+  Raised when a command that changes the tree is sent to a read-only replica.
+
+  Attributes:
+      command (str): The rejected command.
+      message (str): Explanation of the error.
+  """
+  def __init__(self, command, message="Read-only replica, not allowed"):
+    self.command = command
+    self.message = f"{message}: {command}"
+    super().__init__(self.message)
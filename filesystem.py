@@ -0,0 +1,190 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from exceptions import DirectoryNotFoundError
+from node import Node
+from paths import INVALID_PATH_CHARS
+
+# Threads listing or creating directories at the same time (the calls
+# release the GIL while they wait for the filesystem)
+TRANSFER_WORKERS = min(32, (os.cpu_count() or 1) + 4)
+# Seconds between two progress reports
+PROGRESS_INTERVAL = 1.0
+
+
+def _valid_name(name: str) -> bool:
+    """
+    True if a directory name can be used in the tree (and on disk): not
+    empty, free of whitespace (commands split their arguments at it, and a
+    newline would break the listing), not . or .., free of the characters
+    paths may not contain, and encodable as UTF-8.
+    """
+    if name in (".", "..") or not INVALID_PATH_CHARS.isdisjoint(name):
+        return False
+    # split() breaks at any whitespace, and leaves nothing of an empty name
+    if name.split(None, 1) != [name]:
+        return False
+    try:
+        name.encode("utf-8")
+    except UnicodeEncodeError:
+        return False
+    return True
+
+
+def _subdirectories(path: str):
+    """
+    Returns the names of the subdirectories of a directory on disk (without
+    following symbolic links), or None if it cannot be read.
+    """
+    try:
+        with os.scandir(path) as entries:
+            return [entry.name for entry in entries if entry.is_dir(follow_symlinks=False)]
+    except OSError:
+        return None
+
+
+def _make_directory(path: str) -> bool:
+    """
+    Creates one directory on disk whose parent exists.
+
+    Returns:
+        bool: True if the directory exists afterwards
+    """
+    try:
+        os.mkdir(path)
+    except FileExistsError:
+        return os.path.isdir(path)
+    except (OSError, ValueError):
+        return False
+    return True
+
+
+class _Progress:
+    """
+    Calls a progress callback with the number of directories done so far
+    and the seconds elapsed, at most once per PROGRESS_INTERVAL.
+    """
+
+    def __init__(self, callback):
+        self.callback = callback
+        self.start = self.last = time.perf_counter()
+
+    def update(self, count: int) -> None:
+        if self.callback is None:
+            return
+        now = time.perf_counter()
+        if now - self.last >= PROGRESS_INTERVAL:
+            self.last = now
+            self.callback(count, now - self.start)
+
+
+def scan_tree(os_path: str, workers: int = TRANSFER_WORKERS, progress=None) -> tuple:
+    """
+    Reads the directory hierarchy below a directory on disk into a detached
+    tree of Nodes. The hierarchy is walked level by level, listing all the
+    directories of a level in parallel with os.scandir. Symbolic links are
+    not followed. Directories that cannot be read, and directories whose
+    name cannot be used in the tree, are skipped.
+
+    The nodes are linked bottom-up once the walk is over, so each one only
+    updates its own parent's counters.
+
+    Args:
+        os_path (str): The directory on disk
+        workers (int, optional): Number of threads listing directories
+        progress (callable, optional): Called as progress(directories, seconds)
+            at most once a second while the walk goes on
+
+    Returns:
+        tuple: The root Node (unnamed, standing for os_path), the number of
+        directories below it and the number of directories skipped
+
+    Raises:
+        DirectoryNotFoundError: If os_path is not a directory
+    """
+    if not os.path.isdir(os_path):
+        raise DirectoryNotFoundError(os_path)
+    root = Node()
+    # (parent, child) pairs, level by level
+    links = []
+    level = [(root, os_path)]
+    count = skipped = 0
+    reporter = _Progress(progress)
+    with ThreadPoolExecutor(workers) as pool:
+        while level:
+            next_level = []
+            listings = pool.map(_subdirectories, [path for _, path in level])
+            for (parent, path), names in zip(level, listings):
+                if names is None:
+                    skipped += 1
+                    continue
+                for name in names:
+                    if not _valid_name(name):
+                        skipped += 1
+                        continue
+                    child = Node(name)
+                    links.append((parent, child))
+                    next_level.append((child, os.path.join(path, name)))
+                reporter.update(count + len(next_level))
+            count += len(next_level)
+            level = next_level
+    for parent, child in reversed(links):
+        parent.attach(child)
+    return root, count, skipped
+
+
+def export_tree(root, os_path: str, workers: int = TRANSFER_WORKERS, progress=None, max_depth: int = None,
+                frontier: list = None) -> tuple:
+    """
+    Creates the directory hierarchy below a node of the tree on disk, below
+    os_path (which is created if needed). Directories are created level by
+    level, all the directories of a level in parallel, so every parent
+    exists before its children are created. Directories that already exist
+    are kept. A directory that cannot be created, or whose name IMPORT
+    would not accept back, is skipped with everything below it.
+
+    Args:
+        root (Node): The directory to export (only what is below it is created)
+        os_path (str): The directory on disk that stands for root
+        workers (int, optional): Number of threads creating directories
+        progress (callable, optional): Called as progress(directories, seconds)
+            at most once a second while directories are being created
+        max_depth (int, optional): Number of levels to create. Defaults to all of them.
+        frontier (list, optional): Receives the (node, os path) pairs of the
+            directories created at the last level, when max_depth stops the walk
+
+    Returns:
+        tuple: The number of directories created (or already there) and the
+        number of directories skipped
+
+    Raises:
+        OSError: If os_path cannot be created
+    """
+    os.makedirs(os_path, exist_ok=True)
+    level = [(root, os_path)]
+    count = skipped = 0
+    reporter = _Progress(progress)
+    levels = 0
+    with ThreadPoolExecutor(workers) as pool:
+        while level and (max_depth is None or levels < max_depth):
+            levels += 1
+            candidates = []
+            for parent, path in level:
+                for name, child in parent.items():
+                    if _valid_name(name):
+                        candidates.append((child, os.path.join(path, name)))
+                    else:
+                        skipped += 1
+            level = []
+            created = pool.map(_make_directory, [path for _, path in candidates])
+            for candidate, ok in zip(candidates, created):
+                if ok:
+                    level.append(candidate)
+                    count += 1
+                    reporter.update(count)
+                else:
+                    skipped += 1
+    if frontier is not None:
+        frontier.extend(level)
+    return count, skipped
@@ -0,0 +1,84 @@
+import json
+
+# Output formats of a directory listing
+LIST_FORMATS = ("text", "paths", "ndjson", "json")
+
+
+def iter_paths(entries, base: str = ""):
+    """
+    Turns the (depth, name) entries of a listing into the full path of each
+    directory, one per line.
+
+    Args:
+        entries (iterable): The (depth, name) pairs, in listing order
+        base (str, optional): Path of the listed directory. Defaults to the root.
+
+    Yields:
+        str: One path
+    """
+    parts = [base] if base else []
+    offset = len(parts)
+    for depth, name in entries:
+        del parts[offset + depth:]
+        parts.append(name)
+        yield "/".join(parts)
+
+
+def iter_ndjson(entries, base: str = ""):
+    """
+    Turns the (depth, name) entries of a listing into one JSON object per
+    directory: {"path": ..., "name": ..., "depth": ...}, where depth counts
+    from 0 for the directories directly inside the listed one.
+
+    Yields:
+        str: One JSON line
+    """
+    parts = [base] if base else []
+    offset = len(parts)
+    for depth, name in entries:
+        del parts[offset + depth:]
+        parts.append(name)
+        yield json.dumps({"path": "/".join(parts), "name": name, "depth": depth})
+
+
+def iter_json(entries):
+    """
+    Turns the (depth, name) entries of a listing into one JSON document, a
+    list of {"name": ..., "children": [...]} objects, written as it goes:
+    each directory is opened when it is reached and closed once the listing
+    leaves it, so nothing but the current path is kept. The document is
+    exactly what json.dumps would make of the same nested lists and dicts.
+
+    Yields:
+        str: Consecutive fragments of the document
+    """
+    yield "["
+    previous = -1
+    for depth, name in entries:
+        if depth <= previous:
+            # Close the previous directory and those it was the last one in
+            yield "]}" * (previous - depth + 1) + ", "
+        yield '{"name": ' + json.dumps(name) + ', "children": ['
+        previous = depth
+    yield "]}" * (previous + 1) + "]"
+
+
+def iter_listing(entries, list_format: str, base: str = ""):
+    """
+    Formats the (depth, name) entries of a listing.
+
+    Args:
+        entries (iterable): The (depth, name) pairs, in listing order
+        list_format (str): paths, ndjson or json
+        base (str, optional): Path of the listed directory. Defaults to the root.
+
+    Yields:
+        str: Lines (paths, ndjson) or fragments of a document (json)
+    """
+    if list_format == "paths":
+        return iter_paths(entries, base)
+    if list_format == "ndjson":
+        return iter_ndjson(entries, base)
+    if list_format == "json":
+        return iter_json(entries)
+    raise ValueError(f"Unknown list format: {list_format}")
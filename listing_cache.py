@@ -0,0 +1,242 @@
+import re
+from itertools import islice
+
+# Subtrees with fewer directories than this are cached as one string; larger
+# ones as a list holding the blocks of their subdirectories
+BLOCK_DIRECTORIES = 64
+
+_SPACES = re.compile(" *")
+
+
+def _render_lines(node, depth: int) -> str:
+    """
+    Renders the contents of a (small) directory as one string of listing
+    lines, the first of them at the given depth.
+    """
+    lines = []
+    stack = [iter(node.sorted_items())]
+    while stack:
+        entry = next(stack[-1], None)
+        if entry is None:
+            stack.pop()
+            continue
+        name, contents = entry
+        lines.append("  " * (depth + len(stack) - 1) + name)
+        if contents.children:
+            stack.append(iter(contents.sorted_items()))
+    lines.append("")
+    return "\n".join(lines)
+
+
+def reindent(text: str, shift: int) -> str:
+    """
+    Moves every line of rendered listing text shift levels to the right, or
+    to the left if shift is negative (which the text must be indented enough for).
+    """
+    if shift > 0:
+        pad = "  " * shift
+        return pad + text[:-1].replace("\n", "\n" + pad) + "\n"
+    if shift < 0:
+        pad = "  " * -shift
+        return text[len(pad):].replace("\n" + pad, "\n")
+    return text
+
+
+def iter_text(block):
+    """
+    Yields the strings making up a rendered block, in listing order.
+    """
+    if block.__class__ is str:
+        yield block
+        return
+    stack = [iter(block)]
+    while stack:
+        piece = next(stack[-1], None)
+        if piece is None:
+            stack.pop()
+        elif piece.__class__ is str:
+            yield piece
+        else:
+            stack.append(iter(piece))
+
+
+def _iter_joined(pieces, count: int):
+    """
+    Yields the strings of an iterator joined count at a time.
+    """
+    chunk = "".join(islice(pieces, count))
+    while chunk:
+        yield chunk
+        chunk = "".join(islice(pieces, count))
+
+
+class ListingCache:
+    """
+    The text listings of the directories of a tree, cached per subtree so a
+    LIST of a tree that rarely changes does not walk and format it again.
+
+    The contents of a directory are rendered into a block: a single string
+    for a small subtree, or for a larger one a list of the lines of its
+    children interleaved with the blocks of their own contents. Every line
+    is thus stored once, however many directories it lies below, and a
+    block is rebuilt from the cached blocks of its subdirectories.
+
+    A block is stored without the depth it was rendered at, which is read
+    from the indentation of its first line instead (blocks whose first name
+    starts with a space are the exception, and are stored with their depth).
+    A change inside
+    a directory makes the blocks of it and of every directory above it stale,
+    and invalidate() drops exactly those; the next render() rebuilds them and
+    splices in the cached blocks of everything else. A subtree that a MOVE
+    took to another depth keeps its blocks, which are re-indented (small
+    ones) or rebuilt around re-indented ones (large ones) when next rendered.
+
+    Attributes:
+        rendered_lines (int): Number of listing lines formatted so far, for
+            checking how much of the tree a listing had to walk again
+    """
+
+    def __init__(self):
+        # Directory Node -> block, or (depth, block) when the depth cannot be
+        # read from the block (see _store)
+        self._blocks = {}
+        self.rendered_lines = 0
+
+    def __len__(self) -> int:
+        """
+        Returns the number of cached blocks.
+        """
+        return len(self._blocks)
+
+    def invalidate(self, node) -> None:
+        """
+        Drops the blocks of a directory whose contents changed and of every
+        directory above it.
+        """
+        blocks = self._blocks
+        while node is not None:
+            blocks.pop(node, None)
+            node = node.parent
+
+    def discard(self, node) -> None:
+        """
+        Drops the blocks of a subtree that left the tree (e.g. on DELETE), so
+        the cache does not keep it alive. Only large directories can have
+        cached blocks below them, so small ones are not walked.
+        """
+        blocks = self._blocks
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            block = blocks.pop(node, None)
+            if block.__class__ is tuple:
+                block = block[1]
+            if node.descendants >= BLOCK_DIRECTORIES or block.__class__ is list:
+                stack.extend(child for _, child in node.items())
+
+    def _cached(self, node, depth: int):
+        """
+        Returns the cached block of a directory for the given depth, or None
+        if it has to be rebuilt.
+        """
+        block = self._blocks.get(node)
+        if not block:
+            # (an empty directory's block is the same at every depth)
+            return block
+        if block.__class__ is tuple:
+            rendered_depth, block = block
+        else:
+            rendered_depth = _SPACES.match(block if block.__class__ is str else block[0]).end() // 2
+        if rendered_depth == depth:
+            return block
+        if block.__class__ is not str:
+            return None
+        block = reindent(block, depth - rendered_depth)
+        self._store(node, depth, block)
+        return block
+
+    def _store(self, node, depth: int, block) -> None:
+        """
+        Caches the block of a directory rendered at the given depth. If the
+        first name starts with a space, its indentation would not tell the
+        depth, so the depth is stored with it.
+        """
+        first = block
+        if first.__class__ is not str:
+            first = block[0] if block else ""
+        self._blocks[node] = (depth, block) if first[2 * depth:2 * depth + 1] == " " else block
+
+    def render(self, node, depth: int = 0):
+        """
+        Returns the block listing the contents of a directory, the first
+        level of them at the given depth, rebuilding whatever is stale. The
+        tree is walked with an explicit stack, so arbitrarily deep trees are
+        fine.
+
+        Args:
+            node (Node): The directory whose contents are listed
+            depth (int, optional): The depth of its children in the listing. Defaults to 0.
+
+        Returns:
+            str or list: The block; see iter_text
+        """
+        block = self._cached(node, depth)
+        if block is not None:
+            return block
+        cached = self._cached
+        # One frame per large directory being rebuilt: the directory, the
+        # depth and indentation of its children, its block so far, the lines
+        # not yet added to the block, and its remaining children
+        items = node.sorted_items()
+        self.rendered_lines += len(items)
+        stack = [(node, depth, "  " * depth, [], [], iter(items))]
+        while True:
+            parent, parent_depth, pad, pieces, lines, children = stack[-1]
+            for name, child in children:
+                lines.append(pad + name + "\n")
+                if child.children:
+                    break
+            else:
+                if lines:
+                    pieces.append("".join(lines))
+                stack.pop()
+                self._store(parent, parent_depth, pieces)
+                if not stack:
+                    return pieces
+                stack[-1][3].append(pieces)
+                continue
+            pieces.append("".join(lines))
+            lines.clear()
+            child_depth = parent_depth + 1
+            block = cached(child, child_depth)
+            if block is None and child.descendants < BLOCK_DIRECTORIES:
+                block = _render_lines(child, child_depth)
+                self._store(child, child_depth, block)
+                self.rendered_lines += child.descendants
+            if block is not None:
+                pieces.append(block)
+            else:
+                items = child.sorted_items()
+                self.rendered_lines += len(items)
+                stack.append((child, child_depth, pad + "  ", [], [], iter(items)))
+
+    def iter_chunks(self, node, depth: int, chunk_pieces: int):
+        """
+        Renders the listing of the contents of a directory and returns an
+        iterator over its text in chunks. The directory's children sit at the
+        given depth of the tree, but are printed at depth 0. A block is never
+        changed once built (a change builds new ones instead), so the chunks
+        stay valid while the tree changes.
+
+        Args:
+            node (Node): The directory whose contents are listed
+            depth (int): Depth of its children in the listing of the whole tree
+            chunk_pieces (int): Number of cached pieces joined into each chunk
+
+        Returns:
+            iterator: The text of the listing, in chunks
+        """
+        text = iter_text(self.render(node, depth))
+        if depth:
+            text = (reindent(piece, -depth) for piece in text)
+        return _iter_joined(text, chunk_pieces)
@@ -0,0 +1,191 @@
+import os
+import sys
+import threading
+from bisect import bisect_left
+
+# Upper bounds (in seconds) of the latency histogram buckets; slower commands
+# only count towards the implicit +Inf bucket
+LATENCY_BUCKETS = (
+    0.000001, 0.0000025, 0.000005, 0.00001, 0.000025, 0.00005, 0.0001, 0.00025,
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+)
+
+
+class CommandStats:
+    """
+    Counters and latency histogram for one command.
+
+    Attributes:
+        count (int): Number of times the command ran
+        errors (dict): Error type name -> number of runs that failed with it
+        buckets (list): Number of runs per latency bucket (the last one is +Inf)
+        total (float): Total time spent in the command, in seconds
+    """
+    __slots__ = ("count", "errors", "buckets", "total")
+
+    def __init__(self):
+        self.count = 0
+        self.errors = {}
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.total = 0.0
+
+    def quantile(self, fraction: float) -> float:
+        """
+        Returns the upper bound of the bucket holding the given fraction of
+        runs (an upper estimate of that quantile), or None if it is +Inf.
+        """
+        target = fraction * self.count
+        seen = 0
+        for bound, runs in zip(LATENCY_BUCKETS, self.buckets):
+            seen += runs
+            if seen >= target:
+                return bound
+        return None
+
+
+class Metrics:
+    """
+    Per-command call counts, error counts by error type and latency
+    histograms, recorded by DirectoryManager.process.
+
+    Recording costs two clock reads and a few dict and list updates per
+    command; a manager without a Metrics object skips even that. The
+    metrics can be written in the Prometheus text format to a file, which a
+    thread started by start() rewrites every interval seconds, whether
+    commands arrive or not. That thread only reads the counters: a write
+    racing a record() may show a command's count one ahead of its histogram,
+    which the next write corrects.
+    """
+
+    def __init__(self, path: str = None, interval: float = 10.0):
+        """
+        Args:
+            path (str, optional): File to write the text exposition to. Defaults to none.
+            interval (float, optional): Seconds between writes of that file. Defaults to 10.
+        """
+        self.path = path
+        self.interval = interval
+        self.commands = {}
+        self._stop = threading.Event()
+        self._writer = None
+
+    def record(self, command: str, seconds: float, error: str = None) -> None:
+        """
+        Records one run of a command.
+
+        Args:
+            command (str): The command name
+            seconds (float): How long it took
+            error (str, optional): Name of the error type it failed with, if it did
+        """
+        stats = self.commands.get(command)
+        if stats is None:
+            stats = self.commands[command] = CommandStats()
+        stats.count += 1
+        stats.total += seconds
+        stats.buckets[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        if error is not None:
+            stats.errors[error] = stats.errors.get(error, 0) + 1
+
+    def start(self, nodes) -> None:
+        """
+        Starts rewriting the metrics file every interval seconds, if one is
+        configured, until close() is called.
+
+        Args:
+            nodes (callable): Returns the current number of directories in the tree
+        """
+        if self.path is None or self._writer is not None:
+            return
+        self._writer = threading.Thread(target=self._write_periodically, args=(nodes,), daemon=True)
+        self._writer.start()
+
+    def close(self) -> None:
+        """
+        Stops the thread started by start(), waiting for a write in progress.
+        """
+        self._stop.set()
+        if self._writer is not None:
+            self._writer.join()
+            self._writer = None
+
+    def _write_periodically(self, nodes) -> None:
+        """
+        Writer thread: rewrites the metrics file every interval seconds. A
+        failed write is reported and retried at the next interval.
+        """
+        while not self._stop.wait(self.interval):
+            try:
+                self.write(nodes())
+            except OSError as error:
+                print(f"Cannot write metrics file: {error}", file=sys.stderr)
+
+    def iter_summary(self, nodes: int):
+        """
+        Yields a human-readable summary, one line per command.
+
+        Args:
+            nodes (int): Current number of directories in the tree
+        """
+        yield f"nodes: {nodes}"
+        for command in sorted(self.commands):
+            stats = self.commands[command]
+            line = f"{command}: {stats.count} calls, avg {stats.total / stats.count * 1e6:.1f} us"
+            p99 = stats.quantile(0.99)
+            line += f", p99 <= {p99 * 1e6:g} us" if p99 is not None else f", p99 > {LATENCY_BUCKETS[-1]:g} s"
+            if stats.errors:
+                errors = ", ".join(f"{error}: {count}" for error, count in sorted(stats.errors.items()))
+                line += f", errors ({errors})"
+            yield line
+
+    def exposition(self, nodes: int) -> str:
+        """
+        Renders the metrics in the Prometheus text exposition format.
+
+        Args:
+            nodes (int): Current number of directories in the tree
+
+        Returns:
+            str: The exposition text
+        """
+        lines = [
+            "# HELP directory_nodes Number of directories in the tree.",
+            "# TYPE directory_nodes gauge",
+            f"directory_nodes {nodes}",
+            "# HELP directory_commands_total Commands processed.",
+            "# TYPE directory_commands_total counter",
+        ]
+        commands = sorted(self.commands)
+        for command in commands:
+            lines.append(f'directory_commands_total{{command="{command}"}} {self.commands[command].count}')
+        lines.append("# HELP directory_command_errors_total Commands that failed, by error type.")
+        lines.append("# TYPE directory_command_errors_total counter")
+        for command in commands:
+            for error, count in sorted(self.commands[command].errors.items()):
+                lines.append(f'directory_command_errors_total{{command="{command}",error="{error}"}} {count}')
+        lines.append("# HELP directory_command_duration_seconds Time taken to process a command.")
+        lines.append("# TYPE directory_command_duration_seconds histogram")
+        for command in commands:
+            stats = self.commands[command]
+            cumulative = 0
+            for bound, runs in zip(LATENCY_BUCKETS, stats.buckets):
+                cumulative += runs
+                lines.append(f'directory_command_duration_seconds_bucket{{command="{command}",le="{bound:g}"}} '
+                             f'{cumulative}')
+            lines.append(f'directory_command_duration_seconds_bucket{{command="{command}",le="+Inf"}} {stats.count}')
+            lines.append(f'directory_command_duration_seconds_sum{{command="{command}"}} {stats.total:.9f}')
+            lines.append(f'directory_command_duration_seconds_count{{command="{command}"}} {stats.count}')
+        return "\n".join(lines) + "\n"
+
+    def write(self, nodes: int) -> None:
+        """
+        Writes the text exposition to the metrics file, replacing it
+        atomically so a scraper never reads a half-written file.
+
+        Args:
+            nodes (int): Current number of directories in the tree
+        """
+        temporary = self.path + ".tmp"
+        with open(temporary, "w") as f:
+            f.write(self.exposition(nodes))
+        os.replace(temporary, self.path)
@@ -0,0 +1,146 @@
+from bisect import bisect_left, insort
+from fnmatch import fnmatchcase
+
+# Characters that make a FIND pattern a glob rather than a plain name
+GLOB_CHARS = frozenset("*?[")
+
+
+class NameIndex:
+    """
+    Inverted index from directory names to the nodes carrying them.
+
+    Most names belong to a single directory, so a name maps straight to its
+    node and only switches to a set once a second directory shares it. The
+    distinct names are also kept in sorted order, so every name starting with
+    a given prefix forms one contiguous run that can be found by bisection.
+    """
+
+    def __init__(self):
+        # Name -> Node, or set of Nodes for names used more than once
+        self._nodes = {}
+        # The distinct names in sorted order
+        self._names = []
+
+    @classmethod
+    def of_tree(cls, root) -> "NameIndex":
+        """
+        Indexes every directory below root, sorting the distinct names once
+        at the end instead of inserting them one by one.
+
+        Args:
+            root (Node): The root of the tree (not indexed itself)
+
+        Returns:
+            NameIndex: The new index
+        """
+        index = cls()
+        nodes = index._nodes
+        stack = [child for _, child in root.items()]
+        while stack:
+            node = stack.pop()
+            entry = nodes.get(node.name)
+            if entry is None:
+                nodes[node.name] = node
+            elif entry.__class__ is set:
+                entry.add(node)
+            else:
+                nodes[node.name] = {entry, node}
+            if node.children:
+                stack.extend(node.children.values())
+        index._names = sorted(nodes)
+        return index
+
+    def __len__(self) -> int:
+        """
+        Returns the number of distinct names.
+        """
+        return len(self._nodes)
+
+    def add(self, node) -> None:
+        """
+        Indexes one node.
+        """
+        name = node.name
+        entry = self._nodes.get(name)
+        if entry is None:
+            self._nodes[name] = node
+            insort(self._names, name)
+        elif entry.__class__ is set:
+            entry.add(node)
+        elif entry is not node:
+            self._nodes[name] = {entry, node}
+
+    def discard(self, node) -> None:
+        """
+        Removes one node, if it is indexed.
+        """
+        name = node.name
+        entry = self._nodes.get(name)
+        if entry is node:
+            del self._nodes[name]
+            del self._names[bisect_left(self._names, name)]
+        elif entry.__class__ is set:
+            entry.discard(node)
+            if len(entry) == 1:
+                self._nodes[name] = entry.pop()
+
+    def add_subtree(self, node) -> None:
+        """
+        Indexes a node and every directory below it.
+        """
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            self.add(node)
+            stack.extend(child for _, child in node.items())
+
+    def remove_subtree(self, node) -> None:
+        """
+        Removes a node and every directory below it.
+        """
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            self.discard(node)
+            stack.extend(child for _, child in node.items())
+
+    def _lookup(self, name: str):
+        """
+        Yields the nodes called name.
+        """
+        entry = self._nodes.get(name)
+        if entry is None:
+            return
+        if entry.__class__ is set:
+            yield from entry
+        else:
+            yield entry
+
+    def match(self, pattern: str):
+        """
+        Yields every indexed node whose name matches a glob pattern (as in
+        fnmatch, case-sensitive). A plain name is a single lookup, 'prefix*'
+        is a range of the sorted names, and any other pattern is matched
+        against the distinct names only, never against every node.
+
+        Args:
+            pattern (str): A directory name or glob pattern
+
+        Yields:
+            Node: The matching nodes, in no particular order
+        """
+        glob_at = next((i for i, char in enumerate(pattern) if char in GLOB_CHARS), None)
+        if glob_at is None:
+            yield from self._lookup(pattern)
+            return
+
+        prefix = pattern[:glob_at]
+        names = self._names
+        start = bisect_left(names, prefix)
+        exact_prefix = glob_at == len(pattern) - 1 and pattern[-1] == "*"
+        for position in range(start, len(names)):
+            name = names[position]
+            if not name.startswith(prefix):
+                break
+            if exact_prefix or fnmatchcase(name, pattern):
+                yield from self._lookup(name)
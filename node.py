@@ -0,0 +1,332 @@
+import abc
+import sys
+import threading
+
+# Serialises materialisation of ChildLoaders, so that two threads reading the
+# same unloaded node cannot end up with two different sets of children
+_LOAD_LOCK = threading.Lock()
+# Serialises updates of the root's subtree counters. Every mutation applies
+# its change all the way up to the root, but below it a writer only touches
+# nodes it already owns (ConcurrentDirectoryStructure holds the write lock of
+# each top-level subtree it changes), so only the root is shared between them
+_STATS_LOCK = threading.Lock()
+
+
+class ChildLoader(abc.ABC):
+    """
+    Stands in for the children of a Node that have not been loaded into
+    memory yet (e.g. because they still live in a memory-mapped tree image).
+    The Node calls load() the first time its children are needed and keeps
+    the result.
+    """
+    __slots__ = ()
+
+    @abc.abstractmethod
+    def load(self):
+        """
+        Builds the children of the node.
+
+        Returns:
+            dict: Child name to Node map, or None if the node has no children
+        """
+
+
+class Node:
+    """
+    A single directory in the tree.
+
+    Nodes use __slots__ instead of a per-instance __dict__, intern their name
+    so every directory called e.g. "src" shares one string object, and only
+    allocate their child map when the first subdirectory is added (most
+    directories in a large tree are leaves). A Node can be read like a mapping
+    of child names to child nodes.
+
+    The children sorted by name are cached on first use and the cache is
+    dropped whenever a child is attached or detached, so listing a tree that
+    rarely changes does not re-sort it every time.
+
+    The children may also be a ChildLoader, in which case they are
+    materialised on first access.
+
+    Every node knows its parent and keeps two counters for its subtree,
+    which attach() and detach() update along the ancestor path, so they can
+    be read in O(1).
+
+    Attributes:
+        name (str): The (interned) name of the directory
+        children (dict): Child name to Node map, or None while the node is a leaf
+        parent (Node): The directory containing this one, or None for a root or a detached node
+        descendants (int): Number of directories below this one
+        height (int): Number of levels below this one (0 for a leaf)
+    """
+    __slots__ = ("name", "_children", "_sorted", "parent", "descendants", "height")
+
+    def __init__(self, name: str = "", children=None, descendants: int = 0, height: int = 0):
+        """
+        Args:
+            name (str, optional): The directory name. Defaults to "" (a root).
+            children (ChildLoader, optional): Children to load later, in which case
+                descendants and height must describe them
+            descendants (int, optional): Number of directories below this one
+            height (int, optional): Number of levels below this one
+        """
+        self.name = sys.intern(name)
+        self._children = children
+        self._sorted = None
+        self.parent = None
+        self.descendants = descendants
+        self.height = height
+
+    @property
+    def children(self):
+        children = self._children
+        if children is None or children.__class__ is dict:
+            return children
+        return self._load()
+
+    @property
+    def loaded(self) -> bool:
+        """
+        False while the children are still a pending ChildLoader.
+        """
+        return not isinstance(self._children, ChildLoader)
+
+    def _load(self):
+        """
+        Materialises children held by a ChildLoader.
+        """
+        with _LOAD_LOCK:
+            children = self._children
+            if isinstance(children, ChildLoader):
+                children = children.load()
+                if children:
+                    for child in children.values():
+                        child.parent = self
+                self._children = children
+        return children
+
+    def unload(self, children: ChildLoader):
+        """
+        Replaces the children, and everything below them, with a ChildLoader
+        that will bring them back when they are next needed. The counters
+        are kept, so the loader must give back the same subtree.
+
+        Args:
+            children (ChildLoader): The loader to use from now on
+
+        Returns:
+            ChildLoader: The loader the children were still waiting for, or
+            None if they were loaded
+        """
+        with _LOAD_LOCK:
+            previous = self._children
+            self._children = children
+            self._sorted = None
+        return previous if isinstance(previous, ChildLoader) else None
+
+    def __contains__(self, name) -> bool:
+        children = self.children
+        return children is not None and name in children
+
+    def __getitem__(self, name: str) -> "Node":
+        children = self.children
+        if children is None:
+            raise KeyError(name)
+        return children[name]
+
+    def __iter__(self):
+        return iter(self.children or ())
+
+    def __len__(self) -> int:
+        children = self.children
+        return len(children) if children else 0
+
+    def __repr__(self) -> str:
+        return f"Node({self.name!r}, children={len(self)})"
+
+    def get(self, name: str, default=None):
+        """
+        Returns the child with the given name, or default if there is none.
+        """
+        children = self.children
+        if children is None:
+            return default
+        return children.get(name, default)
+
+    def items(self):
+        """
+        Returns the (name, child) pairs of this directory.
+        """
+        children = self.children
+        return children.items() if children else ()
+
+    def sorted_items(self) -> list:
+        """
+        Returns the (name, child) pairs of this directory sorted by name.
+        The returned list is shared and must not be modified.
+        """
+        if self._sorted is None:
+            children = self.children
+            if not children:
+                return []
+            self._sorted = sorted(children.items())
+        return self._sorted
+
+    def attach(self, node: "Node"):
+        """
+        Adds node as a child under its own name, replacing any existing child
+        with the same name.
+
+        Returns:
+            Node: The child that was replaced, or None
+        """
+        children = self.children
+        if children is None:
+            children = self._children = {}
+        replaced = children.get(node.name)
+        if replaced is node:
+            return None
+        children[node.name] = node
+        self._sorted = None
+        node.parent = self
+        change = node.descendants + 1
+        lost = -1
+        if replaced is not None:
+            if replaced.parent is self:
+                replaced.parent = None
+            change -= replaced.descendants + 1
+            lost = replaced.height + 1
+        self._propagate(change, node.height + 1, lost)
+        return replaced
+
+    def add_child(self, name: str) -> "Node":
+        """
+        Creates, attaches and returns a new empty child directory.
+        """
+        children = self.children
+        if children is None:
+            children = self._children = {}
+        elif name in children:
+            node = Node(name)
+            self.attach(node)
+            return node
+        node = Node(name)
+        # Key by the interned name, so the map does not keep the caller's copy alive
+        children[node.name] = node
+        self._sorted = None
+        node.parent = self
+        # A new leaf adds one descendant to every ancestor and can only make
+        # the nearest ones taller
+        ancestor = self
+        height = 1
+        parent = ancestor.parent
+        while parent is not None and ancestor.height < height:
+            ancestor.descendants += 1
+            ancestor.height = height
+            height += 1
+            ancestor = parent
+            parent = ancestor.parent
+        while parent is not None:
+            ancestor.descendants += 1
+            ancestor = parent
+            parent = ancestor.parent
+        # (nothing in between can raise, so the lock is taken without a with block)
+        _STATS_LOCK.acquire()
+        ancestor.descendants += 1
+        if ancestor.height < height:
+            ancestor.height = height
+        _STATS_LOCK.release()
+        return node
+
+    def add_chain(self, names) -> list:
+        """
+        Creates a chain of new directories, each inside the previous one,
+        below this one. The chain is built detached, with its counters set
+        directly, and attached with a single update of the ancestors, so a
+        long chain costs O(length + depth) rather than O(length * depth).
+
+        Args:
+            names (sequence): Names of the new directories, outermost first;
+                the first must not be a child of this directory yet
+
+        Returns:
+            list: The new nodes, outermost first
+        """
+        if len(names) == 1:
+            return [self.add_child(names[0])]
+        nodes = [Node(name) for name in names]
+        below = None
+        for levels, node in enumerate(reversed(nodes)):
+            node.descendants = node.height = levels
+            if below is not None:
+                node._children = {below.name: below}
+                below.parent = node
+            below = node
+        self.attach(nodes[0])
+        return nodes
+
+    def detach(self, name: str) -> "Node":
+        """
+        Removes and returns the child with the given name.
+
+        Raises:
+            KeyError: If there is no such child
+        """
+        children = self.children
+        if children is None:
+            raise KeyError(name)
+        node = children.pop(name)
+        self._sorted = None
+        if not children:
+            self._children = None
+        if node.parent is self:
+            node.parent = None
+        self._propagate(-node.descendants - 1, -1, node.height + 1)
+        return node
+
+    def _propagate(self, change: int, gained: int, lost: int) -> None:
+        """
+        Updates the counters of this node and its ancestors after a child
+        subtree was added, removed or replaced. Only the update of the root
+        takes the lock (see _STATS_LOCK).
+
+        Args:
+            change (int): Change in the number of descendants
+            gained (int): Height the added subtree gives this node, or -1
+            lost (int): Height the removed subtree gave this node, or -1
+        """
+        node = self
+        while node.parent is not None and (gained >= 0 or lost >= 0):
+            gained, lost = node._settle(change, gained, lost)
+            node = node.parent
+        # Heights have settled: only the descendant counts change further up
+        while node.parent is not None:
+            node.descendants += change
+            node = node.parent
+        if gained >= 0 or lost >= 0:
+            with _STATS_LOCK:
+                node._settle(change, gained, lost)
+        elif change:
+            with _STATS_LOCK:
+                node.descendants += change
+
+    def _settle(self, change: int, gained: int, lost: int) -> tuple:
+        """
+        Applies a change below this node to its own counters.
+
+        Returns:
+            tuple: The (gained, lost) heights to apply to the parent, -1 for none
+        """
+        self.descendants += change
+        height = self.height
+        if gained > height:
+            self.height = gained
+        elif lost == height:
+            # The tallest child may be gone: look at the remaining ones
+            children = self.children
+            self.height = max(child.height for child in children.values()) + 1 if children else 0
+        if self.height > height:
+            return self.height + 1, -1
+        if self.height < height:
+            return -1, height + 1
+        return -1, -1
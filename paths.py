@@ -0,0 +1,58 @@
+import sys
+from functools import lru_cache
+
+# Maximum number of distinct raw paths whose parsed form is kept
+PARSE_CACHE_SIZE = 65536
+# Characters that may not appear anywhere in a path
+INVALID_PATH_CHARS = frozenset('<>:"|?*')
+
+
+class ParsedPath(str):
+    """
+    A validated, normalized path. It compares and prints like the normalized
+    path string, and also carries the path's components as a tuple of interned
+    strings so that DirectoryStructure never has to split it again.
+
+    Attributes:
+        parts (tuple): The path components, e.g. ('root', 'folder1')
+    """
+
+    def __new__(cls, path: str, parts: tuple):
+        parsed = super().__new__(cls, path)
+        parsed.parts = parts
+        return parsed
+
+
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def parse_path(path: str):
+    """
+    Validates and normalizes a raw path argument in a single pass. Surrounding
+    whitespace and one leading and one trailing slash are removed, and runs of
+    slashes inside the path count as one. Results are cached, so repeated
+    paths are only parsed once.
+
+    Args:
+        path (str): The raw path to parse
+
+    Returns:
+        ParsedPath: The parsed path, or None if the path is invalid (empty,
+        containing any of <>:"|?*, or with an empty or blank component)
+    """
+    if not path or not INVALID_PATH_CHARS.isdisjoint(path):
+        return None
+    normalized = path.strip()
+    if normalized.startswith("/"):
+        normalized = normalized[1:]
+    if normalized.endswith("/"):
+        normalized = normalized[:-1]
+
+    parts = normalized.split("/")
+    if not parts[0] or not parts[-1]:
+        return None
+    if "" in parts:
+        parts = [part for part in parts if part]
+        normalized = "/".join(parts)
+    for part in parts:
+        if part.isspace():
+            return None
+    return ParsedPath(normalized, tuple(map(sys.intern, parts)))
@@ -0,0 +1,375 @@
+import json
+import os
+import re
+import time
+
+from directory_structure import DirectoryStructure
+from exceptions import CorruptDataError
+from node import Node
+
+# First token of every snapshot file, followed by the format version and the
+# sequence number of the last mutation the snapshot contains
+SNAPSHOT_MAGIC = "DIRSNAP"
+SNAPSHOT_FORMAT = 1
+# Size of the read and write buffers used for snapshots
+SNAPSHOT_BUFFER_SIZE = 1 << 20
+
+_ESCAPES = {"\\": "\\\\", "\t": "\\t", "\n": "\\n"}
+_UNESCAPES = {value[1]: key for key, value in _ESCAPES.items()}
+_ESCAPED = re.compile(r"\\(.)")
+
+
+def _escape(name: str) -> str:
+    """
+    Escapes the characters that delimit snapshot records.
+    """
+    if "\\" in name or "\t" in name or "\n" in name:
+        return "".join(_ESCAPES.get(char, char) for char in name)
+    return name
+
+
+def _unescape(name: str) -> str:
+    """
+    Reverses _escape.
+    """
+    if "\\" in name:
+        return _ESCAPED.sub(lambda match: _UNESCAPES[match.group(1)], name)
+    return name
+
+
+def _fsync_directory(path: str) -> None:
+    """
+    Makes a rename inside a directory durable (a no-op where unsupported).
+    """
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def write_snapshot(root: Node, path: str, seq: int) -> None:
+    """
+    Atomically writes the tree below root to a snapshot file.
+
+    The file holds a header line followed by one "depth<TAB>name" line per
+    directory in preorder. It is written to a temporary file, synced and then
+    renamed over path, so a crash never leaves a half-written snapshot.
+
+    Args:
+        root (Node): The root of the tree to save
+        path (str): The snapshot file to write
+        seq (int): Sequence number of the last mutation contained in the tree
+    """
+    temporary = path + ".tmp"
+    with open(temporary, "w", encoding="utf-8", buffering=SNAPSHOT_BUFFER_SIZE) as f:
+        f.write(f"{SNAPSHOT_MAGIC} {SNAPSHOT_FORMAT} {seq}\n")
+        stack = [iter(root.items())]
+        while stack:
+            entry = next(stack[-1], None)
+            if entry is None:
+                stack.pop()
+                continue
+            name, node = entry
+            f.write(f"{len(stack) - 1}\t{_escape(name)}\n")
+            if node.children:
+                stack.append(iter(node.items()))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary, path)
+    _fsync_directory(os.path.dirname(os.path.abspath(path)))
+
+
+def load_snapshot(path: str) -> tuple:
+    """
+    Reads a snapshot written by write_snapshot.
+
+    Args:
+        path (str): The snapshot file to read
+
+    Returns:
+        tuple: The root Node of the loaded tree and the snapshot's sequence number
+
+    Raises:
+        CorruptDataError: If the file is not a valid snapshot
+    """
+    root = Node()
+    with open(path, "r", encoding="utf-8", buffering=SNAPSHOT_BUFFER_SIZE) as f:
+        header = f.readline().split()
+        if len(header) != 3 or header[0] != SNAPSHOT_MAGIC or header[1] != str(SNAPSHOT_FORMAT):
+            raise CorruptDataError(path, "Unknown snapshot format")
+        stack = [root]
+        try:
+            for line in f:
+                depth, _, name = line.rstrip("\n").partition("\t")
+                depth = int(depth)
+                del stack[depth + 1:]
+                stack.append(stack[depth].add_child(_unescape(name)))
+        except (ValueError, IndexError):
+            raise CorruptDataError(path)
+    return root, int(header[2])
+
+
+class MutationLog:
+    """
+    Append-only file of mutation records, one JSON array per line:
+    [seq, operation, path, ...].
+
+    Records are written immediately but only fsync'ed in groups (group
+    commit): after every fsync_every records and/or once fsync_interval
+    seconds have passed since the last sync, and always on close(). Records
+    appended since the last sync may be lost if the machine crashes.
+    """
+
+    def __init__(self, path: str, fsync_every: int = 1, fsync_interval: float = None):
+        """
+        Opens (or creates) a log file for appending.
+
+        Args:
+            path (str): The log file
+            fsync_every (int, optional): Sync after this many records; 0 leaves syncing to
+                fsync_interval and close(). Defaults to 1 (sync every record).
+            fsync_interval (float, optional): Sync when a record is appended at least this
+                many seconds after the last sync. Defaults to None (no time-based sync).
+        """
+        self.path = path
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self._file = open(path, "a", encoding="utf-8")
+        self._pending = 0
+        self._last_sync = time.monotonic()
+
+    def append(self, seq: int, operation: str, paths, sync: bool = True) -> None:
+        """
+        Appends one record, syncing if a group commit is due.
+
+        Args:
+            seq (int): The sequence number of the record
+            operation (str): The logged operation
+            paths (list): Its paths
+            sync (bool, optional): Whether a group commit may happen after this record.
+                Pass False for all but the last record of a transaction. Defaults to True.
+        """
+        self._file.write(json.dumps([seq, operation, *paths]) + "\n")
+        self._pending += 1
+        if not sync:
+            return
+        if self.fsync_every and self._pending >= self.fsync_every:
+            self.sync()
+        elif self.fsync_interval is not None and time.monotonic() - self._last_sync >= self.fsync_interval:
+            self.sync()
+
+    def sync(self) -> None:
+        """
+        Flushes and fsyncs every record appended so far.
+        """
+        self._file.flush()
+        if self._pending:
+            os.fsync(self._file.fileno())
+            self._pending = 0
+        self._last_sync = time.monotonic()
+
+    def truncate(self) -> None:
+        """
+        Discards every record, e.g. once they are all covered by a snapshot.
+        """
+        self._file.flush()
+        self._file.truncate(0)
+        os.fsync(self._file.fileno())
+        self._pending = 0
+
+    def close(self) -> None:
+        """
+        Syncs and closes the log.
+        """
+        self.sync()
+        self._file.close()
+
+    @staticmethod
+    def read(path: str):
+        """
+        Reads the records of a log file. Reading stops at the first incomplete
+        or unreadable line, which is what a crash in the middle of a write
+        leaves behind.
+
+        Args:
+            path (str): The log file
+
+        Yields:
+            tuple: The byte offset just past the record, its sequence number,
+            operation and paths
+        """
+        if not os.path.exists(path):
+            return
+        offset = 0
+        with open(path, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    return
+                try:
+                    seq, operation, *paths = json.loads(line)
+                except ValueError:
+                    return
+                offset += len(line)
+                yield offset, seq, operation, paths
+
+
+class Journal:
+    """
+    Makes a DirectoryStructure durable: every CREATE, MOVE and DELETE is
+    appended to a mutation log, the whole tree is periodically written to a
+    compacted snapshot (after which the log is emptied), and open() rebuilds
+    the tree from the latest snapshot plus the log tail.
+
+    The changes of a transaction are logged between BEGIN and COMMIT
+    records and synced once, at the COMMIT. open() only replays a
+    transaction whose COMMIT record made it to disk.
+    """
+    SNAPSHOT_FILE = "snapshot"
+    LOG_FILE = "mutations.log"
+
+    def __init__(self, data_dir: str, fsync_every: int = 1, fsync_interval: float = None,
+                 snapshot_every: int = 0):
+        """
+        Args:
+            data_dir (str): Directory holding the snapshot and the log (created if missing)
+            fsync_every (int, optional): Group commit size, see MutationLog. Defaults to 1.
+            fsync_interval (float, optional): Group commit interval, see MutationLog.
+            snapshot_every (int, optional): Write a snapshot after this many mutations.
+                Defaults to 0 (only when snapshot() is called).
+        """
+        self.data_dir = data_dir
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self.snapshot_every = snapshot_every
+        self.snapshot_path = os.path.join(data_dir, self.SNAPSHOT_FILE)
+        self.log_path = os.path.join(data_dir, self.LOG_FILE)
+        self.seq = 0
+        self.structure = None
+        self.log = None
+        self._since_snapshot = 0
+        self._in_batch = False
+
+    def open(self, structure: DirectoryStructure) -> int:
+        """
+        Restores structure from the data directory and starts recording its
+        mutations.
+
+        Args:
+            structure (DirectoryStructure): The (empty) structure to restore into
+
+        Returns:
+            int: The number of log records replayed on top of the snapshot
+
+        Raises:
+            CorruptDataError: If the snapshot is unreadable or the log does not replay
+        """
+        os.makedirs(self.data_dir, exist_ok=True)
+        seq = 0
+        if os.path.exists(self.snapshot_path):
+            root, seq = load_snapshot(self.snapshot_path)
+            structure.reset(root)
+
+        replayed = 0
+        valid_length = 0
+        # Records of a transaction whose COMMIT has not been read yet, and the
+        # log length before its BEGIN
+        batch = None
+        for offset, record_seq, operation, paths in MutationLog.read(self.log_path):
+            if operation == "BEGIN":
+                batch = []
+                continue
+            if batch is not None and operation != "COMMIT":
+                batch.append((record_seq, operation, paths))
+                continue
+            if operation == "COMMIT":
+                records, batch = batch or [], None
+            else:
+                records = [(record_seq, operation, paths)]
+            for seq_applied, operation_applied, paths_applied in records:
+                if seq_applied <= seq:
+                    continue
+                try:
+                    self._apply(structure, operation_applied, paths_applied)
+                except Exception:
+                    raise CorruptDataError(self.log_path, f"Cannot replay record {seq_applied}")
+                seq = seq_applied
+                replayed += 1
+            seq = max(seq, record_seq)
+            valid_length = offset
+        if os.path.exists(self.log_path) and os.path.getsize(self.log_path) > valid_length:
+            # Drop a record torn by a crash, or a transaction that never
+            # committed, so new records follow valid ones
+            os.truncate(self.log_path, valid_length)
+
+        self.seq = seq
+        self._since_snapshot = replayed
+        self.structure = structure
+        self.log = MutationLog(self.log_path, self.fsync_every, self.fsync_interval)
+        structure.listeners.append(self.record)
+        return replayed
+
+    @staticmethod
+    def _apply(structure: DirectoryStructure, operation: str, paths) -> None:
+        """
+        Re-applies one logged mutation.
+        """
+        if operation == "CREATE":
+            structure.create_directory(*paths)
+        elif operation == "MOVE":
+            structure.move_directory(*paths)
+        elif operation == "DELETE":
+            structure.delete_directory(*paths)
+        else:
+            raise ValueError(operation)
+
+    def record(self, operation: str, *paths) -> None:
+        """
+        DirectoryStructure listener: logs one mutation and takes a snapshot
+        when one is due.
+        """
+        self.seq += 1
+        if operation == "BEGIN":
+            self._in_batch = True
+            self.log.append(self.seq, operation, paths, sync=False)
+            return
+        if operation == "COMMIT":
+            self._in_batch = False
+            self.log.append(self.seq, operation, paths)
+            if self.snapshot_every and self._since_snapshot >= self.snapshot_every:
+                self.snapshot()
+            return
+        if operation == "LOAD":
+            # LOAD replaces the whole tree from a file that may change later,
+            # so capture the result in a snapshot instead of logging it
+            self.snapshot()
+            return
+        self.log.append(self.seq, operation, paths, sync=not self._in_batch)
+        self._since_snapshot += 1
+        if not self._in_batch and self.snapshot_every and self._since_snapshot >= self.snapshot_every:
+            self.snapshot()
+
+    def snapshot(self) -> None:
+        """
+        Writes the current tree to the snapshot file and empties the log.
+        """
+        self.log.sync()
+        write_snapshot(self.structure.directory, self.snapshot_path, self.seq)
+        self.log.truncate()
+        self._since_snapshot = 0
+
+    def close(self) -> None:
+        """
+        Stops recording and syncs the log.
+        """
+        if self.structure is not None:
+            self.structure.listeners.remove(self.record)
+            self.structure = None
+        if self.log is not None:
+            self.log.close()
+            self.log = None
@@ -0,0 +1,613 @@
+import sys
+import threading
+from fnmatch import fnmatchcase
+
+from directory_structure import DirectoryStructure
+from exceptions import InvalidPathError, DirectoryNotFoundError, CannotMoveDirectoryError, RootDirectoryError, \
+    CannotDeleteDirectoryError, DirectoryAlreadyExistsError, TransactionError
+from filesystem import TRANSFER_WORKERS, export_tree
+from tree_image import load_image, write_image
+
+
+class PersistentNode:
+    """
+    An immutable directory. Changing a tree never modifies a PersistentNode:
+    the nodes along the changed path are copied instead (path copying), and
+    every unchanged subtree is shared between the old and the new tree.
+    Like Node, a PersistentNode can be read as a mapping of child names to
+    child nodes, and it carries the same subtree counters (there are no
+    parent pointers, since a node can be shared by many trees).
+
+    Attributes:
+        name (str): The (interned) name of the directory
+        children (dict): Child name to PersistentNode map, or None for a leaf.
+            Must never be modified once the node is built.
+        descendants (int): Number of directories below this one
+        height (int): Number of levels below this one (0 for a leaf)
+    """
+    __slots__ = ("name", "children", "_sorted", "descendants", "height")
+
+    def __init__(self, name: str = "", children: dict = None, descendants: int = None, height: int = None):
+        """
+        Args:
+            name (str, optional): The directory name. Defaults to "" (a root).
+            children (dict, optional): The children. Defaults to none.
+            descendants (int, optional): Number of directories below this one,
+                computed from children if not given
+            height (int, optional): Number of levels below this one, computed
+                from children if not given
+        """
+        self.name = sys.intern(name)
+        self.children = children or None
+        self._sorted = None
+        if descendants is None:
+            descendants = sum(child.descendants + 1 for child in children.values()) if children else 0
+        if height is None:
+            height = max(child.height + 1 for child in children.values()) if children else 0
+        self.descendants = descendants
+        self.height = height
+
+    def __contains__(self, name) -> bool:
+        return self.children is not None and name in self.children
+
+    def __getitem__(self, name: str) -> "PersistentNode":
+        if self.children is None:
+            raise KeyError(name)
+        return self.children[name]
+
+    def __iter__(self):
+        return iter(self.children or ())
+
+    def __len__(self) -> int:
+        return len(self.children) if self.children else 0
+
+    def __repr__(self) -> str:
+        return f"PersistentNode({self.name!r}, children={len(self)})"
+
+    def get(self, name: str, default=None):
+        """
+        Returns the child with the given name, or default if there is none.
+        """
+        if self.children is None:
+            return default
+        return self.children.get(name, default)
+
+    def items(self):
+        """
+        Returns the (name, child) pairs of this directory.
+        """
+        return self.children.items() if self.children else ()
+
+    def sorted_items(self) -> list:
+        """
+        Returns the (name, child) pairs of this directory sorted by name.
+        Since the node never changes, the sorted list is computed only once.
+        """
+        if self._sorted is None:
+            if not self.children:
+                return []
+            self._sorted = sorted(self.children.items())
+        return self._sorted
+
+    def with_child(self, child: "PersistentNode") -> "PersistentNode":
+        """
+        Returns a copy of this node with child added (replacing any child with the same name).
+        """
+        children = dict(self.children) if self.children else {}
+        replaced = children.get(child.name)
+        children[child.name] = child
+        descendants = self.descendants + child.descendants + 1
+        height = max(self.height, child.height + 1)
+        if replaced is not None:
+            descendants -= replaced.descendants + 1
+            if replaced.height + 1 == self.height and child.height < replaced.height:
+                height = None
+        return PersistentNode(self.name, children, descendants, height)
+
+    def without_child(self, name: str) -> "PersistentNode":
+        """
+        Returns a copy of this node without the named child.
+
+        Raises:
+            KeyError: If there is no such child
+        """
+        if self.children is None or name not in self.children:
+            raise KeyError(name)
+        children = dict(self.children)
+        removed = children.pop(name)
+        height = None if removed.height + 1 == self.height else self.height
+        return PersistentNode(self.name, children, self.descendants - removed.descendants - 1, height)
+
+
+def freeze(root) -> PersistentNode:
+    """
+    Builds an immutable copy of a tree of Node objects (e.g. one read from a
+    snapshot or a tree image).
+
+    Args:
+        root (Node): The root of the tree to copy
+
+    Returns:
+        PersistentNode: The root of the copy
+    """
+    # Each frame holds a node, the iterator over its children and the
+    # children converted so far
+    frames = [(root, iter(root.items()), {})]
+    while True:
+        node, children, converted = frames[-1]
+        entry = next(children, None)
+        if entry is not None:
+            frames.append((entry[1], iter(entry[1].items()), {}))
+            continue
+        frames.pop()
+        frozen = PersistentNode(node.name, converted)
+        if not frames:
+            return frozen
+        frames[-1][2][frozen.name] = frozen
+
+
+class PersistentDirectoryStructure:
+    """
+    A DirectoryStructure engine built on persistent (path-copying) nodes.
+
+    Every CREATE, MOVE or DELETE builds a new root that shares all unchanged
+    subtrees with the previous one and then publishes it with a single
+    assignment. snapshot() is therefore O(1), and a reader can walk the tree
+    it returns for as long as it likes, without locks, while writers keep
+    going. Writers are serialised by a lock.
+
+    A write costs O(depth + total width of the directories on its path),
+    instead of O(depth) for the mutable engine, because each directory on the
+    path is copied.
+
+    Inside a transaction, writes build on a working root while snapshot()
+    keeps returning the last committed one. COMMIT publishes the working
+    root and ROLLBACK simply drops it.
+    """
+    LIST_CHUNK_LINES = DirectoryStructure.LIST_CHUNK_LINES
+    CACHE_LISTINGS = False
+
+    def __init__(self):
+        """
+        Initializes an empty tree.
+        """
+        self.root = PersistentNode()
+        self.listeners = []
+        self._write_lock = threading.Lock()
+        # While a transaction is open: the last committed root and the
+        # notifications held back until COMMIT
+        self._committed = None
+        self._held = None
+
+    @property
+    def directory(self) -> PersistentNode:
+        """
+        The current root, for code written against DirectoryStructure.directory.
+        """
+        return self.root
+
+    def snapshot(self) -> PersistentNode:
+        """
+        Returns the current committed root. The tree below it never changes.
+        """
+        committed = self._committed
+        return self.root if committed is None else committed
+
+    _split = staticmethod(DirectoryStructure._split)
+    _iter_lines = staticmethod(DirectoryStructure._iter_lines)
+    _iter_entries = staticmethod(DirectoryStructure._iter_entries)
+    _iter_paths = staticmethod(DirectoryStructure._iter_paths)
+    _notify = DirectoryStructure._notify
+    print_directory = DirectoryStructure.print_directory
+
+    def reset(self, root=None) -> None:
+        """
+        Replaces the whole tree.
+
+        Args:
+            root (Node, optional): The new root, as Node or PersistentNode. Defaults to an empty tree.
+        """
+        if root is None:
+            root = PersistentNode()
+        elif not isinstance(root, PersistentNode):
+            root = freeze(root)
+        with self._write_lock:
+            self.root = root
+
+    @property
+    def in_transaction(self) -> bool:
+        """
+        True between begin() and the matching commit() or rollback().
+        """
+        return self._committed is not None
+
+    def begin(self) -> None:
+        """
+        Opens a transaction.
+
+        Raises:
+            TransactionError: If a transaction is already open
+        """
+        with self._write_lock:
+            if self._committed is not None:
+                raise TransactionError("Transaction already in progress")
+            self._committed = self.root
+            self._held = []
+
+    def commit(self) -> None:
+        """
+        Publishes the changes made in the transaction, then notifies
+        listeners of all of them between a BEGIN and a COMMIT notification.
+
+        Raises:
+            TransactionError: If no transaction is open
+        """
+        with self._write_lock:
+            if self._committed is None:
+                raise TransactionError("No transaction in progress")
+            held = self._held
+            self._committed = self._held = None
+            if held and self.listeners:
+                self._notify("BEGIN")
+                for operation, paths in held:
+                    self._notify(operation, *paths)
+                self._notify("COMMIT")
+
+    def rollback(self) -> None:
+        """
+        Drops the changes made in the transaction, in O(1).
+
+        Raises:
+            TransactionError: If no transaction is open
+        """
+        with self._write_lock:
+            if self._committed is None:
+                raise TransactionError("No transaction in progress")
+            self.root = self._committed
+            self._committed = self._held = None
+
+    @staticmethod
+    def _resolve(root: PersistentNode, parts) -> list:
+        """
+        Returns the nodes along parts, starting with root, stopping at the
+        first component that does not exist.
+        """
+        nodes = [root]
+        for folder in parts:
+            child = nodes[-1].get(folder)
+            if child is None:
+                break
+            nodes.append(child)
+        return nodes
+
+    @staticmethod
+    def _rebuild(nodes: list, new_node) -> PersistentNode:
+        """
+        Path-copies a change back up to the root: nodes[-1] is replaced by
+        new_node, then every ancestor in nodes is copied to point at its new
+        child.
+
+        Returns:
+            PersistentNode: The new root
+        """
+        for depth in range(len(nodes) - 2, -1, -1):
+            new_node = nodes[depth].with_child(new_node)
+        return new_node
+
+    @staticmethod
+    def _chain(names) -> PersistentNode:
+        """
+        Builds a fresh chain of nested directories, returning its top.
+        """
+        node = PersistentNode(names[-1])
+        for name in reversed(names[:-1]):
+            node = PersistentNode(name, {node.name: node})
+        return node
+
+    def _ensure(self, root: PersistentNode, parts) -> tuple:
+        """
+        Makes sure every directory in parts exists.
+
+        Returns:
+            tuple: The (possibly new) root and the nodes along parts
+        """
+        nodes = self._resolve(root, parts)
+        if len(nodes) <= len(parts):
+            missing = self._chain(parts[len(nodes) - 1:])
+            root = self._rebuild(nodes, nodes[-1].with_child(missing))
+            nodes = self._resolve(root, parts)
+        return root, nodes
+
+    def create_directory(self, path: str) -> None:
+        """
+        Creates a new directory at the specified path.
+        If intermediate directories don't exist, they will be created.
+
+        Args:
+            path (str): Path where the directory should be created (e.g., 'root/folder1/folder2')
+
+        Raises:
+            InvalidPathError: If the path is empty or invalid
+            DirectoryAlreadyExistsError: If attempting to create a directory that already exists
+        """
+        path_parts = self._split(path)
+        if "" in path_parts:
+            raise InvalidPathError("Invalid path: empty folder name")
+        with self._write_lock:
+            nodes = self._resolve(self.root, path_parts)
+            if len(nodes) > len(path_parts):
+                raise DirectoryAlreadyExistsError(path)
+            missing = self._chain(path_parts[len(nodes) - 1:])
+            self.root = self._rebuild(nodes, nodes[-1].with_child(missing))
+            if self.listeners:
+                self._notify("CREATE", path)
+
+    def create_many(self, paths) -> list:
+        """
+        Creates many directories, with the same results as calling
+        create_directory for each path in order.
+
+        Args:
+            paths (iterable): Paths of the directories to create
+
+        Returns:
+            list: For each path, None if it was created, or the exception
+            create_directory raised for it
+        """
+        results = []
+        for path in paths:
+            try:
+                self.create_directory(path)
+                results.append(None)
+            except (InvalidPathError, DirectoryAlreadyExistsError) as e:
+                results.append(e)
+        return results
+
+    def add_tree(self, path: str, node) -> None:
+        """
+        Creates a directory together with a whole subtree below it in one
+        step. See DirectoryStructure.add_tree.
+
+        Args:
+            path (str): Path of the new directory
+            node (Node): Root of the subtree; it takes the last component of
+                path as its name
+
+        Raises:
+            InvalidPathError: If the path is empty or invalid
+            DirectoryAlreadyExistsError: If the directory already exists
+        """
+        path_parts = self._split(path)
+        if "" in path_parts:
+            raise InvalidPathError("Invalid path: empty folder name")
+        node.name = path_parts[-1]
+        subtree = freeze(node)
+        with self._write_lock:
+            nodes = self._resolve(self.root, path_parts)
+            if len(nodes) > len(path_parts):
+                raise DirectoryAlreadyExistsError(path)
+            _, nodes = self._ensure(self.root, path_parts[:-1])
+            self.root = self._rebuild(nodes, nodes[-1].with_child(subtree))
+            if self.listeners:
+                for created in self._iter_paths(path, subtree):
+                    self._notify("CREATE", created)
+
+    def move_directory(self, source_path: str, dest_path: str) -> None:
+        """
+        Moves a directory from source path to destination path. Moving a
+        directory into its own parent changes nothing.
+
+        Args:
+            source_path (str): Path of directory to move
+            dest_path (str): Destination path for the directory
+
+        Raises:
+            CannotMoveDirectoryError: If the source is moved into itself
+            DirectoryNotFoundError: If the source path doesn't exist
+        """
+        source = self._split(source_path)
+        dest = self._split(dest_path)
+        with self._write_lock:
+            root = self.root
+            nodes = self._resolve(root, source)
+            if len(nodes) < len(source):
+                raise DirectoryNotFoundError(source_path)
+            if len(nodes) == len(source):
+                raise DirectoryNotFoundError(source[-1])
+            source_item = nodes[-1]
+            # Nodes are shared between versions and have no parent links, so
+            # containment is decided on the path components
+            if dest[:len(source)] == source:
+                raise CannotMoveDirectoryError(source_path, dest_path)
+            if dest == source[:-1]:
+                return
+
+            # Attach at the destination, then detach from the source, in
+            # the same order as the mutable engine. If the attach replaced
+            # the source's parent (or one of its ancestors), the source is
+            # no longer in the tree and there is nothing left to detach.
+            root, dest_nodes = self._ensure(root, dest)
+            root = self._rebuild(dest_nodes, dest_nodes[-1].with_child(source_item))
+            replaced = dest + (source[-1],)
+            if source[:len(replaced)] != replaced or len(source) == len(replaced):
+                parent_nodes = self._resolve(root, source[:-1])
+                root = self._rebuild(parent_nodes, parent_nodes[-1].without_child(source[-1]))
+            self.root = root
+            if self.listeners:
+                self._notify("MOVE", source_path, dest_path)
+
+    def delete_directory(self, path: str) -> None:
+        """
+        Deletes a directory at the specified path.
+        If the directory contains subdirectories, they will also be deleted.
+
+        Args:
+            path (str): Path of the directory to delete (e.g., 'root/folder1/folder2')
+
+        Raises:
+            RootDirectoryError: If attempting to delete the root directory
+            CannotDeleteDirectoryError: If the specified path doesn't exist
+        """
+        path_parts = self._split(path)
+        if not path:
+            raise RootDirectoryError()
+        with self._write_lock:
+            nodes = self._resolve(self.root, path_parts[:-1])
+            if len(nodes) < len(path_parts):
+                raise CannotDeleteDirectoryError(path, path_parts[len(nodes) - 1])
+            self.root = self._rebuild(nodes, nodes[-1].without_child(path_parts[-1]))
+            if self.listeners:
+                self._notify("DELETE", path)
+
+    def find_directories(self, pattern: str, path: str = None, snapshot: PersistentNode = None) -> list:
+        """
+        Finds every directory whose name matches a glob pattern. Nodes can be
+        shared between snapshots and have no parent pointers, so this engine
+        keeps no name index and walks the (snapshot) tree instead.
+
+        Args:
+            pattern (str): A directory name, or a glob pattern such as 'src*' or '*.d'
+            path (str, optional): Only find directories below this one. Defaults to the root.
+            snapshot (PersistentNode, optional): The snapshot to search. Defaults to the current tree.
+
+        Returns:
+            list: The full paths of the matching directories, sorted
+
+        Raises:
+            DirectoryNotFoundError: If the path doesn't exist
+        """
+        start = self.root if snapshot is None else snapshot
+        prefix = ""
+        if path:
+            parts = self._split(path)
+            nodes = self._resolve(start, parts)
+            if len(nodes) <= len(parts):
+                raise DirectoryNotFoundError(path)
+            start = nodes[-1]
+            prefix = "/".join(parts) + "/"
+
+        found = []
+        stack = [(prefix, start)]
+        while stack:
+            base, node = stack.pop()
+            for name, child in node.items():
+                child_path = base + name
+                if fnmatchcase(name, pattern):
+                    found.append(child_path)
+                if child.children:
+                    stack.append((child_path + "/", child))
+        found.sort()
+        return found
+
+    def stat_directory(self, path: str = None, snapshot: PersistentNode = None) -> tuple:
+        """
+        Returns the subtree counters of a directory in O(1) (after resolving
+        the path).
+
+        Args:
+            path (str, optional): The directory. Defaults to the root.
+            snapshot (PersistentNode, optional): The snapshot to look in. Defaults to the current tree.
+
+        Returns:
+            tuple: The number of directories below it and the number of levels below it
+
+        Raises:
+            DirectoryNotFoundError: If the path doesn't exist
+        """
+        node = self.root if snapshot is None else snapshot
+        if path:
+            parts = self._split(path)
+            nodes = self._resolve(node, parts)
+            if len(nodes) <= len(parts):
+                raise DirectoryNotFoundError(path)
+            node = nodes[-1]
+        return node.descendants, node.height
+
+    def export_directory(self, path: str, os_path: str, workers: int = TRANSFER_WORKERS, progress=None,
+                         snapshot: PersistentNode = None) -> tuple:
+        """
+        Creates the directories below a directory on disk. The version of the
+        tree the export started from is exported, whatever writers do in the
+        meantime. See DirectoryStructure.export_directory.
+
+        Args:
+            snapshot (PersistentNode, optional): The snapshot to export from. Defaults to the current tree.
+        """
+        node = self.root if snapshot is None else snapshot
+        if path:
+            parts = self._split(path)
+            nodes = self._resolve(node, parts)
+            if len(nodes) <= len(parts):
+                raise DirectoryNotFoundError(path)
+            node = nodes[-1]
+        return export_tree(node, os_path, workers, progress)
+
+    def save(self, path: str) -> None:
+        """
+        Saves the whole tree to a file in a compact binary format.
+
+        Args:
+            path (str): The file to write (replaced atomically if it exists)
+        """
+        if self._committed is not None:
+            raise TransactionError("SAVE is not allowed in a transaction")
+        write_image(self.root, path)
+
+    def load(self, path: str) -> None:
+        """
+        Replaces the whole tree with one saved by SAVE. Unlike the mutable
+        engine, the whole image is read (and copied into persistent nodes)
+        up front.
+
+        Args:
+            path (str): The file to load
+
+        Raises:
+            CorruptDataError: If the file is not a saved tree
+            TransactionError: If a transaction is open
+        """
+        if self._committed is not None:
+            raise TransactionError("LOAD is not allowed in a transaction")
+        self.reset(load_image(path))
+        if self.listeners:
+            self._notify("LOAD", path)
+
+    def iter_directory(self, path: str = None, max_depth: int = None, snapshot: PersistentNode = None):
+        """
+        Lazily yields the lines of a directory listing of a snapshot. Writes
+        made while the listing is consumed do not affect it.
+
+        Args:
+            path (str, optional): Directory whose contents are listed. Defaults to the root.
+            max_depth (int, optional): Number of levels to list. Defaults to all levels.
+            snapshot (PersistentNode, optional): The snapshot to list. Defaults to the current
+                tree, including changes made by an open transaction.
+
+        Yields:
+            str: One line of the listing
+
+        Raises:
+            DirectoryNotFoundError: If the path doesn't exist
+        """
+        start = self.root if snapshot is None else snapshot
+        if path:
+            parts = self._split(path)
+            nodes = self._resolve(start, parts)
+            if len(nodes) <= len(parts):
+                raise DirectoryNotFoundError(path)
+            start = nodes[-1]
+        return self._iter_lines(start, max_depth)
+
+    def iter_entries(self, path: str = None, max_depth: int = None, snapshot: PersistentNode = None):
+        """
+        Lazily yields the directories of a listing of a snapshot as (depth,
+        name) pairs. See DirectoryStructure.iter_entries and iter_directory.
+        """
+        start = self.root if snapshot is None else snapshot
+        if path:
+            parts = self._split(path)
+            nodes = self._resolve(start, parts)
+            if len(nodes) <= len(parts):
+                raise DirectoryNotFoundError(path)
+            start = nodes[-1]
+        return self._iter_entries(start, max_depth)
@@ -0,0 +1,105 @@
+import cProfile
+import io
+import pstats
+import time
+import tracemalloc
+
+# Environment variable that turns profiling on without changing the command line
+PROFILE_ENV = "DIRECTORIES_PROFILE"
+# Number of stack frames kept per allocation when tracing allocations
+ALLOCATION_FRAMES = 1
+
+
+class Profiler:
+    """
+    Opt-in profiling of the commands processed by a DirectoryManager.
+
+    CPU time is measured with cProfile, enabled only while a command is
+    being processed (so time spent waiting for input is left out), and
+    allocations with tracemalloc. Commands slower than a threshold can be
+    logged one per line, with their arguments, as a slow-query log.
+    """
+
+    def __init__(self, cpu: bool = True, allocations: bool = False, top: int = 25,
+                 slow_log=None, slow_threshold: float = 0.1):
+        """
+        Args:
+            cpu (bool, optional): Profile CPU time with cProfile. Defaults to True.
+            allocations (bool, optional): Trace allocations with tracemalloc. Defaults to False.
+            top (int, optional): Number of functions and allocation sites in a report.
+                Defaults to 25.
+            slow_log (io.TextIOBase, optional): Stream that receives a line for every slow
+                command. Defaults to None (no slow-query log).
+            slow_threshold (float, optional): Seconds above which a command counts as slow.
+                Defaults to 0.1.
+        """
+        self.cpu = cProfile.Profile() if cpu else None
+        self.allocations = allocations
+        self.top = top
+        self.slow_log = slow_log
+        self.slow_threshold = slow_threshold
+        # Only stop tracing on close() if it was not already on
+        self._tracing = allocations and not tracemalloc.is_tracing()
+        if self._tracing:
+            tracemalloc.start(ALLOCATION_FRAMES)
+
+    def enable(self) -> None:
+        """
+        Starts collecting CPU samples (at the start of a command).
+        """
+        if self.cpu is not None:
+            self.cpu.enable()
+
+    def disable(self) -> None:
+        """
+        Stops collecting CPU samples (at the end of a command).
+        """
+        if self.cpu is not None:
+            self.cpu.disable()
+
+    def command_done(self, command: str, args: list, seconds: float) -> None:
+        """
+        Logs a command to the slow-query log if it took longer than the threshold.
+
+        Args:
+            command (str): The command
+            args (list): Its arguments
+            seconds (float): How long it took
+        """
+        if self.slow_log is not None and seconds >= self.slow_threshold:
+            stamp = time.strftime("%Y-%m-%dT%H:%M:%S")
+            self.slow_log.write(f"{stamp} {seconds * 1000:.3f} ms {' '.join([command, *map(str, args)])}\n")
+            self.slow_log.flush()
+
+    def iter_report(self):
+        """
+        Yields the report lines: the functions with the most cumulative CPU
+        time and the source lines holding the most allocated memory.
+        """
+        if self.cpu is not None:
+            yield f"Top {self.top} functions by cumulative time:"
+            if self.cpu.getstats():
+                output = io.StringIO()
+                pstats.Stats(self.cpu, stream=output).sort_stats("cumulative").print_stats(self.top)
+                yield from output.getvalue().strip("\n").splitlines()
+            else:
+                yield "(no commands profiled yet)"
+        if self.allocations and tracemalloc.is_tracing():
+            # Leave out what the profiler itself allocated
+            snapshot = tracemalloc.take_snapshot().filter_traces([
+                tracemalloc.Filter(False, filename)
+                for filename in (tracemalloc.__file__, cProfile.__file__, pstats.__file__, __file__,
+                                 "<frozen importlib._bootstrap*>")
+            ])
+            yield f"Top {self.top} allocation sites:"
+            for statistic in snapshot.statistics("lineno")[:self.top]:
+                yield str(statistic)
+
+    def close(self) -> None:
+        """
+        Stops tracing allocations, if this profiler started it.
+        """
+        self.disable()
+        if self._tracing:
+            tracemalloc.stop()
+            self._tracing = False
@@ -0,0 +1,516 @@
+import json
+import os
+import socket
+import sys
+import threading
+import time
+from itertools import islice
+
+from directory_structure import DirectoryStructure
+from exceptions import DirectoryNotFoundError, ReadOnlyError, TransactionError
+from filesystem import TRANSFER_WORKERS, export_tree
+from tree_image import decode_image, encode_image, write_image
+
+# Maximum number of events sent to a replica in one message
+FEED_BATCH = 4096
+# Seconds a replica that is caught up waits between two heartbeats
+HEARTBEAT_INTERVAL = 1.0
+
+
+def _message(seq: int, kind: str, *args) -> bytes:
+    """
+    Encodes one line of the feed protocol.
+    """
+    return (json.dumps([seq, kind, *args]) + "\n").encode("utf-8")
+
+
+class ChangeFeed:
+    """
+    Publishes the mutations of a DirectoryStructure as an ordered stream of
+    events, each with a sequence number, to any number of replicas.
+
+    The stream a replica receives is made of JSON lines, like the records of
+    a MutationLog:
+
+        [seq, "IMAGE", size]        followed by size bytes: the whole tree, as
+                                    of seq, as a tree image
+        [seq, "HEAD", count]        the primary is at seq, and count events follow
+        [seq, operation, path, ...] one event (CREATE, MOVE, DELETE, or the
+                                    BEGIN and COMMIT around a transaction)
+
+    A new replica first gets an image and then every event after it. The
+    feed keeps the events since its last image in memory and takes a new
+    image (dropping them) once there are more events than directories in
+    the tree, so its memory stays proportional to the tree. A LOAD is
+    published as an image of the loaded file.
+
+    Images are taken by the listener, on the thread that changes the tree,
+    so they always match the sequence number they are sent with. On a tree
+    shared between threads (one with exclusive(), e.g. a
+    ConcurrentDirectoryStructure) the listener runs while its thread holds
+    the tree's locks and other writers may be halfway through their own
+    changes, so a compactor thread takes the image instead, holding the
+    whole tree. Each replica is served by its own thread.
+    """
+
+    def __init__(self, compact_every: int = 100_000, heartbeat: float = HEARTBEAT_INTERVAL):
+        """
+        Args:
+            compact_every (int, optional): Minimum number of events kept before a new
+                image replaces them. Defaults to 100000.
+            heartbeat (float, optional): Seconds between two HEAD messages to a replica
+                that is caught up. Defaults to 1 second.
+        """
+        self.compact_every = compact_every
+        self.heartbeat = heartbeat
+        self.seq = 0
+        self.structure = None
+        self._condition = threading.Condition()
+        # The latest image, the sequence number it was taken at and the
+        # encoded events since then (the event with sequence number
+        # _image_seq + i + 1 is _events[i])
+        self._image = None
+        self._image_seq = 0
+        self._events = []
+        self._in_batch = False
+        self._compact = False
+        self._closed = False
+        self._server = None
+        self._connections = []
+
+    def attach(self, structure: DirectoryStructure) -> None:
+        """
+        Starts publishing the mutations of structure, taking a first image of it.
+        """
+        self.structure = structure
+        self._image = encode_image(structure.directory)
+        structure.listeners.append(self.record)
+        if hasattr(structure, "exclusive"):
+            threading.Thread(target=self._compact_shared, args=(structure,), daemon=True).start()
+
+    def record(self, operation: str, *paths) -> None:
+        """
+        DirectoryStructure listener: publishes one mutation, and takes a new
+        image when one is due.
+        """
+        if operation == "LOAD":
+            # The file is already a tree image of the new tree
+            with open(paths[0], "rb") as f:
+                image = f.read()
+            with self._condition:
+                self.seq += 1
+                self._reimage(image)
+            return
+        with self._condition:
+            self.seq += 1
+            self._events.append(_message(self.seq, operation, *paths))
+            self._condition.notify_all()
+        if operation == "BEGIN":
+            self._in_batch = True
+        elif operation == "COMMIT":
+            self._in_batch = False
+        # A transaction's changes are all in the tree before its BEGIN is
+        # published, so no image can be taken until its COMMIT
+        if self._in_batch or len(self._events) < self.compact_every:
+            return
+        if hasattr(self.structure, "exclusive"):
+            with self._condition:
+                self._compact = True
+                self._condition.notify_all()
+        elif len(self._events) >= self.structure.stat_directory()[0]:
+            image = encode_image(self.structure.directory)
+            with self._condition:
+                self._reimage(image)
+
+    def _compact_shared(self, structure) -> None:
+        """
+        Compactor thread of a feed attached to a shared tree: takes the images
+        the listener asks for, holding the whole tree so that no writer is
+        halfway through a change (and every finished one has been recorded).
+        """
+        while True:
+            with self._condition:
+                while not self._compact and not self._closed:
+                    self._condition.wait()
+                if self._closed:
+                    return
+                self._compact = False
+            with structure.exclusive():
+                # (the counters are read directly: stat_directory would wait
+                # for the tree lock held here)
+                if len(self._events) < structure.directory.descendants:
+                    continue
+                image = encode_image(structure.directory)
+                with self._condition:
+                    self._reimage(image)
+
+    def _reimage(self, image: bytes) -> None:
+        """
+        Replaces the image and the events before it. Must be called with the
+        condition held.
+        """
+        self._image = image
+        self._image_seq = self.seq
+        self._events = []
+        self._condition.notify_all()
+
+    def subscribe(self, connection: socket.socket) -> None:
+        """
+        Starts streaming to a replica over a connected socket.
+        """
+        with self._condition:
+            self._connections.append(connection)
+        threading.Thread(target=self._stream, args=(connection,), daemon=True).start()
+
+    def _stream(self, connection: socket.socket) -> None:
+        """
+        Sends the stream to one replica until it disconnects or the feed is closed.
+        """
+        position = -1
+        try:
+            while True:
+                with self._condition:
+                    if position == self.seq and not self._closed:
+                        self._condition.wait(self.heartbeat)
+                    if self._closed:
+                        return
+                    head = self.seq
+                    chunks = []
+                    if position < self._image_seq:
+                        position = self._image_seq
+                        chunks += [_message(position, "IMAGE", len(self._image)), self._image]
+                    start = position - self._image_seq
+                    events = self._events[start:start + FEED_BATCH]
+                chunks.append(_message(head, "HEAD", len(events)))
+                chunks += events
+                connection.sendall(b"".join(chunks))
+                position += len(events)
+        except OSError:
+            pass
+        finally:
+            with self._condition:
+                if connection in self._connections:
+                    self._connections.remove(connection)
+            connection.close()
+
+    def listen(self, path: str) -> None:
+        """
+        Accepts replicas on a Unix socket at path, in a background thread.
+        """
+        if os.path.exists(path):
+            os.unlink(path)
+        self._server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._server.bind(path)
+        self._server.listen()
+        threading.Thread(target=self._accept, args=(self._server,), daemon=True).start()
+
+    def _accept(self, server: socket.socket) -> None:
+        while True:
+            try:
+                connection, _ = server.accept()
+            except OSError:
+                return
+            self.subscribe(connection)
+
+    def close(self) -> None:
+        """
+        Stops publishing and disconnects every replica.
+        """
+        if self.structure is not None:
+            self.structure.listeners.remove(self.record)
+            self.structure = None
+        if self._server is not None:
+            path = self._server.getsockname()
+            self._server.close()
+            self._server = None
+            if path and os.path.exists(path):
+                os.unlink(path)
+        with self._condition:
+            self._closed = True
+            connections = list(self._connections)
+            self._condition.notify_all()
+        for connection in connections:
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+
+class ReplicaDirectoryStructure:
+    """
+    A read-only copy of a tree published by a ChangeFeed. A background
+    thread receives the feed and applies it to a private DirectoryStructure;
+    LIST, COUNT, STATS, FIND and SAVE are served from that copy, and every
+    command that would change the tree fails with a ReadOnlyError.
+
+    Reads and the thread applying the feed take turns on a lock. A
+    transaction of the primary is applied all at once, so reads never see
+    half of one. A listing is produced LIST_CHUNK_LINES lines at a time and
+    the lock is released between chunks, so a large LIST neither holds the
+    whole listing in memory nor stalls the feed while it is printed; like
+    on a ConcurrentDirectoryStructure, it may then show changes applied
+    while it was running. A full text listing is rendered through the
+    ListingCache under the lock and written out after releasing it.
+    """
+    LIST_CHUNK_LINES = DirectoryStructure.LIST_CHUNK_LINES
+    CACHE_LISTINGS = True
+
+    def __init__(self, connection: socket.socket):
+        """
+        Starts following the feed.
+
+        Args:
+            connection (socket.socket): A socket connected to a ChangeFeed
+                (e.g. by connect(), or one end of a socketpair)
+        """
+        self._structure = DirectoryStructure()
+        self._lock = threading.Lock()
+        self._connection = connection
+        self._condition = threading.Condition()
+        self.listeners = []
+        # Sequence number the primary is at, as far as the replica knows,
+        # and of the last event applied here (None until the first image)
+        self.head = 0
+        self.applied = None
+        self.connected = True
+        # When the replica last found itself behind the primary, or None
+        self._behind_since = None
+        threading.Thread(target=self._follow, daemon=True).start()
+
+    @classmethod
+    def connect(cls, path: str) -> "ReplicaDirectoryStructure":
+        """
+        Follows the feed published on a Unix socket at path.
+        """
+        connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        connection.connect(path)
+        return cls(connection)
+
+    def close(self) -> None:
+        """
+        Stops following the feed.
+        """
+        try:
+            self._connection.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self._connection.close()
+
+    def _follow(self) -> None:
+        """
+        Receives the feed and applies it until the primary disconnects.
+        """
+        reader = self._connection.makefile("rb")
+        # Events of a transaction whose COMMIT has not arrived yet
+        batch = None
+        try:
+            while True:
+                line = reader.readline()
+                if not line:
+                    break
+                seq, kind, *args = json.loads(line)
+                if kind == "IMAGE":
+                    root = decode_image(reader.read(args[0]))
+                    with self._lock:
+                        self._structure.reset(root)
+                    self._advanced(seq, seq)
+                    batch = None
+                    continue
+                # A HEAD message: read its events, then apply them in one go
+                events = [json.loads(reader.readline()) for _ in range(args[0])]
+                applied = self.applied
+                with self._lock:
+                    for event_seq, operation, *paths in events:
+                        if operation == "BEGIN":
+                            batch = []
+                            continue
+                        if batch is not None and operation != "COMMIT":
+                            batch.append((operation, paths))
+                            continue
+                        if operation == "COMMIT":
+                            records, batch = batch or [], None
+                        else:
+                            records = [(operation, paths)]
+                        for record_operation, record_paths in records:
+                            self._apply(record_operation, record_paths)
+                        applied = event_seq
+                self._advanced(seq, applied)
+        except Exception as error:
+            # Includes an event that does not apply, which would mean the
+            # copy no longer matches the primary
+            print(f"Replication stopped: {error}", file=sys.stderr)
+        finally:
+            reader.close()
+            with self._condition:
+                self.connected = False
+                self._condition.notify_all()
+
+    def _apply(self, operation: str, paths) -> None:
+        """
+        Applies one event of the feed to the copy.
+        """
+        if operation == "CREATE":
+            self._structure.create_directory(*paths)
+        elif operation == "MOVE":
+            self._structure.move_directory(*paths)
+        elif operation == "DELETE":
+            self._structure.delete_directory(*paths)
+        else:
+            raise ValueError(f"Unknown event: {operation}")
+
+    def _advanced(self, head: int, applied: int) -> None:
+        """
+        Records how far the primary and the copy are.
+        """
+        with self._condition:
+            self.head = head
+            self.applied = applied
+            if applied < head:
+                if self._behind_since is None:
+                    self._behind_since = time.monotonic()
+            else:
+                self._behind_since = None
+            self._condition.notify_all()
+
+    def lag(self) -> tuple:
+        """
+        Returns how far the copy is behind the primary.
+
+        Returns:
+            tuple: The number of events not applied yet and the seconds since
+            the copy was last up to date (0 if it is)
+        """
+        with self._condition:
+            behind_since = self._behind_since
+            return self.head - (self.applied or 0), 0.0 if behind_since is None else time.monotonic() - behind_since
+
+    def wait(self, seq: int = None, timeout: float = None) -> bool:
+        """
+        Waits until every event up to seq (by default, up to the latest
+        HEAD received) has been applied.
+
+        Returns:
+            bool: False if the timeout expired or the feed disconnected first
+        """
+        def caught_up():
+            return self.applied is not None and self.applied >= (self.head if seq is None else seq)
+
+        with self._condition:
+            self._condition.wait_for(lambda: caught_up() or not self.connected, timeout)
+            return caught_up()
+
+    @property
+    def directory(self):
+        """
+        A copy of the tree as it is now (the copy the replica serves keeps
+        changing as the feed is applied).
+        """
+        with self._lock:
+            return decode_image(encode_image(self._structure.directory))
+
+    def _chunked(self, items):
+        """
+        Yields the items of a listing, taking them LIST_CHUNK_LINES at a time
+        under the lock.
+        """
+        while True:
+            with self._lock:
+                chunk = list(islice(items, self.LIST_CHUNK_LINES))
+            if not chunk:
+                return
+            yield from chunk
+
+    def iter_directory(self, path: str = None, max_depth: int = None):
+        """
+        Lazily yields the lines of a directory listing. See DirectoryStructure.iter_directory.
+        """
+        with self._lock:
+            lines = self._structure.iter_directory(path, max_depth)
+        return self._chunked(lines)
+
+    def iter_entries(self, path: str = None, max_depth: int = None):
+        """
+        Lazily yields the (depth, name) entries of a directory listing. See DirectoryStructure.iter_entries.
+        """
+        with self._lock:
+            entries = self._structure.iter_entries(path, max_depth)
+        return self._chunked(entries)
+
+    def _rendered_chunks(self, path: str = None):
+        """
+        Renders a full text listing under the lock. See DirectoryStructure._rendered_chunks.
+        """
+        with self._lock:
+            return self._structure._rendered_chunks(path)
+
+    print_directory = DirectoryStructure.print_directory
+
+    def stat_directory(self, path: str = None) -> tuple:
+        """
+        See DirectoryStructure.stat_directory.
+        """
+        with self._lock:
+            return self._structure.stat_directory(path)
+
+    def find_directories(self, pattern: str, path: str = None) -> list:
+        """
+        See DirectoryStructure.find_directories.
+        """
+        with self._lock:
+            return self._structure.find_directories(pattern, path)
+
+    def export_directory(self, path: str, os_path: str, workers: int = TRANSFER_WORKERS, progress=None) -> tuple:
+        """
+        Copies the directory under the lock and creates the copy on disk
+        after releasing it, so changes keep being applied during the export.
+        See DirectoryStructure.export_directory.
+        """
+        with self._lock:
+            node = self._structure.directory
+            if path:
+                node = self._structure._find(self._structure._split(path))
+                if node is None:
+                    raise DirectoryNotFoundError(path)
+            data = encode_image(node)
+        return export_tree(decode_image(data), os_path, workers, progress)
+
+    def save(self, path: str) -> None:
+        """
+        Saves the copy to a file. See DirectoryStructure.save.
+        """
+        with self._lock:
+            write_image(self._structure.directory, path)
+
+    def create_directory(self, path: str) -> None:
+        raise ReadOnlyError("CREATE")
+
+    def create_many(self, paths) -> list:
+        raise ReadOnlyError("CREATE")
+
+    def add_tree(self, path: str, node) -> None:
+        raise ReadOnlyError("IMPORT")
+
+    def move_directory(self, source_path: str, dest_path: str) -> None:
+        raise ReadOnlyError("MOVE")
+
+    def delete_directory(self, path: str) -> None:
+        raise ReadOnlyError("DELETE")
+
+    def load(self, path: str) -> None:
+        raise ReadOnlyError("LOAD")
+
+    def reset(self, root=None) -> None:
+        raise ReadOnlyError("LOAD")
+
+    @property
+    def in_transaction(self) -> bool:
+        return False
+
+    def begin(self) -> None:
+        raise ReadOnlyError("BEGIN")
+
+    def commit(self) -> None:
+        raise TransactionError("No transaction in progress")
+
+    def rollback(self) -> None:
+        raise TransactionError("No transaction in progress")
@@ -0,0 +1,202 @@
+"""
+Network front end for the command processor.
+
+Clients send one command per line, exactly as they would type it in the
+interactive session, and may pipeline any number of commands without
+waiting for replies. Every command line gets exactly one response, in the
+order the commands were sent on that connection. A response is the number of
+output lines, on a line of its own, followed by those lines:
+
+    CREATE a/b        ->  0
+    LIST              ->  2
+                          a
+                            b
+    DELETE missing    ->  1
+                          Cannot delete missing - ...
+
+EXIT closes the connection (after an empty response). All connections
+share one DirectoryManager, so they all see the same tree.
+
+While one connection has a transaction open (BEGIN ... COMMIT/ROLLBACK),
+commands from the other connections wait until it ends. A connection that
+closes with a transaction open has it rolled back.
+"""
+import asyncio
+import io
+import sys
+from collections import deque
+from contextlib import redirect_stdout
+
+from directory_manager import DirectoryManager
+from exceptions import EmptyStatementError
+
+# Longest command line accepted before the connection is dropped
+MAX_LINE_LENGTH = 1 << 20
+
+
+class TransactionGate:
+    """
+    Tracks which connection, if any, has a transaction open on the shared
+    manager, and the connections waiting for it to end.
+    """
+
+    def __init__(self):
+        self.owner = None
+        self.waiting = []
+
+    def release(self) -> None:
+        """
+        Ends the current owner's turn and lets every waiting connection go on.
+        """
+        self.owner = None
+        waiting, self.waiting = self.waiting, []
+        for protocol in waiting:
+            asyncio.get_running_loop().call_soon(protocol.resume)
+
+
+class CommandProtocol(asyncio.Protocol):
+    """
+    One client connection. Commands are executed as soon as their line is
+    complete, and all responses for the data received in one read are sent
+    in one write.
+    """
+
+    def __init__(self, manager: DirectoryManager, gate: TransactionGate = None):
+        self.manager = manager
+        self.gate = TransactionGate() if gate is None else gate
+        self.transport = None
+        self._pending = b""
+        self._lines = deque()
+
+    def connection_made(self, transport) -> None:
+        self.transport = transport
+
+    def data_received(self, data: bytes) -> None:
+        lines = (self._pending + data).split(b"\n")
+        self._pending = lines.pop()
+        if len(self._pending) > MAX_LINE_LENGTH:
+            self.transport.close()
+            return
+        self._lines.extend(lines)
+        self._run()
+
+    def _run(self) -> None:
+        """
+        Executes queued command lines until the queue is empty or another
+        connection's transaction is in the way.
+        """
+        gate = self.gate
+        responses = []
+        closing = False
+        while self._lines and not closing:
+            if gate.owner is not None and gate.owner is not self:
+                self.transport.pause_reading()
+                if self not in gate.waiting:
+                    gate.waiting.append(self)
+                break
+            line = self._lines.popleft()
+            response, closing = execute(self.manager, line.decode("utf-8", "replace"))
+            responses.append(response)
+            if self.manager.in_transaction:
+                gate.owner = self
+            elif gate.owner is self:
+                gate.release()
+        if responses:
+            self.transport.write("".join(responses).encode("utf-8"))
+        if closing:
+            self.transport.close()
+
+    def resume(self) -> None:
+        """
+        Continues after the transaction this connection waited for ended.
+        """
+        if self.transport is None or self.transport.is_closing():
+            return
+        self.transport.resume_reading()
+        self._run()
+
+    def connection_lost(self, exc) -> None:
+        gate = self.gate
+        if self in gate.waiting:
+            gate.waiting.remove(self)
+        if gate.owner is self:
+            with redirect_stdout(io.StringIO()):
+                self.manager.close_transaction()
+            gate.release()
+
+    def pause_writing(self) -> None:
+        # The client is not reading its responses: stop reading its commands
+        self.transport.pause_reading()
+
+    def resume_writing(self) -> None:
+        self.transport.resume_reading()
+
+
+def execute(manager: DirectoryManager, statement: str) -> tuple:
+    """
+    Runs one command line and captures its output as a framed response.
+
+    Args:
+        manager (DirectoryManager): The manager that processes the command
+        statement (str): The raw command line
+
+    Returns:
+        tuple: The framed response and whether the client asked to EXIT
+    """
+    output = io.StringIO()
+    closing = False
+    with redirect_stdout(output):
+        try:
+            command, args = manager.parse_statement(statement.strip())
+            manager.process(command, args)
+        except EmptyStatementError:
+            pass
+        except EOFError:
+            closing = True
+    text = output.getvalue()
+    lines = text.count("\n")
+    return f"{lines}\n{text}", closing
+
+
+async def start_server(manager: DirectoryManager, host: str = "127.0.0.1", port: int = None,
+                       path: str = None) -> asyncio.AbstractServer:
+    """
+    Starts accepting connections on a TCP port or a Unix socket.
+
+    Args:
+        manager (DirectoryManager): The manager shared by every connection
+        host (str, optional): Address to bind the TCP port to. Defaults to 127.0.0.1.
+        port (int, optional): TCP port to listen on (0 picks a free one)
+        path (str, optional): Unix socket path to listen on instead of a TCP port
+
+    Returns:
+        asyncio.AbstractServer: The listening server
+    """
+    loop = asyncio.get_running_loop()
+    gate = TransactionGate()
+    if path is not None:
+        return await loop.create_unix_server(lambda: CommandProtocol(manager, gate), path)
+    return await loop.create_server(lambda: CommandProtocol(manager, gate), host, port)
+
+
+def serve(manager: DirectoryManager, host: str = "127.0.0.1", port: int = None, path: str = None) -> None:
+    """
+    Runs the server until it is interrupted.
+
+    Args:
+        manager (DirectoryManager): The manager shared by every connection
+        host (str, optional): Address to bind the TCP port to. Defaults to 127.0.0.1.
+        port (int, optional): TCP port to listen on
+        path (str, optional): Unix socket path to listen on instead of a TCP port
+    """
+    async def main():
+        server = await start_server(manager, host, port, path)
+        addresses = ", ".join(str(sock.getsockname()) for sock in server.sockets)
+        print(f"Listening on {addresses}", file=sys.stderr, flush=True)
+        async with server:
+            await server.serve_forever()
+
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        print("Exiting...", file=sys.stderr)
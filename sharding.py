@@ -0,0 +1,532 @@
+import heapq
+import multiprocessing
+import os
+import zlib
+from itertools import chain
+
+from directory_structure import DirectoryStructure
+from exceptions import DirectoryNotFoundError, TransactionError
+from filesystem import TRANSFER_WORKERS
+from node import Node
+from tree_image import decode_image, encode_image, load_image, write_image
+
+# Event reported to the listeners for each operation that can be submitted
+SUBMITTED_EVENTS = {
+    "create_directory": "CREATE",
+    "delete_directory": "DELETE",
+    "move_directory": "MOVE",
+}
+
+
+def shard_of(name: str, shards: int) -> int:
+    """
+    Returns the shard that owns a top-level directory. Unlike hash(), the
+    result is the same in every process and every run.
+
+    Args:
+        name (str): Name of the top-level directory
+        shards (int): Number of shards
+
+    Returns:
+        int: The shard index
+    """
+    return zlib.crc32(name.encode("utf-8")) % shards
+
+
+def _pack_error(error: Exception) -> tuple:
+    """
+    Turns an exception into something that can be sent to another process.
+    The exceptions in exceptions.py are built from other arguments than the
+    message they keep, so pickling them as usual would not rebuild them.
+    """
+    return type(error), error.args, error.__dict__
+
+
+def _unpack_error(packed: tuple) -> Exception:
+    """
+    Rebuilds an exception packed by _pack_error, with the same type,
+    message and attributes.
+    """
+    error_type, args, attributes = packed
+    error = error_type.__new__(error_type)
+    error.args = args
+    error.__dict__.update(attributes)
+    return error
+
+
+def _top_lines(structure: DirectoryStructure, max_depth: int = None) -> list:
+    """
+    Returns the listing of each top-level directory of a shard, as
+    (name, lines) pairs sorted by name.
+    """
+    return [(name, [name, *structure._iter_lines(node, max_depth, 1)])
+            for name, node in structure.directory.sorted_items()]
+
+
+def _top_entries(structure: DirectoryStructure, max_depth: int = None) -> list:
+    """
+    Returns the (depth, name) entries of each top-level directory of a
+    shard, as (name, entries) pairs sorted by name.
+    """
+    return [(name, [(0, name), *structure._iter_entries(node, max_depth, 1)])
+            for name, node in structure.directory.sorted_items()]
+
+
+def _export(structure: DirectoryStructure, source_path: str) -> bytes:
+    """
+    Encodes the directory a MOVE takes out of a shard, failing the way
+    move_directory would if it does not exist. The shard is not changed.
+    """
+    source = structure._split(source_path)
+    parent = structure._find(source[:-1])
+    if parent is None:
+        raise DirectoryNotFoundError(source_path)
+    node = parent.get(source[-1])
+    if node is None:
+        raise DirectoryNotFoundError(source[-1])
+    return encode_image(node)
+
+
+def _load_shard(structure: DirectoryStructure, path: str, shard: int, shards: int) -> None:
+    """
+    Replaces a shard's tree with the top-level directories it owns in a
+    saved tree image.
+    """
+    image_root = load_image(path)
+    root = Node()
+    for name, node in image_root.items():
+        if shard_of(name, shards) == shard:
+            root.attach(node)
+    structure.reset(root)
+
+
+def _reset(structure: DirectoryStructure, data: bytes = None) -> None:
+    """
+    Replaces a shard's tree with an encoded one, or empties it.
+    """
+    structure.reset(None if data is None else decode_image(data))
+
+
+# Operations a shard worker runs on its tree: name -> function(structure, *args)
+SHARD_OPERATIONS = {
+    "create_directory": DirectoryStructure.create_directory,
+    "delete_directory": DirectoryStructure.delete_directory,
+    "move_directory": DirectoryStructure.move_directory,
+    "stat_directory": DirectoryStructure.stat_directory,
+    "find_directories": DirectoryStructure.find_directories,
+    "export_directory": DirectoryStructure.export_directory,
+    "list": lambda structure, path, max_depth: list(structure.iter_directory(path, max_depth)),
+    "top_lines": _top_lines,
+    "entries": lambda structure, path, max_depth: list(structure.iter_entries(path, max_depth)),
+    "top_entries": _top_entries,
+    "export": _export,
+    "graft": lambda structure, dest_path, name, data: structure.graft(dest_path, decode_image(data, name)),
+    "add_tree": lambda structure, path, data: structure.add_tree(path, decode_image(data)),
+    "encode": lambda structure: encode_image(structure.directory),
+    "reset": _reset,
+    "load": _load_shard,
+}
+
+
+def _serve_shard(connection) -> None:
+    """
+    Main loop of a shard worker process. It owns one DirectoryStructure and
+    runs each batch of (operation, args) pairs it receives in order,
+    replying with one (ok, result) pair per operation, where result is the
+    packed exception if the operation failed. None stops the worker.
+    """
+    structure = DirectoryStructure()
+    while True:
+        try:
+            batch = connection.recv()
+        except EOFError:
+            break
+        if batch is None:
+            break
+        results = []
+        for operation, args in batch:
+            try:
+                results.append((True, SHARD_OPERATIONS[operation](structure, *args)))
+            except Exception as error:
+                results.append((False, _pack_error(error)))
+        connection.send(results)
+
+
+class ShardedDirectoryStructure:
+    """
+    A tree split over worker processes by top-level directory: each
+    top-level directory and everything below it lives in the shard its name
+    hashes to, and each shard is a DirectoryStructure in its own process.
+
+    Commands on one path go to the shard that owns it. LIST, COUNT, STATS
+    and FIND of the whole tree ask every shard at once and merge the
+    answers. A MOVE between top-level directories owned by different
+    shards encodes the subtree as a tree image, grafts it into the
+    destination shard and then deletes it from the source shard.
+
+    The synchronous methods have the same interface as DirectoryStructure,
+    so this works anywhere a DirectoryStructure does, but each call waits
+    for a round trip to a worker. The shards only work in parallel when
+    commands are handed to them with submit() and their results are
+    gathered later with collect(), as DirectoryManager.run_batch does.
+
+    Transactions are not supported.
+    """
+    LIST_CHUNK_LINES = DirectoryStructure.LIST_CHUNK_LINES
+    CACHE_LISTINGS = False
+
+    def __init__(self, shards: int = None):
+        """
+        Starts the shard workers.
+
+        Args:
+            shards (int, optional): Number of shards (worker processes).
+                Defaults to the number of CPUs.
+        """
+        self.shards = shards or os.cpu_count() or 1
+        self.listeners = []
+        self._held = None
+        self._connections = []
+        self._workers = []
+        for _ in range(self.shards):
+            connection, worker_connection = multiprocessing.Pipe()
+            worker = multiprocessing.Process(target=_serve_shard, args=(worker_connection,), daemon=True)
+            worker.start()
+            worker_connection.close()
+            self._connections.append(connection)
+            self._workers.append(worker)
+        # Submitted but not yet collected: the operations queued for each
+        # shard and the shard of each one in submission order
+        self._queued = [[] for _ in range(self.shards)]
+        self._order = []
+
+    _split = staticmethod(DirectoryStructure._split)
+    _notify = DirectoryStructure._notify
+    _iter_paths = staticmethod(DirectoryStructure._iter_paths)
+    print_directory = DirectoryStructure.print_directory
+
+    def close(self) -> None:
+        """
+        Stops the shard workers.
+        """
+        for connection in self._connections:
+            try:
+                connection.send(None)
+            except OSError:
+                pass
+        for worker, connection in zip(self._workers, self._connections):
+            worker.join(5)
+            connection.close()
+        self._connections = []
+        self._workers = []
+
+    def shard_of(self, path: str) -> int:
+        """
+        Returns the shard that owns a path.
+        """
+        return shard_of(self._split(path)[0], self.shards)
+
+    def _scatter(self, batches: list) -> list:
+        """
+        Sends each shard its batch of operations (if it has one), so they
+        all work at the same time, then waits for every reply.
+
+        Returns:
+            list: The (ok, result) pairs of each shard, or None for shards without a batch
+        """
+        for connection, batch in zip(self._connections, batches):
+            if batch:
+                connection.send(batch)
+        return [connection.recv() if batch else None for connection, batch in zip(self._connections, batches)]
+
+    def _call(self, shard: int, operation: str, *args):
+        """
+        Runs one operation on one shard and waits for its result.
+
+        Raises:
+            Exception: Whatever the operation raised in the shard
+        """
+        if self._order:
+            raise RuntimeError("Submitted commands must be collected first")
+        connection = self._connections[shard]
+        connection.send([(operation, args)])
+        (ok, result), = connection.recv()
+        if not ok:
+            raise _unpack_error(result)
+        return result
+
+    def _broadcast(self, operation: str, *args) -> list:
+        """
+        Runs one operation on every shard in parallel.
+
+        Returns:
+            list: The result of each shard
+
+        Raises:
+            Exception: The first error raised by a shard
+        """
+        results = []
+        for (ok, result), in self._scatter([[(operation, args)]] * self.shards):
+            if not ok:
+                raise _unpack_error(result)
+            results.append(result)
+        return results
+
+    def same_shard(self, *paths) -> bool:
+        """
+        True if every path belongs to the same shard.
+        """
+        return len({self.shard_of(path) for path in paths}) == 1
+
+    def submit(self, operation: str, *paths) -> None:
+        """
+        Queues a CREATE, DELETE or MOVE on the shard that owns its paths,
+        without waiting for it. collect() must be called before any other
+        method.
+
+        Args:
+            operation (str): create_directory, delete_directory or move_directory
+            paths (str): Its arguments, all owned by the same shard
+        """
+        shard = self.shard_of(paths[0])
+        self._queued[shard].append((operation, paths))
+        self._order.append(shard)
+
+    @property
+    def pending(self) -> int:
+        """
+        Number of submitted operations not collected yet.
+        """
+        return len(self._order)
+
+    def collect(self) -> list:
+        """
+        Runs every submitted operation, with all shards working in parallel,
+        and reports the successful ones to the listeners in submission order
+        (between a BEGIN and a COMMIT notification if there are several).
+        Each shard runs its own operations in submission order, and no
+        submitted operation involves more than one shard, so the results
+        are the same as running them one by one.
+
+        Returns:
+            list: For each submitted operation, None if it succeeded or the
+            exception it raised
+        """
+        if not self._order:
+            return []
+        queued = self._queued
+        batches = [[(operation, tuple(map(str, paths))) for operation, paths in batch] for batch in queued]
+        replies = self._scatter(batches)
+        order = self._order
+        self._queued = [[] for _ in range(self.shards)]
+        self._order = []
+
+        positions = [0] * self.shards
+        errors = []
+        done = []
+        for shard in order:
+            position = positions[shard]
+            positions[shard] = position + 1
+            ok, result = replies[shard][position]
+            if ok:
+                errors.append(None)
+                done.append(queued[shard][position])
+            else:
+                errors.append(_unpack_error(result))
+        if done and self.listeners:
+            # Every operation has already run, so several are reported as one
+            # batch, like a transaction: a listener that looks at the tree
+            # (e.g. to take a snapshot) only does so once it matches the events
+            if len(done) > 1:
+                self._notify("BEGIN")
+            for operation, paths in done:
+                self._notify(SUBMITTED_EVENTS[operation], *paths)
+            if len(done) > 1:
+                self._notify("COMMIT")
+        return errors
+
+    @property
+    def directory(self) -> Node:
+        """
+        A copy of the whole tree, gathered from every shard (e.g. for
+        snapshots and SAVE). Directories are only decoded when first visited.
+        """
+        root = Node()
+        for data in self._broadcast("encode"):
+            for _, node in decode_image(data).items():
+                root.attach(node)
+        return root
+
+    def reset(self, root: Node = None) -> None:
+        """
+        Replaces the whole tree, sending each shard the top-level
+        directories it owns.
+
+        Args:
+            root (Node, optional): The new root. Defaults to an empty tree.
+        """
+        if root is None:
+            self._broadcast("reset", None)
+            return
+        shard_roots = [Node() for _ in range(self.shards)]
+        for name, node in list(root.items()):
+            shard_roots[shard_of(name, self.shards)].attach(node)
+        self._scatter([[("reset", (encode_image(shard_root),))] for shard_root in shard_roots])
+
+    def create_directory(self, path: str) -> None:
+        """
+        Creates a directory in the shard that owns it. See DirectoryStructure.create_directory.
+        """
+        self._call(self.shard_of(path), "create_directory", str(path))
+        if self.listeners:
+            self._notify("CREATE", path)
+
+    def create_many(self, paths) -> list:
+        """
+        Creates many directories, with every shard creating its own at the
+        same time. See DirectoryStructure.create_many.
+
+        Returns:
+            list: For each path, None if it was created, or the exception
+            create_directory would have raised for it
+        """
+        if self._order:
+            raise RuntimeError("Submitted commands must be collected first")
+        for path in paths:
+            self.submit("create_directory", path)
+        return self.collect()
+
+    def delete_directory(self, path: str) -> None:
+        """
+        Deletes a directory in the shard that owns it. See DirectoryStructure.delete_directory.
+        """
+        self._call(self.shard_of(path), "delete_directory", str(path))
+        if self.listeners:
+            self._notify("DELETE", path)
+
+    def move_directory(self, source_path: str, dest_path: str) -> None:
+        """
+        Moves a directory. Within one shard this is a plain MOVE in that
+        shard; between shards the subtree is copied to the destination shard
+        as a tree image and then deleted from the source shard.
+
+        Args:
+            source_path (str): Path of directory to move
+            dest_path (str): Destination path for the directory
+
+        Raises:
+            CannotMoveDirectoryError: If the source is moved into itself
+            DirectoryNotFoundError: If the source path doesn't exist
+        """
+        source_shard = self.shard_of(source_path)
+        dest_shard = self.shard_of(dest_path)
+        if source_shard == dest_shard:
+            self._call(source_shard, "move_directory", str(source_path), str(dest_path))
+        else:
+            # Different top-level directories, so the destination cannot be
+            # inside the source
+            data = self._call(source_shard, "export", str(source_path))
+            self._call(dest_shard, "graft", str(dest_path), self._split(source_path)[-1], data)
+            self._call(source_shard, "delete_directory", str(source_path))
+        if self.listeners:
+            self._notify("MOVE", source_path, dest_path)
+
+    def add_tree(self, path: str, node: Node) -> None:
+        """
+        Creates a directory together with a whole subtree below it, sending
+        the subtree to the shard that owns it as a tree image. See
+        DirectoryStructure.add_tree.
+        """
+        self._call(self.shard_of(path), "add_tree", str(path), encode_image(node))
+        if self.listeners:
+            for created in self._iter_paths(path, node):
+                self._notify("CREATE", created)
+
+    def stat_directory(self, path: str = None) -> tuple:
+        """
+        Returns the number of directories below a directory and the number
+        of levels below it. See DirectoryStructure.stat_directory.
+        """
+        if path:
+            return self._call(self.shard_of(path), "stat_directory", str(path))
+        stats = self._broadcast("stat_directory")
+        return sum(descendants for descendants, _ in stats), max(height for _, height in stats)
+
+    def find_directories(self, pattern: str, path: str = None) -> list:
+        """
+        Finds every directory whose name matches a glob pattern, searching
+        all shards at once for the whole tree. See DirectoryStructure.find_directories.
+        """
+        if path:
+            return self._call(self.shard_of(path), "find_directories", pattern, str(path))
+        return list(heapq.merge(*self._broadcast("find_directories", pattern)))
+
+    def export_directory(self, path: str, os_path: str, workers: int = TRANSFER_WORKERS, progress=None) -> tuple:
+        """
+        Creates the directories below a directory on disk. Each shard exports
+        the directories it owns itself, all shards at once for the whole
+        tree, so the tree is never copied between processes. Progress is not
+        reported, since the shards run in other processes. See
+        DirectoryStructure.export_directory.
+        """
+        if path:
+            return self._call(self.shard_of(path), "export_directory", str(path), os_path, workers)
+        results = self._broadcast("export_directory", None, os_path, workers)
+        return sum(count for count, _ in results), sum(skipped for _, skipped in results)
+
+    def iter_directory(self, path: str = None, max_depth: int = None):
+        """
+        Returns the lines of a directory listing. The listing of the whole
+        tree is built by every shard at once and merged by top-level name.
+        See DirectoryStructure.iter_directory.
+        """
+        if path:
+            return iter(self._call(self.shard_of(path), "list", str(path), max_depth))
+        listings = heapq.merge(*self._broadcast("top_lines", max_depth), key=lambda listing: listing[0])
+        return chain.from_iterable(lines for _, lines in listings)
+
+    def iter_entries(self, path: str = None, max_depth: int = None):
+        """
+        Returns the (depth, name) entries of a directory listing, merged by
+        top-level name like iter_directory. See DirectoryStructure.iter_entries.
+        """
+        if path:
+            return iter(self._call(self.shard_of(path), "entries", str(path), max_depth))
+        listings = heapq.merge(*self._broadcast("top_entries", max_depth), key=lambda listing: listing[0])
+        return chain.from_iterable(entries for _, entries in listings)
+
+    def save(self, path: str) -> None:
+        """
+        Saves the whole tree to a file. See DirectoryStructure.save.
+        """
+        write_image(self.directory, path)
+
+    def load(self, path: str) -> None:
+        """
+        Replaces the whole tree with one saved by SAVE, each shard mapping
+        the file and keeping the top-level directories it owns.
+
+        Raises:
+            CorruptDataError: If the file is not a saved tree
+        """
+        # Check the file here, so a bad one fails the same way everywhere
+        load_image(path)
+        results = self._scatter([[("load", (path, shard, self.shards))] for shard in range(self.shards)])
+        for (ok, result), in results:
+            if not ok:
+                raise _unpack_error(result)
+        if self.listeners:
+            self._notify("LOAD", path)
+
+    @property
+    def in_transaction(self) -> bool:
+        return False
+
+    def begin(self) -> None:
+        raise TransactionError("Transactions are not supported on a sharded tree")
+
+    def commit(self) -> None:
+        raise TransactionError("No transaction in progress")
+
+    def rollback(self) -> None:
+        raise TransactionError("No transaction in progress")
@@ -0,0 +1,520 @@
+import tempfile
+import time
+from collections import OrderedDict
+from itertools import count
+
+from directory_structure import DirectoryStructure
+from exceptions import DirectoryNotFoundError
+from filesystem import TRANSFER_WORKERS, export_tree
+from node import ChildLoader, Node
+from tree_image import TreeImage, encode_image
+
+# Depth of the subtrees that are spilled to disk and paged back in as a
+# whole: with 2, each directory two levels below the root is one unit
+SPILL_DEPTH = 2
+# Paths of a bulk CREATE handled between two checks of the budget
+CREATE_CHUNK_PATHS = 1024
+# Bytes of dead records the spill file may hold before it is compacted
+# (once they also outweigh the live records)
+COMPACT_MIN_BYTES = 1 << 20
+
+
+class SpillFile:
+    """
+    An anonymous temporary file holding encoded subtrees, each stored as
+    one record under an integer key. Records are appended, and read back
+    (and dropped) when the subtree is paged in. The file is rewritten with
+    only its live records once the dead ones outweigh them.
+    """
+
+    def __init__(self, directory: str = None):
+        """
+        Args:
+            directory (str, optional): Where to create the file. Defaults to the
+                system's temporary directory.
+        """
+        self.directory = directory
+        self._file = tempfile.TemporaryFile(dir=directory)
+        # Key -> (offset, length)
+        self._records = {}
+        self._end = 0
+        self.live = 0
+
+    def put(self, key: int, data: bytes) -> None:
+        """
+        Appends a record.
+        """
+        self._file.seek(self._end)
+        self._file.write(data)
+        self._records[key] = (self._end, len(data))
+        self._end += len(data)
+        self.live += len(data)
+
+    def take(self, key: int) -> bytes:
+        """
+        Reads a record and drops it.
+        """
+        offset, length = self._records[key]
+        self._file.seek(offset)
+        data = self._file.read(length)
+        self.discard(key)
+        return data
+
+    def discard(self, key: int) -> None:
+        """
+        Drops a record, if there is one.
+        """
+        record = self._records.pop(key, None)
+        if record is None:
+            return
+        self.live -= record[1]
+        if not self._records:
+            self.clear()
+        elif self._end - self.live >= max(self.live, COMPACT_MIN_BYTES):
+            self._compact()
+
+    def clear(self) -> None:
+        """
+        Drops every record.
+        """
+        self._records.clear()
+        self._file.truncate(0)
+        self._end = self.live = 0
+
+    def _compact(self) -> None:
+        """
+        Copies the live records to a new file, in key order.
+        """
+        compacted = tempfile.TemporaryFile(dir=self.directory)
+        end = 0
+        for key in sorted(self._records):
+            offset, length = self._records[key]
+            self._file.seek(offset)
+            compacted.write(self._file.read(length))
+            self._records[key] = (end, length)
+            end += length
+        self._file.close()
+        self._file = compacted
+        self._end = end
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class SpilledChildren(ChildLoader):
+    """
+    The children of a directory whose subtree was spilled to disk.
+    """
+    __slots__ = ("structure", "key")
+
+    def __init__(self, structure: "SpillingDirectoryStructure", key: int):
+        self.structure = structure
+        self.key = key
+
+    def load(self):
+        return self.structure._page_in(self.key)
+
+
+class SpillingDirectoryStructure(DirectoryStructure):
+    """
+    A DirectoryStructure that keeps at most a given number of directories
+    in memory. The tree is divided into units, the directories spill_depth
+    levels below the root with everything below them. Commands mark the
+    units they reach as used; once the tree outgrows the budget, the least
+    recently used units are encoded as tree images, appended to a spill
+    file and replaced by stubs (their Node stays, with its counters, but
+    its children become a ChildLoader). A command or LIST that reaches a
+    stub pages the unit back in, one level at a time, like a LOADed image.
+
+    The budget is checked after every command, every LIST_CHUNK_LINES lines
+    while a listing is produced and every CREATE_CHUNK_PATHS paths of a bulk
+    CREATE, so even a LIST or CREATE larger than the budget stays within it.
+    Directories above the units always stay in memory. The estimate of the
+    directories in memory counts a paged-in unit whole, even though parts of
+    it may still be encoded. Nothing is spilled while a transaction is open.
+
+    FIND builds its name index by loading the whole tree; the index is
+    dropped again when the next unit is spilled. SAVE also loads the whole
+    tree for the time it takes to write it. Listings are not cached, since
+    the cache would keep the text of spilled units in memory.
+
+    Attributes:
+        memory_budget (int): Number of directories to keep in memory
+        spill_depth (int): Depth of the units
+        hits (int): Times a command reached a unit that was in memory (or a
+            stub that it did not need to page in, such as STATS)
+        misses (int): Times a command reached a unit it had to page in
+        page_ins (int): Units paged in, by commands or listings
+        evictions (int): Units spilled to disk
+        page_in_seconds (float): Total time spent paging units in
+        page_in_max (float): Longest time a page-in took, in seconds
+    """
+    CACHE_LISTINGS = False
+
+    def __init__(self, memory_budget: int, spill_dir: str = None, spill_depth: int = SPILL_DEPTH,
+                 path_cache_size: int = DirectoryStructure.PATH_CACHE_SIZE):
+        """
+        Args:
+            memory_budget (int): Number of directories to keep in memory
+            spill_dir (str, optional): Where to create the spill file. Defaults to
+                the system's temporary directory.
+            spill_depth (int, optional): Depth of the units spilled to disk. Defaults to 2.
+            path_cache_size (int, optional): See DirectoryStructure.
+        """
+        super().__init__(path_cache_size)
+        self.memory_budget = memory_budget
+        self.spill_depth = spill_depth
+        self._spill_file = SpillFile(spill_dir)
+        self._keys = count()
+        # The units in memory, least recently used first
+        self._units = OrderedDict()
+        # Key -> stub, and the loaders of stubs that still wait for a LOADed
+        # image rather than the spill file
+        self._stubs = {}
+        self._external = {}
+        self._spilled_directories = 0
+        # DELETEs, MOVEs and ROLLBACKs since the stubs were last checked
+        # for still being in the tree
+        self._removals = 0
+        self.hits = self.misses = self.page_ins = self.evictions = 0
+        self.page_in_seconds = self.page_in_max = 0.0
+
+    def close(self) -> None:
+        """
+        Deletes the spill file.
+        """
+        self._spill_file.close()
+
+    @property
+    def resident_directories(self) -> int:
+        """
+        Estimated number of directories in memory.
+        """
+        return self.directory.descendants - self._spilled_directories
+
+    def memory_stats(self) -> dict:
+        """
+        Returns the budget, the directories in memory and on disk, and the
+        hit, page-in and eviction counters.
+        """
+        return {
+            "budget": self.memory_budget,
+            "directories": self.directory.descendants,
+            "resident": self.resident_directories,
+            "spilled_units": len(self._stubs),
+            "spill_bytes": self._spill_file.live,
+            "hits": self.hits,
+            "misses": self.misses,
+            "page_ins": self.page_ins,
+            "evictions": self.evictions,
+            "page_in_seconds": self.page_in_seconds,
+            "page_in_max": self.page_in_max,
+        }
+
+    def _unit(self, path) -> Node:
+        """
+        Returns the unit a path lies in, or None if the path is too short or
+        the unit does not exist. Only the directories above the unit are
+        read, so a spilled unit is not paged in.
+        """
+        if not path:
+            return None
+        parts = self._split(path)
+        if len(parts) < self.spill_depth:
+            return None
+        return self._find(parts[:self.spill_depth])
+
+    def _run(self, method, paths, *args):
+        """
+        Runs an operation on the given paths, then marks the units they lie
+        in as the most recently used and keeps the budget.
+        """
+        units = []
+        for path in paths:
+            unit = self._unit(path)
+            units.append((unit, unit is not None and unit.loaded))
+        try:
+            return method(*args)
+        finally:
+            for path, (unit, loaded) in zip(paths, units):
+                if unit is None:
+                    unit = self._unit(path)
+                    if unit is None:
+                        continue
+                elif loaded or not unit.loaded:
+                    self.hits += 1
+                else:
+                    self.misses += 1
+                if unit.loaded:
+                    self._units[unit] = None
+                    self._units.move_to_end(unit)
+            self._enforce()
+
+    def _paced(self, items):
+        """
+        Yields the items of a listing, keeping the budget every
+        LIST_CHUNK_LINES items.
+        """
+        for number, item in enumerate(items, 1):
+            yield item
+            if number % self.LIST_CHUNK_LINES == 0:
+                self._enforce()
+        self._enforce()
+
+    def _attached(self, node: Node) -> bool:
+        """
+        True if a node is still in the tree: each of its ancestors holds it
+        (and none of them has been spilled since).
+        """
+        while node.parent is not None:
+            parent = node.parent
+            if not parent.loaded or parent.get(node.name) is not node:
+                return False
+            node = parent
+        return node is self.directory
+
+    def _register(self, node: Node, depth: int) -> None:
+        """
+        Adds the units at or below a directory at the given depth that are
+        not known yet as the least recently used ones, and turns those that
+        still wait for a LOADed image into stubs.
+        """
+        stack = [(node, depth)]
+        while stack:
+            node, depth = stack.pop()
+            if depth < self.spill_depth:
+                stack.extend((child, depth + 1) for _, child in node.items())
+            elif node.loaded:
+                if node.descendants:
+                    self._units[node] = None
+                    self._units.move_to_end(node, last=False)
+            else:
+                key = next(self._keys)
+                self._external[key] = node.unload(SpilledChildren(self, key))
+                self._stubs[key] = node
+                self._spilled_directories += node.descendants
+
+    def _spill(self, unit: Node) -> int:
+        """
+        Writes a unit to the spill file and replaces it with a stub.
+
+        Returns:
+            int: The number of directories that left memory
+        """
+        parts = []
+        node = unit
+        while node.parent is not None:
+            parts.append(node.name)
+            node = node.parent
+        data = encode_image(unit)
+        key = next(self._keys)
+        self._spill_file.put(key, data)
+        self._invalidate(tuple(reversed(parts)))
+        # Unlink the dropped nodes from their parents, so they are freed as
+        # soon as the unit lets go of them rather than left as cycles for
+        # the garbage collector
+        stack = [child for _, child in unit.items()]
+        unit.unload(SpilledChildren(self, key))
+        while stack:
+            node = stack.pop()
+            node.parent = None
+            if node.loaded:
+                stack.extend(child for _, child in node.items())
+        self._stubs[key] = unit
+        self._spilled_directories += unit.descendants
+        # The index refers to the nodes that were just dropped
+        self._name_index = None
+        self.evictions += 1
+        return unit.descendants
+
+    def _page_in(self, key: int) -> dict:
+        """
+        Reads the children of a stub back (called by its SpilledChildren).
+        """
+        start = time.perf_counter()
+        unit = self._stubs.pop(key)
+        external = self._external.pop(key, None)
+        if external is not None:
+            children = external.load()
+        else:
+            children = TreeImage("<spill>", self._spill_file.take(key)).children(0)
+        self._spilled_directories -= unit.descendants
+        self._units[unit] = None
+        self._units.move_to_end(unit)
+        elapsed = time.perf_counter() - start
+        self.page_ins += 1
+        self.page_in_seconds += elapsed
+        self.page_in_max = max(self.page_in_max, elapsed)
+        return children
+
+    def _sweep(self) -> None:
+        """
+        Forgets the stubs that were deleted or replaced, with their records.
+        """
+        for key, stub in list(self._stubs.items()):
+            if not self._attached(stub):
+                del self._stubs[key]
+                if self._external.pop(key, None) is None:
+                    self._spill_file.discard(key)
+                self._spilled_directories -= stub.descendants
+        self._removals = 0
+
+    def _enforce(self) -> None:
+        """
+        Spills the least recently used units until the directories in
+        memory fit in the budget.
+        """
+        if self._undo is not None:
+            return
+        if self._removals > len(self._stubs) // 4:
+            self._sweep()
+        excess = self.resident_directories - self.memory_budget
+        while excess > 0 and self._units:
+            unit, _ = self._units.popitem(last=False)
+            if unit.loaded and unit.descendants and self._attached(unit):
+                excess -= self._spill(unit)
+
+    def reset(self, root: Node = None) -> None:
+        """
+        Replaces the whole tree. See DirectoryStructure.reset.
+        """
+        super().reset(root)
+        self._units.clear()
+        self._stubs.clear()
+        self._external.clear()
+        self._spill_file.clear()
+        self._spilled_directories = self._removals = 0
+        self._register(self.directory, 0)
+
+    def create_directory(self, path: str) -> None:
+        """
+        See DirectoryStructure.create_directory.
+        """
+        self._run(super().create_directory, (path,), path)
+
+    def create_many(self, paths) -> list:
+        """
+        See DirectoryStructure.create_many. The budget is kept every
+        CREATE_CHUNK_PATHS paths, so creating more directories than the budget
+        holds in one call still stays within it.
+        """
+        paths = list(paths)
+        results = []
+        for start in range(0, len(paths), CREATE_CHUNK_PATHS):
+            chunk = paths[start:start + CREATE_CHUNK_PATHS]
+            results.extend(self._run(super().create_many, chunk, chunk))
+        return results
+
+    def move_directory(self, source_path: str, dest_path: str) -> None:
+        """
+        See DirectoryStructure.move_directory.
+        """
+        self._removals += 1
+        self._run(super().move_directory, (source_path, dest_path), source_path, dest_path)
+
+    def delete_directory(self, path: str) -> None:
+        """
+        See DirectoryStructure.delete_directory.
+        """
+        self._removals += 1
+        self._run(super().delete_directory, (path,), path)
+
+    def graft(self, dest_path: str, node: Node) -> None:
+        """
+        See DirectoryStructure.graft.
+        """
+        self._removals += 1
+        self._run(super().graft, (dest_path,), dest_path, node)
+        depth = len(self._split(dest_path)) + 1 if dest_path else 1
+        if depth <= self.spill_depth:
+            self._register(node, depth)
+            self._enforce()
+
+    def add_tree(self, path: str, node: Node) -> None:
+        """
+        See DirectoryStructure.add_tree.
+        """
+        self._run(super().add_tree, (path,), path, node)
+        depth = len(self._split(path))
+        if depth < self.spill_depth:
+            self._register(node, depth)
+            self._enforce()
+
+    def find_directories(self, pattern: str, path: str = None) -> list:
+        """
+        See DirectoryStructure.find_directories.
+        """
+        return self._run(super().find_directories, (path,), pattern, path)
+
+    def stat_directory(self, path: str = None) -> tuple:
+        """
+        See DirectoryStructure.stat_directory.
+        """
+        return self._run(super().stat_directory, (path,), path)
+
+    def export_directory(self, path: str, os_path: str, workers: int = TRANSFER_WORKERS, progress=None) -> tuple:
+        """
+        See DirectoryStructure.export_directory. Above the units, the
+        directories down to the units are created first and then each unit
+        in turn, keeping the budget after each one, so exporting more
+        directories than the budget holds still stays within it.
+        """
+        parts = self._split(path) if path else ()
+        if len(parts) >= self.spill_depth:
+            return self._run(super().export_directory, (path,), path, os_path, workers, progress)
+        node = self._find(parts)
+        if node is None:
+            raise DirectoryNotFoundError(path)
+        start = time.perf_counter()
+        units = []
+        count, skipped = export_tree(node, os_path, workers, progress, self.spill_depth - len(parts), units)
+        for unit, unit_path in units:
+            reporter = None
+            if progress is not None:
+                def reporter(directories, _, done=count):
+                    progress(done + directories, time.perf_counter() - start)
+            created, missed = export_tree(unit, unit_path, workers, reporter)
+            count += created
+            skipped += missed
+            self._enforce()
+        return count, skipped
+
+    def iter_directory(self, path: str = None, max_depth: int = None):
+        """
+        See DirectoryStructure.iter_directory.
+        """
+        return self._paced(super().iter_directory(path, max_depth))
+
+    def iter_entries(self, path: str = None, max_depth: int = None):
+        """
+        See DirectoryStructure.iter_entries.
+        """
+        return self._paced(super().iter_entries(path, max_depth))
+
+    def print_directory(self, path: str = None, max_depth: int = None, offset: int = 0, limit: int = None,
+                        list_format: str = "text") -> None:
+        """
+        See DirectoryStructure.print_directory.
+        """
+        self._run(super().print_directory, (path,), path, max_depth, offset, limit, list_format)
+
+    def commit(self) -> None:
+        """
+        See DirectoryStructure.commit.
+        """
+        super().commit()
+        self._enforce()
+
+    def rollback(self) -> None:
+        """
+        See DirectoryStructure.rollback.
+        """
+        self._removals += 1
+        super().rollback()
+        self._enforce()
+
+    def save(self, path: str) -> None:
+        """
+        See DirectoryStructure.save.
+        """
+        self._run(super().save, (), path)
@@ -0,0 +1,213 @@
+import random
+import sys
+import threading
+import time
+import unittest
+
+from concurrency import ConcurrentDirectoryStructure, ReadWriteLock
+from directory_structure import DirectoryStructure
+from exceptions import TransactionError
+from node import Node
+
+
+class TestReadWriteLock(unittest.TestCase):
+    def test_readers_share_the_lock(self):
+        """Test that several readers can hold the lock at once."""
+        lock = ReadWriteLock()
+        lock.acquire_read()
+        acquired = threading.Event()
+
+        def reader():
+            with lock.read_locked():
+                acquired.set()
+
+        thread = threading.Thread(target=reader)
+        thread.start()
+        self.assertTrue(acquired.wait(5))
+        thread.join()
+        lock.release_read()
+
+    def test_writer_excludes_readers(self):
+        """Test that a writer waits for readers and blocks new ones."""
+        lock = ReadWriteLock()
+        lock.acquire_read()
+        events = []
+
+        def writer():
+            with lock.write_locked():
+                events.append("write")
+
+        thread = threading.Thread(target=writer)
+        thread.start()
+        time.sleep(0.05)
+        self.assertEqual(events, [])
+        lock.release_read()
+        thread.join(5)
+        self.assertEqual(events, ["write"])
+
+
+class TestConcurrentDirectoryStructure(unittest.TestCase):
+    def setUp(self):
+        self.ds = ConcurrentDirectoryStructure()
+
+    def run_threads(self, targets):
+        """Run each target in its own thread and fail if any deadlocks or raises."""
+        errors = []
+
+        def wrapper(target):
+            try:
+                target()
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=wrapper, args=(target,)) for target in targets]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(30)
+            self.assertFalse(thread.is_alive(), "thread did not finish (deadlock?)")
+        self.assertEqual(errors, [])
+
+    def test_behaves_like_directory_structure(self):
+        """Test the basic operations through the locking layer."""
+        self.ds.create_directory("a/b")
+        self.ds.create_directory("c")
+        self.ds.move_directory("a/b", "c")
+        self.ds.delete_directory("a")
+        self.ds.create_many(["d/e", "d/f"])
+        self.assertEqual(list(self.ds.iter_directory()), ["c", "  b", "d", "  e", "  f"])
+        self.assertEqual(list(self.ds.iter_directory("d", max_depth=1)), ["e", "f"])
+        self.assertEqual(list(self.ds.iter_directory(max_depth=1)), ["c", "d"])
+        self.assertEqual(list(self.ds.iter_entries()), [(0, "c"), (1, "b"), (0, "d"), (1, "e"), (1, "f")])
+        self.assertEqual(list(self.ds.iter_entries("d", max_depth=1)), [(0, "e"), (0, "f")])
+
+    def test_transactions_not_supported(self):
+        """Test that BEGIN is refused on the shared tree."""
+        with self.assertRaises(TransactionError):
+            self.ds.begin()
+        self.assertFalse(self.ds.in_transaction)
+
+    def test_disjoint_creates(self):
+        """Test many threads creating directories in their own subtrees."""
+        def worker(index):
+            return lambda: [self.ds.create_directory(f"t{index}/dir{i}/leaf") for i in range(300)]
+
+        self.assertEqual(self.ds.find_directories("leaf"), [])
+        self.run_threads([worker(index) for index in range(8)])
+        self.assertEqual(sum(1 for _ in self.ds.iter_directory()), 8 * (1 + 300 * 2))
+        self.assertEqual(len(self.ds.find_directories("leaf")), 8 * 300)
+        self.assertEqual(self.ds.stat_directory(), (8 * (1 + 300 * 2), 3))
+
+    def test_add_tree_and_graft_lock_their_subtree(self):
+        """Test that IMPORT-style add_tree and graft wait for the subtree lock and run alongside CREATEs."""
+        self.ds.create_directory("t0")
+        lock = self.ds._subtree_lock("t0")
+        lock.acquire_write()
+        subtree = Node()
+        subtree.add_chain(["x"])
+        adder = threading.Thread(target=self.ds.add_tree, args=("t0/new", subtree))
+        adder.start()
+        adder.join(0.1)
+        self.assertTrue(adder.is_alive())
+        lock.release_write()
+        adder.join(5)
+        self.assertFalse(adder.is_alive())
+
+        def worker(index):
+            def run():
+                for i in range(100):
+                    subtree = Node()
+                    subtree.add_chain(["a", "b"])
+                    self.ds.add_tree(f"t{index}/imported{i}", subtree)
+                    self.ds.graft(f"t{index}/grafted", Node(f"g{i}"))
+                    self.ds.create_directory(f"t{index}/created{i}")
+            return run
+
+        self.run_threads([worker(index) for index in range(1, 5)])
+        self.assertEqual(self.ds.stat_directory(), (2 + 1 + 4 * (1 + 100 * 3 + 1 + 100 + 100), 4))
+        self.assertEqual(len(self.ds.find_directories("b")), 4 * 100)
+        self.assertEqual(self.ds.find_directories("g99"), [f"t{index}/grafted/g99" for index in range(1, 5)])
+
+    def test_root_counters_after_parallel_creates(self):
+        """Test that the root's counters add up after parallel CREATEs and DELETEs in different subtrees."""
+        for index in range(8):
+            self.ds.create_directory(f"t{index}")
+
+        def worker(index):
+            def run():
+                for i in range(400):
+                    self.ds.create_directory(f"t{index}/d{i}")
+                    if i % 4 == 0:
+                        self.ds.create_directory(f"t{index}/d{i}/x/y")
+                        self.ds.delete_directory(f"t{index}/d{i}/x")
+            return run
+
+        interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        try:
+            self.run_threads([worker(index) for index in range(8)])
+        finally:
+            sys.setswitchinterval(interval)
+        self.assertEqual(self.ds.directory.descendants, 8 * 401)
+        self.assertEqual(self.ds.directory.descendants, sum(1 for _ in self.ds.iter_directory()))
+        self.assertEqual(self.ds.stat_directory(), (8 * 401, 2))
+        self.assertEqual(self.ds.stat_directory("t3"), (400, 1))
+
+    def test_opposing_moves_do_not_deadlock(self):
+        """Test threads moving directories back and forth between two subtrees."""
+        self.ds.create_directory("left/x")
+        self.ds.create_directory("right/y")
+
+        def shuttle(name, source, dest):
+            def run():
+                for _ in range(300):
+                    self.ds.move_directory(f"{source}/{name}", dest)
+                    self.ds.move_directory(f"{dest}/{name}", source)
+            return run
+
+        self.run_threads([shuttle("x", "left", "right"), shuttle("y", "right", "left")])
+        self.assertEqual(list(self.ds.iter_directory()), ["left", "  x", "right", "  y"])
+
+    def test_stress_against_sequential_model(self):
+        """Test random concurrent operations, with LISTs running alongside, against a sequential run."""
+        def workload(structure, index):
+            rng = random.Random(index)
+            mine = f"w{index}"
+            structure.create_directory(f"{mine}/base")
+            for i in range(400):
+                choice = rng.random()
+                if choice < 0.6:
+                    structure.create_directory(f"{mine}/base/d{i}")
+                elif choice < 0.8:
+                    structure.create_directory(f"shared{index}/tmp{i}")
+                    structure.move_directory(f"shared{index}/tmp{i}", f"{mine}/moved")
+                else:
+                    structure.create_directory(f"{mine}/gone{i}/x")
+                    structure.delete_directory(f"{mine}/gone{i}")
+
+        stop = threading.Event()
+
+        def lister():
+            while not stop.is_set():
+                for _ in self.ds.iter_directory():
+                    pass
+
+        listers = [threading.Thread(target=lister) for _ in range(2)]
+        for thread in listers:
+            thread.start()
+        try:
+            self.run_threads([lambda index=index: workload(self.ds, index) for index in range(6)])
+        finally:
+            stop.set()
+            for thread in listers:
+                thread.join(30)
+
+        expected = DirectoryStructure()
+        for index in range(6):
+            workload(expected, index)
+        self.assertEqual(list(self.ds.iter_directory()), list(expected.iter_directory()))
+        self.assertEqual(self.ds.stat_directory(), expected.stat_directory())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,138 @@
+import io
+import os
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from unittest.mock import patch
+
+from directories import parse_args, run_batch, main
+from directory_manager import DirectoryManager
+
+COMMANDS = [
+    "CREATE fruits",
+    "CREATE fruits/apples",
+    "CREATE fruits",
+    "",
+    "MOVE fruits/apples vegetables",
+    "DELETE vegetables/apples",
+    "DELETE missing/thing",
+    "BOGUS",
+    "LIST",
+]
+
+
+class TestDirectories(unittest.TestCase):
+    def test_parse_args_default(self):
+        """Test that interactive mode is the default."""
+        self.assertIsNone(parse_args([]).batch)
+
+    def test_parse_args_batch(self):
+        """Test parsing the batch option."""
+        self.assertEqual(parse_args(["--batch", "-"]).batch, "-")
+
+    def test_run_batch_matches_interactive(self):
+        """Test that batch mode produces exactly the interactive output."""
+        interactive = io.StringIO()
+        statements = [line for line in COMMANDS if line] + [EOFError]
+        with patch("builtins.input", side_effect=statements):
+            with redirect_stdout(interactive):
+                DirectoryManager().run()
+
+        batch = io.StringIO()
+        report = io.StringIO()
+        count = run_batch(DirectoryManager(), iter(COMMANDS), batch, report)
+
+        self.assertEqual(batch.getvalue(), interactive.getvalue())
+        self.assertEqual(count, len(COMMANDS) - 1)
+        self.assertIn(f"Processed {count} commands", report.getvalue())
+
+    def test_run_batch_stops_at_exit(self):
+        """Test that EXIT ends a batch early."""
+        output = io.StringIO()
+        count = run_batch(DirectoryManager(), ["CREATE a", "EXIT", "CREATE b"], output, None)
+        self.assertEqual(count, 2)
+        self.assertEqual(output.getvalue(), "Exiting...\n")
+
+    def test_main_batch_file(self):
+        """Test replaying a command file through main."""
+        with tempfile.TemporaryDirectory() as tmp:
+            script = os.path.join(tmp, "commands.txt")
+            result = os.path.join(tmp, "output.txt")
+            with open(script, "w") as f:
+                f.write("CREATE a/b\nLIST\n")
+            with open(result, "w") as out, patch("sys.stdout", out), patch("sys.stderr", io.StringIO()):
+                main(["--batch", script])
+            with open(result) as f:
+                self.assertEqual(f.read(), "a\n  b\nExiting...\n")
+
+    def test_main_metrics_file(self):
+        """Test that --metrics-file leaves the metrics in the file on exit."""
+        with tempfile.TemporaryDirectory() as tmp:
+            script = os.path.join(tmp, "commands.txt")
+            metrics_file = os.path.join(tmp, "metrics.prom")
+            with open(script, "w") as f:
+                f.write("CREATE a/b\nCREATE a\n")
+            with open(os.path.join(tmp, "output.txt"), "w") as out, patch("sys.stdout", out), \
+                    patch("sys.stderr", io.StringIO()):
+                main(["--batch", script, "--metrics-file", metrics_file])
+            with open(metrics_file) as f:
+                lines = f.read().splitlines()
+            self.assertIn("directory_nodes 2", lines)
+            self.assertIn('directory_commands_total{command="CREATE"} 2', lines)
+            self.assertIn('directory_command_errors_total{command="CREATE",error="DirectoryAlreadyExistsError"} 1',
+                          lines)
+
+    def test_profile_from_environment(self):
+        """Test that the environment variable turns profiling on."""
+        self.assertFalse(parse_args([]).profile)
+        with patch.dict(os.environ, {"DIRECTORIES_PROFILE": "1"}):
+            self.assertTrue(parse_args([]).profile)
+
+    def test_main_profile_and_slow_log(self):
+        """Test that --profile reports on exit and --slow-log logs slow commands."""
+        with tempfile.TemporaryDirectory() as tmp:
+            script = os.path.join(tmp, "commands.txt")
+            slow_log = os.path.join(tmp, "slow.log")
+            with open(script, "w") as f:
+                f.write("CREATE a/b\nLIST\n")
+            report = io.StringIO()
+            with open(os.path.join(tmp, "output.txt"), "w") as out, patch("sys.stdout", out), \
+                    patch("sys.stderr", report):
+                main(["--batch", script, "--profile", "--slow-log", slow_log, "--slow-threshold", "0"])
+            self.assertIn("Top 25 functions by cumulative time:", report.getvalue())
+            with open(slow_log) as f:
+                self.assertEqual([line.split(" ms ")[1] for line in f.read().splitlines()], ["CREATE a/b", "LIST"])
+
+    def test_main_persistent_engine(self):
+        """Test that the persistent engine gives the same output as the default one."""
+        with tempfile.TemporaryDirectory() as tmp:
+            script = os.path.join(tmp, "commands.txt")
+            result = os.path.join(tmp, "output.txt")
+            with open(script, "w") as f:
+                f.write("\n".join(COMMANDS) + "\n")
+            outputs = []
+            for engine in ("mutable", "persistent"):
+                with open(result, "w") as out, patch("sys.stdout", out), patch("sys.stderr", io.StringIO()):
+                    main(["--batch", script, "--engine", engine])
+                with open(result) as f:
+                    outputs.append(f.read())
+            self.assertEqual(outputs[0], outputs[1])
+
+    def test_main_sharded_engine(self):
+        """Test that the sharded engine gives the same output as the default one."""
+        with tempfile.TemporaryDirectory() as tmp:
+            script = os.path.join(tmp, "commands.txt")
+            result = os.path.join(tmp, "output.txt")
+            with open(script, "w") as f:
+                f.write("\n".join(COMMANDS) + "\n")
+            outputs = []
+            for options in (["--engine", "mutable"], ["--engine", "sharded", "--shards", "2"]):
+                with open(result, "w") as out, patch("sys.stdout", out), patch("sys.stderr", io.StringIO()):
+                    main(["--batch", script, *options])
+                with open(result) as f:
+                    outputs.append(f.read())
+            self.assertEqual(outputs[0], outputs[1])
+
+
+if __name__ == "__main__":
+    unittest.main()
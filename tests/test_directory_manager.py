@@ -1,7 +1,13 @@
+import io
+import os
+import tempfile
 import unittest
+from contextlib import redirect_stdout
 from unittest.mock import MagicMock, patch
 from directory_manager import DirectoryManager
-from exceptions import EmptyStatementError
+from exceptions import EmptyStatementError, InvalidArgumentError, InvalidPathError
+from metrics import Metrics
+from profiling import Profiler
 
 class TestDirectoryManager(unittest.TestCase):
     def setUp(self):
@@ -49,7 +55,7 @@ class TestDirectoryManager(unittest.TestCase):
 
     def test_get_command_usage(self):
         """Test retrieval of command usage strings."""
-        self.assertEqual(self.manager._get_command_usage("CREATE"), "CREATE <path>")
+        self.assertEqual(self.manager._get_command_usage("CREATE"), "CREATE <path> [<path> ...]")
         self.assertEqual(self.manager._get_command_usage("UNKNOWN"), "")
 
     def test_parse_statement_valid(self):
@@ -86,3 +92,187 @@ class TestDirectoryManager(unittest.TestCase):
             with patch("builtins.print") as mock_print:
                 self.manager.run()
                 mock_print.assert_any_call("Exiting...")
+
+    def test_parse_list_args(self):
+        """Test parsing LIST paths and options."""
+        self.assertEqual(self.manager._parse_list_args([]), (None, {}))
+        self.assertEqual(self.manager._parse_list_args(["/root/folder/", "--depth", "2", "--limit", "10"]),
+                         ("root/folder", {"max_depth": 2, "limit": 10}))
+        self.assertEqual(self.manager._parse_list_args(["--offset", "5"]), (None, {"offset": 5}))
+
+    def test_parse_list_args_invalid(self):
+        """Test that invalid LIST arguments are rejected."""
+        for args in (["--depth"], ["--depth", "0"], ["--limit", "x"], ["--bogus", "1"],
+                     ["--depth", "1", "--depth", "2"], ["a", "b"]):
+            with self.assertRaises(InvalidArgumentError):
+                self.manager._parse_list_args(args)
+        with self.assertRaises(InvalidPathError):
+            self.manager._parse_list_args(["root|folder"])
+
+    def test_parse_list_args_format(self):
+        """Test parsing the LIST output format, which json does not allow to paginate."""
+        self.assertEqual(self.manager._parse_list_args(["--format", "NDJSON", "--limit", "3"]),
+                         (None, {"list_format": "ndjson", "limit": 3}))
+        for args in (["--format"], ["--format", "xml"], ["--format", "json", "--offset", "1"],
+                     ["--limit", "1", "--format", "json"], ["--format", "text", "--format", "paths"]):
+            with self.assertRaises(InvalidArgumentError):
+                self.manager._parse_list_args(args)
+
+    def test_list_directory(self):
+        """Test that LIST passes the parsed options to the structure."""
+        self.manager.structure = MagicMock()
+        self.manager.list_directory("root", "--depth", "1")
+        self.manager.structure.print_directory.assert_called_with("root", max_depth=1)
+
+    def test_process_list_invalid_option(self):
+        """Test that LIST option errors are printed."""
+        self.manager.command_map["LIST"] = self.manager.list_directory
+        with patch("builtins.print") as mock_print:
+            self.manager.process("LIST", ["--depth", "zero"])
+            mock_print.assert_called_with("Invalid option value: --depth zero")
+
+    def test_create_directories_reports_each_error(self):
+        """Test that CREATE with several paths prints one error per failing path."""
+        manager = DirectoryManager()
+        with patch("builtins.print") as mock_print:
+            manager.process("CREATE", ["a", "a/b", "a", "c"])
+        mock_print.assert_called_once_with("Directory already exists: a")
+        self.assertEqual(list(manager.structure.iter_directory()), ["a", "  b", "c"])
+
+    def test_count_and_stats(self):
+        """Test the COUNT and STATS commands."""
+        manager = DirectoryManager()
+        manager.process("CREATE", ["a/b/c", "a/d"])
+        with patch("builtins.print") as mock_print:
+            manager.process("COUNT", ["/a/"])
+            mock_print.assert_called_with(3)
+            manager.process("COUNT", [])
+            mock_print.assert_called_with(4)
+            manager.process("STATS", ["a"])
+            mock_print.assert_called_with("descendants: 3, depth: 2")
+            manager.process("STATS", ["missing"])
+            mock_print.assert_called_with("Directory not found: missing")
+
+    def test_find(self):
+        """Test the FIND command and its argument errors."""
+        manager = DirectoryManager()
+        manager.process("CREATE", ["a/lib", "b/lib", "b/c"])
+        output = io.StringIO()
+        with redirect_stdout(output):
+            manager.process("FIND", ["lib"])
+            manager.process("FIND", ["l*", "UNDER", "/b/"])
+            manager.process("FIND", ["lib", "below", "b"])
+            manager.process("FIND", ["lib", "under"])
+        self.assertEqual(output.getvalue().splitlines(), [
+            "a/lib", "b/lib",
+            "b/lib",
+            "Unexpected argument: below",
+            "Invalid number of arguments for FIND",
+            "Usage: FIND <pattern> [under <path>]",
+        ])
+
+    def test_transaction_commit_and_rollback(self):
+        """Test BEGIN ... COMMIT and BEGIN ... ROLLBACK."""
+        manager = DirectoryManager()
+        output = io.StringIO()
+        with redirect_stdout(output):
+            manager.run_batch(["BEGIN", "CREATE a", "CREATE b", "COMMIT",
+                               "BEGIN", "DELETE a", "CREATE c", "ROLLBACK", "COMMIT", "LIST"])
+        self.assertEqual(output.getvalue().splitlines(), ["No transaction in progress", "a", "b", "Exiting..."])
+
+    def test_transaction_rolled_back_on_error(self):
+        """Test that a failing command rolls back the transaction and later ones are ignored."""
+        manager = DirectoryManager()
+        output = io.StringIO()
+        with redirect_stdout(output):
+            manager.run_batch(["CREATE keep", "BEGIN", "CREATE x", "CREATE x", "DELETE keep", "MOVE a b",
+                               "COMMIT", "LIST"])
+        self.assertEqual(output.getvalue().splitlines(), [
+            "Directory already exists: x",
+            "Transaction rolled back",
+            "Ignored, the transaction was rolled back: DELETE",
+            "Ignored, the transaction was rolled back: MOVE",
+            "Transaction was rolled back, nothing committed",
+            "keep",
+            "Exiting...",
+        ])
+
+    def test_open_transaction_rolled_back_on_exit(self):
+        """Test that ending the session inside a transaction discards it."""
+        manager = DirectoryManager()
+        output = io.StringIO()
+        with redirect_stdout(output):
+            manager.run_batch(["BEGIN", "CREATE a", "EXIT"])
+        self.assertEqual(output.getvalue().splitlines(), ["Transaction rolled back", "Exiting..."])
+        self.assertEqual(list(manager.structure.iter_directory()), [])
+
+    def test_import_and_export(self):
+        """Test IMPORT from and EXPORT to temporary directories on disk."""
+        with tempfile.TemporaryDirectory() as tmp:
+            for path in ("a/b", "c", "a/two words", "c/new\nline"):
+                os.makedirs(os.path.join(tmp, "source", path))
+            manager = DirectoryManager()
+            output = io.StringIO()
+            with redirect_stdout(output), patch("sys.stderr", io.StringIO()):
+                manager.run_batch([f"IMPORT {tmp}/source x/y", f"IMPORT {tmp}/source x/y", f"IMPORT {tmp}/none z",
+                                   "IMPORT /tmp x//", "LIST", f"EXPORT x {tmp}/target", f"EXPORT q {tmp}/target"])
+            lines = output.getvalue().splitlines()
+            self.assertRegex(lines[0], r"^Imported 3 directories in \d+\.\d{3}s \(\d+ directories/s\), skipped 2$")
+            self.assertRegex(lines[9], r"^Exported 4 directories in ")
+            self.assertEqual(lines[1:9] + lines[10:], [
+                "Directory already exists: x/y",
+                f"Directory not found: {tmp}/none",
+                "Invalid path: x//",
+                "x", "  y", "    a", "      b", "    c",
+                "Directory not found: q",
+                "Exiting...",
+            ])
+            self.assertTrue(os.path.isdir(os.path.join(tmp, "target", "y", "a", "b")))
+
+    def test_metrics(self):
+        """Test that process records every command, its errors and the node count."""
+        manager = DirectoryManager(metrics=Metrics())
+        output = io.StringIO()
+        with redirect_stdout(output):
+            manager.run_batch(["CREATE a/b", "CREATE a", "CREATE c d", "MOVE a/x c", "FROB", "LIST q r",
+                               "CREATE bad|name"])
+        commands = manager.metrics.commands
+        self.assertEqual(commands["CREATE"].count, 4)
+        self.assertEqual(commands["CREATE"].errors, {"DirectoryAlreadyExistsError": 1, "InvalidPathError": 1})
+        self.assertEqual(commands["MOVE"].errors, {"DirectoryNotFoundError": 1})
+        self.assertEqual(commands["UNKNOWN"].errors, {"UnknownCommand": 1})
+        self.assertEqual(commands["LIST"].errors, {"InvalidArgumentError": 1})
+
+        output = io.StringIO()
+        with redirect_stdout(output):
+            manager.process("METRICS", [])
+        lines = output.getvalue().splitlines()
+        self.assertEqual(lines[0], "nodes: 4")
+        self.assertTrue(lines[1].startswith("CREATE: 4 calls, avg "))
+
+        output = io.StringIO()
+        with redirect_stdout(output):
+            DirectoryManager().process("METRICS", [])
+        self.assertEqual(output.getvalue(), "Metrics are not enabled\n")
+
+    def test_profile_dump(self):
+        """Test PROFILE DUMP with and without a profiler."""
+        manager = DirectoryManager(profiler=Profiler())
+        output = io.StringIO()
+        with redirect_stdout(output):
+            manager.process("CREATE", ["a"])
+            manager.process("PROFILE", ["dump"])
+            DirectoryManager().process("PROFILE", ["DUMP"])
+            manager.process("PROFILE", ["START"])
+        lines = output.getvalue().splitlines()
+        self.assertEqual(lines[0], "Top 25 functions by cumulative time:")
+        self.assertIn("create_directory", output.getvalue())
+        self.assertEqual(lines[-2:], ["Profiling is not enabled", "Unknown PROFILE action: START"])
+        manager.profiler.close()
+
+    def test_process_normalizes_paths(self):
+        """Test that paths are parsed and normalized before reaching the structure."""
+        manager = DirectoryManager()
+        manager.process("CREATE", ["/root//folder/"])
+        manager.process("MOVE", ["root/folder/", "/other"])
+        self.assertEqual(list(manager.structure.iter_directory()), ["other", "  folder", "root"])
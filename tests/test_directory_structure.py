@@ -1,6 +1,7 @@
+import sys
 import unittest
-from directory_structure import DirectoryStructure
-from exceptions import InvalidPathError, DirectoryNotFoundError, CannotMoveDirectoryError, RootDirectoryError, CannotDeleteDirectoryError, DirectoryAlreadyExistsError
+from directory_structure import DirectoryStructure, Node
+from exceptions import InvalidPathError, DirectoryNotFoundError, CannotMoveDirectoryError, RootDirectoryError, CannotDeleteDirectoryError, DirectoryAlreadyExistsError, TransactionError
 
 
 class TestDirectoryStructure(unittest.TestCase):
@@ -20,12 +21,92 @@ class TestDirectoryStructure(unittest.TestCase):
         with self.assertRaises(InvalidPathError):
             self.ds.create_directory("root//folder1")
 
+    def test_create_directory_invalid_path_creates_nothing(self):
+        """Test that an invalid path leaves no partially created directories."""
+        with self.assertRaises(InvalidPathError):
+            self.ds.create_directory("root/folder1//folder2")
+        self.assertNotIn("root", self.ds.directory)
+
+    def test_listeners_notified_of_mutations(self):
+        """Test that listeners see every successful mutation."""
+        events = []
+        self.ds.listeners.append(lambda *event: events.append(event))
+        self.ds.create_directory("root/a")
+        self.ds.move_directory("root/a", "other")
+        self.ds.delete_directory("other")
+        with self.assertRaises(DirectoryAlreadyExistsError):
+            self.ds.create_directory("root")
+        self.assertEqual(events, [("CREATE", "root/a"), ("MOVE", "root/a", "other"), ("DELETE", "other")])
+
+    def test_create_directory_parsed_path(self):
+        """Test that pre-parsed paths are used without splitting them again."""
+        from paths import parse_path
+        self.ds.create_directory(parse_path("root/folder1"))
+        self.assertIn("folder1", self.ds.directory["root"])
+        with self.assertRaises(DirectoryAlreadyExistsError) as context:
+            self.ds.create_directory(parse_path("/root/folder1/"))
+        self.assertEqual(str(context.exception), "Directory already exists: root/folder1")
+
     def test_create_directory_already_exists(self):
         """Test creating a directory that already exists."""
         self.ds.create_directory("root/folder1")
         with self.assertRaises(DirectoryAlreadyExistsError):
             self.ds.create_directory("root/folder1")
 
+    def test_add_tree(self):
+        """Test adding a whole detached subtree as one new directory."""
+        self.ds.create_directory("a/keep")
+        self.ds.find_directories("*")
+        events = []
+        self.ds.listeners.append(lambda *event: events.append(event))
+        subtree = Node()
+        subtree.add_chain(["x", "y"])
+        subtree.add_child("z")
+        self.ds.add_tree("a/b/new", subtree)
+        self.assertEqual(subtree.name, "new")
+        self.assertEqual(list(self.ds.iter_directory()), ["a", "  b", "    new", "      x", "        y", "      z",
+                                                          "  keep"])
+        self.assertEqual(self.ds.stat_directory(), (7, 5))
+        self.assertEqual(self.ds.find_directories("y"), ["a/b/new/x/y"])
+        self.assertEqual(events, [("CREATE", "a/b/new"), ("CREATE", "a/b/new/x"), ("CREATE", "a/b/new/x/y"),
+                                  ("CREATE", "a/b/new/z")])
+        with self.assertRaises(DirectoryAlreadyExistsError):
+            self.ds.add_tree("a/b", Node())
+        with self.assertRaises(InvalidPathError):
+            self.ds.add_tree("a//c", Node())
+
+        self.ds.begin()
+        self.ds.add_tree("c/d", Node())
+        self.ds.rollback()
+        self.assertEqual(self.ds.stat_directory(), (7, 5))
+        self.assertEqual(self.ds.find_directories("d"), [])
+
+    def test_create_many(self):
+        """Test creating many directories with per-path errors."""
+        errors = self.ds.create_many(["root/a/b", "root/a/c", "root/a", "root//x", "root/a/b/c", "other"])
+        self.assertEqual([type(error) if error else None for error in errors],
+                         [None, None, DirectoryAlreadyExistsError, InvalidPathError, None, None])
+        self.assertEqual(list(self.ds.iter_directory()),
+                         ["other", "root", "  a", "    b", "      c", "    c"])
+
+    def test_create_many_matches_create_directory(self):
+        """Test that create_many gives the same results as a create_directory loop."""
+        import random
+        rng = random.Random(3)
+        paths = ["/".join(rng.choice("abc") for _ in range(rng.randint(1, 5))) for _ in range(500)]
+        paths += ["a//b", ""]
+        looped = DirectoryStructure()
+        expected = []
+        for path in paths:
+            try:
+                looped.create_directory(path)
+                expected.append(None)
+            except Exception as e:
+                expected.append((type(e), str(e)))
+        errors = self.ds.create_many(paths)
+        self.assertEqual([(type(e), str(e)) if e else None for e in errors], expected)
+        self.assertEqual(list(self.ds.iter_directory()), list(looped.iter_directory()))
+
     def test_move_directory_success(self):
         """Test moving a directory successfully."""
         self.ds.create_directory("root/source/folder")
@@ -45,6 +126,47 @@ class TestDirectoryStructure(unittest.TestCase):
         with self.assertRaises(CannotMoveDirectoryError):
             self.ds.move_directory("root/source", "root/source/folder")
 
+    def test_move_directory_to_sibling_with_common_prefix(self):
+        """Test that a destination whose name merely starts with the source's is allowed."""
+        self.ds.create_directory("a/b/x")
+        self.ds.create_directory("a/bc")
+        self.ds.move_directory("a/b", "a/bc")
+        self.assertEqual(list(self.ds.iter_directory()), ["a", "  bc", "    b", "      x"])
+
+    def test_move_directory_below_itself(self):
+        """Test that moving into a missing directory below the source creates nothing."""
+        self.ds.create_directory("a/b")
+        with self.assertRaises(CannotMoveDirectoryError):
+            self.ds.move_directory("a", "a/b/c/d")
+        with self.assertRaises(CannotMoveDirectoryError):
+            self.ds.move_directory("a/b", "a/b")
+        self.assertEqual(list(self.ds.iter_directory()), ["a", "  b"])
+
+    def test_move_directory_into_own_parent(self):
+        """Test that moving a directory into the directory it is in changes nothing."""
+        events = []
+        self.ds.listeners.append(lambda *event: events.append(event))
+        self.ds.create_directory("a/b/c")
+        self.ds.move_directory("a/b", "a")
+        self.assertEqual(list(self.ds.iter_directory()), ["a", "  b", "    c"])
+        self.assertEqual(self.ds.find_directories("c"), ["a/b/c"])
+        self.assertEqual(events, [("CREATE", "a/b/c")])
+
+    def test_move_deep_subtree(self):
+        """Test moving subtrees of a tree far deeper than the recursion limit."""
+        depth = sys.getrecursionlimit() * 5
+        self.ds.create_directory("/".join(["left"] + ["n"] * (depth - 1)))
+        self.ds.create_directory("right")
+        self.ds.move_directory("left/n", "right")
+        self.assertEqual(self.ds.stat_directory("right"), (depth - 1, depth - 1))
+        deep = "/".join(["right"] + ["n"] * (depth - 2))
+        with self.assertRaises(CannotMoveDirectoryError):
+            self.ds.move_directory("right/n", deep)
+        self.ds.move_directory(deep, "left")
+        self.assertEqual(self.ds.stat_directory(), (depth + 1, depth - 2))
+        self.assertEqual(self.ds.stat_directory("left"), (2, 2))
+        self.assertEqual(sum(1 for _ in self.ds.iter_directory()), depth + 1)
+
     def test_delete_directory_success(self):
         """Test deleting a directory successfully."""
         self.ds.create_directory("root/folder1/folder2")
@@ -78,3 +200,352 @@ class TestDirectoryStructure(unittest.TestCase):
   folder3
 """
         self.assertEqual(printed_output.strip(), expected_output.strip())
+
+    def test_leaf_nodes_have_no_child_map(self):
+        """Test that child maps are only allocated for non-empty directories."""
+        self.ds.create_directory("root/folder1")
+        self.assertIsNotNone(self.ds.directory["root"].children)
+        self.assertIsNone(self.ds.directory["root"]["folder1"].children)
+        self.ds.delete_directory("root/folder1")
+        self.assertIsNone(self.ds.directory["root"].children)
+
+    def test_node_names_are_interned(self):
+        """Test that equal component names share one string object."""
+        self.ds.create_directory("a/" + "".join(["sh", "ared"]))
+        self.ds.create_directory("b/" + "".join(["sha", "red"]))
+        self.assertIs(self.ds.directory["a"]["shared"].name, self.ds.directory["b"]["shared"].name)
+
+    def test_node_mapping_interface(self):
+        """Test that a Node can be read like a mapping of its children."""
+        node = Node("parent")
+        child = node.add_child("child")
+        self.assertIn("child", node)
+        self.assertIs(node["child"], child)
+        self.assertEqual(len(node), 1)
+        self.assertEqual(list(node), ["child"])
+        self.assertIsNone(node.get("missing"))
+        with self.assertRaises(KeyError):
+            node.detach("missing")
+
+    def test_path_cache_serves_repeated_prefixes(self):
+        """Test that resolved parent directories are cached."""
+        self.ds.create_directory("root/deep/folder1")
+        self.ds.create_directory("root/deep/folder2")
+        self.assertIs(self.ds._cached(("root", "deep")), self.ds.directory["root"]["deep"])
+        self.assertIn("folder2", self.ds.directory["root"]["deep"])
+
+    def test_path_cache_invalidated_on_delete(self):
+        """Test that deleting a directory drops cached paths below it."""
+        self.ds.create_directory("root/deep/folder1")
+        self.ds.create_directory("root/deep/folder2")
+        self.ds.delete_directory("root/deep")
+        self.assertIsNone(self.ds._cached(("root", "deep")))
+        self.ds.create_directory("root/deep/folder3")
+        self.assertEqual(list(self.ds.directory["root"]["deep"]), ["folder3"])
+
+    def test_path_cache_invalidated_on_move(self):
+        """Test that moving a directory drops cached paths below it."""
+        self.ds.create_directory("root/source/inner/a")
+        self.ds.create_directory("root/source/inner/b")
+        self.ds.move_directory("root/source", "root/destination")
+        with self.assertRaises(CannotDeleteDirectoryError):
+            self.ds.delete_directory("root/source/inner/a")
+        self.ds.create_directory("root/destination/source/inner/c")
+        self.assertEqual(sorted(self.ds.directory["root"]["destination"]["source"]["inner"]), ["a", "b", "c"])
+
+    def test_path_cache_is_bounded(self):
+        """Test that the path cache evicts least recently used entries."""
+        ds = DirectoryStructure(path_cache_size=2)
+        for i in range(5):
+            ds.create_directory(f"dir{i}/child")
+        self.assertEqual(len(ds._path_cache), 2)
+        self.assertEqual(ds._cached_paths, sorted(ds._path_cache))
+
+    def test_path_cache_matches_uncached_structure(self):
+        """Test that random operations give the same tree with and without the cache."""
+        import random
+        rng = random.Random(7)
+        cached, uncached = DirectoryStructure(path_cache_size=8), DirectoryStructure(path_cache_size=0)
+        names = ["a", "b", "c"]
+        for _ in range(2000):
+            path = "/".join(rng.choice(names) for _ in range(rng.randint(1, 4)))
+            other = "/".join(rng.choice(names) for _ in range(rng.randint(1, 3)))
+            operation = rng.choice(["create", "create", "delete", "move"])
+            outcomes = []
+            for ds in (cached, uncached):
+                try:
+                    if operation == "create":
+                        ds.create_directory(path)
+                    elif operation == "delete":
+                        ds.delete_directory(path)
+                    else:
+                        ds.move_directory(path, other)
+                    outcomes.append(None)
+                except Exception as e:
+                    outcomes.append(type(e))
+            self.assertEqual(outcomes[0], outcomes[1])
+        self.assertEqual(self._listing(cached), self._listing(uncached))
+
+    def _listing(self, ds):
+        import io
+        from contextlib import redirect_stdout
+        output = io.StringIO()
+        with redirect_stdout(output):
+            ds.print_directory()
+        return output.getvalue()
+
+    def test_iter_directory_subtree_and_depth(self):
+        """Test listing a subtree with a depth limit."""
+        self.ds.create_directory("root/folder1/folder2/folder3")
+        self.ds.create_directory("root/folder1/other")
+        self.assertEqual(list(self.ds.iter_directory("root/folder1")),
+                         ["folder2", "  folder3", "other"])
+        self.assertEqual(list(self.ds.iter_directory("root", max_depth=2)),
+                         ["folder1", "  folder2", "  other"])
+
+    def test_iter_directory_not_found(self):
+        """Test listing a subtree that doesn't exist."""
+        with self.assertRaises(DirectoryNotFoundError):
+            list(self.ds.iter_directory("missing"))
+
+    def test_iter_directory_is_not_recursive(self):
+        """Test that listing a tree deeper than the recursion limit works."""
+        import sys
+        depth = sys.getrecursionlimit() + 100
+        self.ds.create_directory("/".join(["d"] * depth))
+        lines = list(self.ds.iter_directory())
+        self.assertEqual(len(lines), depth)
+        self.assertEqual(lines[-1], "  " * (depth - 1) + "d")
+
+    def test_print_directory_pagination(self):
+        """Test printing a page of the listing in small chunks."""
+        for i in range(10):
+            self.ds.create_directory(f"dir{i}")
+        self.ds.LIST_CHUNK_LINES = 3
+        import io
+        from contextlib import redirect_stdout
+        output = io.StringIO()
+        with redirect_stdout(output):
+            self.ds.print_directory(offset=2, limit=5)
+        self.assertEqual(output.getvalue(), "dir2\ndir3\ndir4\ndir5\ndir6\n")
+
+    def test_print_directory_formats(self):
+        """Test printing a listing as paths, NDJSON and one streamed JSON document."""
+        import io
+        import json
+        from contextlib import redirect_stdout
+        for path in ("a/b/c", "a/d", "e"):
+            self.ds.create_directory(path)
+        self.ds.LIST_CHUNK_LINES = 2
+        outputs = {}
+        for list_format in ("paths", "ndjson", "json"):
+            output = io.StringIO()
+            with redirect_stdout(output):
+                self.ds.print_directory("a", list_format=list_format)
+            outputs[list_format] = output.getvalue()
+        self.assertEqual(outputs["paths"], "a/b\na/b/c\na/d\n")
+        self.assertEqual([json.loads(line) for line in outputs["ndjson"].splitlines()],
+                         [{"path": "a/b", "name": "b", "depth": 0}, {"path": "a/b/c", "name": "c", "depth": 1},
+                          {"path": "a/d", "name": "d", "depth": 0}])
+        self.assertEqual(json.loads(outputs["json"]), [{"name": "b", "children": [{"name": "c", "children": []}]},
+                                                       {"name": "d", "children": []}])
+        self.assertEqual(list(self.ds.iter_entries(max_depth=2)), [(0, "a"), (1, "b"), (1, "d"), (0, "e")])
+        with self.assertRaises(ValueError):
+            self.ds.print_directory(limit=1, list_format="json")
+
+    def test_sorted_children_cached_until_changed(self):
+        """Test that the sorted view of a directory is reused until it changes."""
+        self.ds.create_directory("root/b")
+        self.ds.create_directory("root/a")
+        root = self.ds.directory["root"]
+        view = root.sorted_items()
+        self.assertEqual([name for name, _ in view], ["a", "b"])
+        self.assertIs(root.sorted_items(), view)
+        self.ds.create_directory("root/0")
+        self.assertEqual([name for name, _ in root.sorted_items()], ["0", "a", "b"])
+        self.ds.create_directory("other/z")
+        other = self.ds.directory["other"]
+        self.assertEqual([name for name, _ in other.sorted_items()], ["z"])
+        self.ds.move_directory("root/a", "other")
+        self.assertEqual([name for name, _ in root.sorted_items()], ["0", "b"])
+        self.assertEqual([name for name, _ in other.sorted_items()], ["a", "z"])
+        self.ds.delete_directory("root/b")
+        self.assertEqual([name for name, _ in root.sorted_items()], ["0"])
+
+    def test_child_loader_requires_load(self):
+        """Test that a ChildLoader without load() cannot be created."""
+        from node import ChildLoader
+
+        class Incomplete(ChildLoader):
+            __slots__ = ()
+
+        with self.assertRaises(TypeError):
+            Incomplete()
+
+    def _check_counters(self, node, parent=None):
+        """Checks every node's counters and parent pointer against a full walk."""
+        self.assertIs(node.parent, parent)
+        descendants = height = 0
+        for _, child in node.items():
+            child_descendants, child_height = self._check_counters(child, node)
+            descendants += child_descendants + 1
+            height = max(height, child_height + 1)
+        self.assertEqual((node.descendants, node.height), (descendants, height), node.name)
+        return descendants, height
+
+    def test_stat_directory(self):
+        """Test reading the subtree counters of a directory."""
+        self.ds.create_directory("root/a/b/c")
+        self.ds.create_directory("root/d")
+        self.assertEqual(self.ds.stat_directory(), (5, 4))
+        self.assertEqual(self.ds.stat_directory("root"), (4, 3))
+        self.assertEqual(self.ds.stat_directory("root/d"), (0, 0))
+        self.ds.delete_directory("root/a")
+        self.assertEqual(self.ds.stat_directory("root"), (1, 1))
+        with self.assertRaises(DirectoryNotFoundError):
+            self.ds.stat_directory("missing")
+
+    def test_counters_match_brute_force(self):
+        """Test the subtree counters against a full walk after random operations."""
+        import random
+        rng = random.Random(13)
+        names = ["a", "b", "c"]
+        for _ in range(100):
+            ds = DirectoryStructure(path_cache_size=rng.choice([0, 8]))
+            for _ in range(30):
+                path = "/".join(rng.choice(names) for _ in range(rng.randint(1, 4)))
+                other = "/".join(rng.choice(names) for _ in range(rng.randint(1, 3)))
+                operation = rng.choice(["create", "create", "create_many", "delete", "move"])
+                try:
+                    if operation == "create":
+                        ds.create_directory(path)
+                    elif operation == "create_many":
+                        ds.create_many([path, other, path + "/x"])
+                    elif operation == "delete":
+                        ds.delete_directory(path)
+                    else:
+                        ds.move_directory(path, other)
+                except Exception:
+                    pass
+                self._check_counters(ds.directory)
+
+    def test_find_directories(self):
+        """Test finding directories by name and glob, optionally below a path."""
+        for path in ("src/lib", "src/app/lib", "docs/lib", "doc"):
+            self.ds.create_directory(path)
+        self.assertEqual(self.ds.find_directories("lib"), ["docs/lib", "src/app/lib", "src/lib"])
+        self.assertEqual(self.ds.find_directories("doc*"), ["doc", "docs"])
+        self.assertEqual(self.ds.find_directories("lib", "src"), ["src/app/lib", "src/lib"])
+        self.assertEqual(self.ds.find_directories("src", "src"), [])
+        with self.assertRaises(DirectoryNotFoundError):
+            self.ds.find_directories("lib", "missing")
+
+    def test_find_matches_brute_force(self):
+        """Test the maintained name index against a full walk after random operations."""
+        import fnmatch
+        import random
+        rng = random.Random(14)
+        names = ["a", "b", "ab"]
+        patterns = names + ["a*", "*b", "?"]
+        for _ in range(100):
+            ds = DirectoryStructure(path_cache_size=rng.choice([0, 8]))
+            ds.find_directories("a")
+            for _ in range(30):
+                path = "/".join(rng.choice(names) for _ in range(rng.randint(1, 4)))
+                other = "/".join(rng.choice(names) for _ in range(rng.randint(1, 3)))
+                operation = rng.choice(["create", "create", "create_many", "delete", "move"])
+                try:
+                    if operation == "create":
+                        ds.create_directory(path)
+                    elif operation == "create_many":
+                        ds.create_many([path, other, path + "/a"])
+                    elif operation == "delete":
+                        ds.delete_directory(path)
+                    else:
+                        ds.move_directory(path, other)
+                except Exception:
+                    pass
+                walked = []
+                stack = [("", ds.directory)]
+                while stack:
+                    prefix, node = stack.pop()
+                    for name, child in node.items():
+                        walked.append((name, prefix + name))
+                        stack.append((prefix + name + "/", child))
+                for pattern in patterns:
+                    expected = sorted(path for name, path in walked if fnmatch.fnmatchcase(name, pattern))
+                    self.assertEqual(ds.find_directories(pattern), expected, (operation, path, other))
+
+    def test_transaction_commit_holds_notifications(self):
+        """Test that listeners hear about a transaction only once it commits."""
+        events = []
+        self.ds.listeners.append(lambda *event: events.append(event))
+        self.ds.begin()
+        self.ds.create_directory("a/b")
+        self.ds.move_directory("a/b", "c")
+        self.assertEqual(events, [])
+        self.ds.commit()
+        self.assertEqual(events, [("BEGIN",), ("CREATE", "a/b"), ("MOVE", "a/b", "c"), ("COMMIT",)])
+        self.assertFalse(self.ds.in_transaction)
+
+    def test_transaction_errors(self):
+        """Test BEGIN/COMMIT/ROLLBACK out of order and SAVE/LOAD inside a transaction."""
+        with self.assertRaises(TransactionError):
+            self.ds.commit()
+        with self.assertRaises(TransactionError):
+            self.ds.rollback()
+        self.ds.begin()
+        with self.assertRaises(TransactionError):
+            self.ds.begin()
+        with self.assertRaises(TransactionError):
+            self.ds.save("unused.img")
+        with self.assertRaises(TransactionError):
+            self.ds.load("unused.img")
+        self.ds.rollback()
+
+    def test_rollback_restores_everything(self):
+        """Test that ROLLBACK after random operations restores the tree, counters, index and cache."""
+        import random
+        rng = random.Random(15)
+        names = ["a", "b", "ab"]
+        for _ in range(100):
+            ds = DirectoryStructure(path_cache_size=8)
+            for _ in range(10):
+                try:
+                    ds.create_directory("/".join(rng.choice(names) for _ in range(rng.randint(1, 4))))
+                except Exception:
+                    pass
+            if rng.random() < 0.5:
+                ds.find_directories("a")
+            before = list(ds.iter_directory())
+            found = ds.find_directories("a*")
+            events = []
+            ds.listeners.append(lambda *event: events.append(event))
+
+            ds.begin()
+            for _ in range(15):
+                path = "/".join(rng.choice(names) for _ in range(rng.randint(1, 4)))
+                other = "/".join(rng.choice(names) for _ in range(rng.randint(1, 3)))
+                operation = rng.choice(["create", "create_many", "delete", "move"])
+                try:
+                    if operation == "create":
+                        ds.create_directory(path)
+                    elif operation == "create_many":
+                        ds.create_many([path, other])
+                    elif operation == "delete":
+                        ds.delete_directory(path)
+                    else:
+                        ds.move_directory(path, other)
+                except Exception:
+                    pass
+            ds.rollback()
+
+            self.assertEqual(list(ds.iter_directory()), before)
+            self.assertEqual(ds.find_directories("a*"), found)
+            self._check_counters(ds.directory)
+            self.assertEqual(events, [])
+            stack = [((), ds.directory)]
+            while stack:
+                parts, node = stack.pop()
+                self.assertIs(ds._find(parts), node)
+                stack.extend((parts + (name,), child) for name, child in node.items())
@@ -7,6 +7,10 @@ from exceptions import (
     DirectoryAlreadyExistsError,
     RootDirectoryError,
     EmptyStatementError,
+    InvalidArgumentError,
+    CorruptDataError,
+    TransactionError,
+    ReadOnlyError,
 )
 
 
@@ -66,3 +70,32 @@ class TestExceptions(unittest.TestCase):
 
         custom_error = EmptyStatementError("Custom empty statement error")
         self.assertEqual(str(custom_error), "Custom empty statement error")
+
+    def test_invalid_argument_error(self):
+        """Test InvalidArgumentError with default and custom message."""
+        error = InvalidArgumentError("--depth")
+        self.assertEqual(str(error), "Invalid argument: --depth")
+        self.assertEqual(error.argument, "--depth")
+
+        custom_error = InvalidArgumentError("x", "Expected a number")
+        self.assertEqual(str(custom_error), "Expected a number: x")
+
+    def test_corrupt_data_error(self):
+        """Test CorruptDataError with a path and a custom message."""
+        error = CorruptDataError("data/snapshot")
+        self.assertEqual(str(error), "Corrupt data file: data/snapshot")
+        self.assertEqual(error.path, "data/snapshot")
+
+        custom_error = CorruptDataError("data/snapshot", "Unknown snapshot format")
+        self.assertEqual(str(custom_error), "Unknown snapshot format: data/snapshot")
+
+    def test_transaction_error(self):
+        """Test TransactionError with the default and a custom message."""
+        self.assertEqual(str(TransactionError()), "Transaction error")
+        self.assertEqual(str(TransactionError("No transaction in progress")), "No transaction in progress")
+
+    def test_read_only_error(self):
+        """Test ReadOnlyError with the rejected command."""
+        error = ReadOnlyError("CREATE")
+        self.assertEqual(str(error), "Read-only replica, not allowed: CREATE")
+        self.assertEqual(error.command, "CREATE")
@@ -0,0 +1,100 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from directory_structure import DirectoryStructure
+from exceptions import DirectoryNotFoundError
+from filesystem import export_tree, scan_tree
+
+
+def disk_tree(path: str) -> list:
+    """Lists every directory below path, relative to it, in sorted order."""
+    found = []
+    for parent, directories, _ in os.walk(path):
+        found.extend(os.path.relpath(os.path.join(parent, name), path) for name in directories)
+    return sorted(found)
+
+
+class TestFilesystem(unittest.TestCase):
+    def setUp(self):
+        """Create a small directory hierarchy on disk for each test."""
+        self.tmp = tempfile.TemporaryDirectory()
+        self.source = os.path.join(self.tmp.name, "source")
+        for path in ("a/b/c", "a/d", "e", "f/g/h/i"):
+            os.makedirs(os.path.join(self.source, path))
+        with open(os.path.join(self.source, "a", "file.txt"), "w") as f:
+            f.write("not a directory")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_scan_tree(self):
+        """Test reading a hierarchy into a detached tree with correct counters."""
+        root, count, skipped = scan_tree(self.source, workers=3)
+        self.assertEqual((count, skipped), (9, 0))
+        self.assertEqual((root.descendants, root.height), (9, 4))
+        ds = DirectoryStructure()
+        ds.add_tree("imported", root)
+        self.assertEqual(ds.find_directories("*"),
+                         sorted(["imported"] + ["imported/" + path for path in disk_tree(self.source)]))
+
+    def test_scan_skips_links_and_unusable_names(self):
+        """Test that symbolic links are not followed and unusable names are skipped."""
+        os.symlink(os.path.join(self.source, "a"), os.path.join(self.source, "e", "link"))
+        os.mkdir(os.path.join(self.source, "e", "bad:name"))
+        os.mkdir(os.path.join(self.source, "e", "bad:name", "below"))
+        for name in ("two words", "tab\there", "new\nline", " "):
+            os.mkdir(os.path.join(self.source, "e", name))
+        root, count, skipped = scan_tree(self.source)
+        self.assertEqual((count, skipped), (9, 5))
+        self.assertEqual(len(root["e"]), 0)
+
+    def test_scan_missing_directory(self):
+        """Test that a missing directory is reported."""
+        with self.assertRaises(DirectoryNotFoundError):
+            scan_tree(os.path.join(self.tmp.name, "missing"))
+
+    def test_export_round_trip(self):
+        """Test that an exported tree recreates the imported hierarchy, keeping what exists."""
+        root, _, _ = scan_tree(self.source)
+        target = os.path.join(self.tmp.name, "target")
+        os.makedirs(os.path.join(target, "a", "b"))
+        self.assertEqual(export_tree(root, target, workers=2), (9, 0))
+        self.assertEqual(disk_tree(target), disk_tree(self.source))
+
+    def test_export_skips_unusable_names(self):
+        """Test that directories that cannot be created on disk are skipped with their subtrees."""
+        ds = DirectoryStructure()
+        for path in ("x/../escape", "x/ok", "y"):
+            ds.create_directory(path)
+        with open(os.path.join(self.tmp.name, "y"), "w"):
+            pass
+        self.assertEqual(export_tree(ds.directory, self.tmp.name), (2, 2))
+        self.assertEqual(disk_tree(self.tmp.name), sorted(["source"] + [
+            os.path.join("source", path) for path in disk_tree(self.source)] + ["x", "x/ok"]))
+
+    def test_export_max_depth(self):
+        """Test that an export stopped by max_depth hands back the directories of its last level."""
+        root, _, _ = scan_tree(self.source)
+        target = os.path.join(self.tmp.name, "target")
+        frontier = []
+        self.assertEqual(export_tree(root, target, max_depth=2, frontier=frontier), (6, 0))
+        self.assertEqual(disk_tree(target), ["a", "a/b", "a/d", "e", "f", "f/g"])
+        self.assertEqual(sorted(path for _, path in frontier),
+                         [os.path.join(target, path) for path in ("a/b", "a/d", "f/g")])
+        self.assertEqual(sorted(node.name for node, _ in frontier), ["b", "d", "g"])
+
+    def test_progress(self):
+        """Test that progress is reported while directories are transferred."""
+        reports = []
+        with patch("filesystem.PROGRESS_INTERVAL", 0):
+            root, count, _ = scan_tree(self.source, progress=lambda *report: reports.append(report))
+            export_tree(root, os.path.join(self.tmp.name, "target"),
+                        progress=lambda *report: reports.append(report))
+        self.assertEqual(reports[-1][0], count)
+        self.assertTrue(all(seconds >= 0 for _, seconds in reports))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,51 @@
+import json
+import random
+import unittest
+from contextlib import suppress
+
+from directory_structure import DirectoryStructure
+from exceptions import DirectoryAlreadyExistsError
+from listing import iter_json, iter_listing, iter_ndjson, iter_paths
+
+
+def nested(node) -> list:
+    """Builds the json listing of a node as nested lists and dicts."""
+    return [{"name": name, "children": nested(child)} for name, child in node.sorted_items()]
+
+
+class TestListing(unittest.TestCase):
+    def setUp(self):
+        self.entries = [(0, "a"), (1, "b"), (2, "c"), (1, "d"), (0, 'e "quoted"')]
+
+    def test_iter_paths(self):
+        """Test that entries are turned into full paths, below a base path if given."""
+        self.assertEqual(list(iter_paths(self.entries)), ["a", "a/b", "a/b/c", "a/d", 'e "quoted"'])
+        self.assertEqual(list(iter_paths([(0, "b"), (1, "c"), (0, "d")], "x/y")), ["x/y/b", "x/y/b/c", "x/y/d"])
+
+    def test_iter_ndjson(self):
+        """Test that every entry becomes one JSON object."""
+        lines = list(iter_ndjson(self.entries))
+        self.assertEqual(json.loads(lines[2]), {"path": "a/b/c", "name": "c", "depth": 2})
+        self.assertEqual(json.loads(lines[-1]), {"path": 'e "quoted"', "name": 'e "quoted"', "depth": 0})
+
+    def test_iter_json_matches_json_dumps(self):
+        """Test that the streamed document is exactly what json.dumps makes of the tree."""
+        self.assertEqual("".join(iter_json([])), "[]")
+        rng = random.Random(23)
+        ds = DirectoryStructure()
+        for _ in range(300):
+            path = "/".join(rng.choice(["x", "y", "zé", "w\\"]) for _ in range(rng.randint(1, 5)))
+            with suppress(DirectoryAlreadyExistsError):
+                ds.create_directory(path)
+        self.assertEqual("".join(iter_json(ds.iter_entries())), json.dumps(nested(ds.directory)))
+        self.assertEqual(json.loads("".join(iter_json(ds.iter_entries("x", max_depth=1)))),
+                         [{"name": name, "children": []} for name in sorted(ds.directory["x"].children)])
+
+    def test_unknown_format(self):
+        """Test that an unknown format is rejected."""
+        with self.assertRaises(ValueError):
+            iter_listing(self.entries, "xml")
+
+
+if __name__ == "__main__":
+    unittest.main()
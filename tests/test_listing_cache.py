@@ -0,0 +1,155 @@
+import io
+import random
+import unittest
+from contextlib import redirect_stdout, suppress
+from unittest.mock import patch
+
+from directory_manager import DirectoryManager
+from directory_structure import DirectoryStructure
+from listing_cache import ListingCache, iter_text, reindent
+
+
+def listed(structure: DirectoryStructure, path: str = None) -> str:
+    """Returns what print_directory prints for a directory."""
+    output = io.StringIO()
+    with redirect_stdout(output):
+        structure.print_directory(path)
+    return output.getvalue()
+
+
+def walked(structure: DirectoryStructure, path: str = None) -> str:
+    """Returns the same listing built by walking the tree."""
+    return "".join(line + "\n" for line in structure.iter_directory(path))
+
+
+class TestListingCache(unittest.TestCase):
+    def setUp(self):
+        self.ds = DirectoryStructure()
+        for top in "ab":
+            for middle in range(10):
+                for leaf in range(10):
+                    self.ds.create_directory(f"{top}/m{middle}/l{leaf}")
+
+    def test_reindent(self):
+        """Test moving rendered lines right and left."""
+        self.assertEqual(reindent("a\n  b\n", 2), "    a\n      b\n")
+        self.assertEqual(reindent("    a\n      b\n", -1), "  a\n    b\n")
+        self.assertEqual(reindent("a\n", 0), "a\n")
+
+    def test_iter_text(self):
+        """Test flattening nested blocks in listing order."""
+        self.assertEqual(list(iter_text(["a\n", ["b\n", ["c\n"]], "d\n"])), ["a\n", "b\n", "c\n", "d\n"])
+        self.assertEqual(list(iter_text("a\n")), ["a\n"])
+
+    def test_second_listing_reuses_the_cache(self):
+        """Test that a LIST of an unchanged tree formats nothing again."""
+        self.assertEqual(listed(self.ds), walked(self.ds))
+        cache = self.ds._listing
+        rendered = cache.rendered_lines
+        self.assertEqual(rendered, 222)
+        self.assertEqual(listed(self.ds), walked(self.ds))
+        self.assertEqual(cache.rendered_lines, rendered)
+
+    def test_changes_rerender_only_their_ancestors(self):
+        """Test that CREATE, MOVE and DELETE only make the directories above them stale."""
+        listed(self.ds)
+        cache = self.ds._listing
+        for command in (lambda: self.ds.create_directory("a/m3/l3/new"),
+                        lambda: self.ds.move_directory("a/m4/l1", "b/m9"),
+                        lambda: self.ds.delete_directory("b/m0/l5")):
+            rendered = cache.rendered_lines
+            command()
+            self.assertEqual(listed(self.ds), walked(self.ds))
+            self.assertLess(cache.rendered_lines - rendered, 50)
+
+    def test_move_to_another_depth_keeps_indentation(self):
+        """Test that a subtree moved deeper or shallower is re-indented, not walked again."""
+        listed(self.ds)
+        cache = self.ds._listing
+        rendered = cache.rendered_lines
+        self.ds.move_directory("a", "b/m5/l5")
+        self.assertEqual(listed(self.ds), walked(self.ds))
+        self.assertIn("      a\n        m0\n          l0\n", listed(self.ds))
+        self.ds.move_directory("b/m5/l5/a", "c")
+        self.assertEqual(listed(self.ds), walked(self.ds))
+        self.assertIn("c\n  a\n    m0\n      l0\n", listed(self.ds))
+        # Walking the moved subtree again would take 111 lines each time
+        self.assertLess(cache.rendered_lines - rendered, 80)
+
+    def test_names_starting_with_spaces(self):
+        """Test that a block whose first name starts with spaces is re-indented by the right amount."""
+        for path in ("x/  y/   z", "x/  y/ w", "x/v"):
+            self.ds.create_directory(path)
+        listed(self.ds)
+        self.ds.move_directory("x", "b/m5")
+        self.assertEqual(listed(self.ds), walked(self.ds))
+        self.ds.move_directory("b/m5/x", "a")
+        self.assertEqual(listed(self.ds), walked(self.ds))
+        self.assertEqual(listed(self.ds, "a/x"), walked(self.ds, "a/x"))
+
+    def test_listing_a_directory(self):
+        """Test that a LIST of one directory shares the cache with the LIST of the whole tree."""
+        listed(self.ds)
+        self.assertEqual(listed(self.ds, "b/m1"), walked(self.ds, "b/m1"))
+        self.assertEqual(listed(self.ds, "b"), walked(self.ds, "b"))
+        self.assertEqual(listed(self.ds), walked(self.ds))
+
+    def test_deleted_subtrees_are_dropped(self):
+        """Test that the blocks of a deleted subtree are not kept."""
+        with patch("listing_cache.BLOCK_DIRECTORIES", 4):
+            listed(self.ds)
+            blocks = len(self.ds._listing)
+            self.ds.delete_directory("a")
+            self.assertLess(len(self.ds._listing), blocks / 2)
+
+    def test_matches_walked_listing(self):
+        """Test random commands, transactions and listings against walking the tree."""
+        rng = random.Random(25)
+        self.ds.reset()
+        with patch("listing_cache.BLOCK_DIRECTORIES", 4):
+            for step in range(2000):
+                paths = ["/".join(rng.choice("abc") for _ in range(rng.randint(1, 5))) for _ in range(2)]
+                operation = rng.choice(["create", "create", "create", "move", "delete", "transaction"])
+                with suppress(Exception):
+                    if operation == "create":
+                        self.ds.create_many([paths[0], paths[0] + "/x", paths[1]])
+                    elif operation == "move":
+                        self.ds.move_directory(*paths)
+                    elif operation == "delete":
+                        self.ds.delete_directory(paths[0])
+                    else:
+                        self.ds.begin()
+                        try:
+                            self.ds.create_directory(paths[1] + "/t")
+                            self.ds.delete_directory(paths[0])
+                        finally:
+                            self.ds.commit() if rng.random() < 0.5 else self.ds.rollback()
+                if step % 10 == 0:
+                    self.assertEqual(listed(self.ds), walked(self.ds))
+                    path = paths[0].rsplit("/", 1)[0]
+                    if self.ds._find(tuple(path.split("/"))) is not None:
+                        self.assertEqual(listed(self.ds, path), walked(self.ds, path))
+
+    def test_deep_tree(self):
+        """Test rendering a tree far deeper than the recursion limit."""
+        self.ds.reset()
+        self.ds.create_directory("/".join(["d"] * 5000))
+        listing = listed(self.ds)
+        self.assertEqual(listing, walked(self.ds))
+        self.ds.create_directory("/".join(["d"] * 4000 + ["e"]))
+        self.assertEqual(listed(self.ds), walked(self.ds))
+
+    def test_manager_uses_cache_only_for_full_listings(self):
+        """Test that paginated and depth-limited listings do not touch the cache."""
+        manager = DirectoryManager(self.ds)
+        with redirect_stdout(io.StringIO()):
+            manager.process("LIST", ["--depth", "1"])
+            manager.process("LIST", ["--limit", "3"])
+        self.assertIsNone(self.ds._listing)
+        with redirect_stdout(io.StringIO()):
+            manager.process("LIST", [])
+        self.assertIsInstance(self.ds._listing, ListingCache)
+
+
+if __name__ == "__main__":
+    unittest.main()
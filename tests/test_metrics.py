@@ -0,0 +1,97 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+from metrics import LATENCY_BUCKETS, Metrics
+
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        self.metrics = Metrics()
+
+    def test_record(self):
+        """Test call counts, error counts and histogram buckets."""
+        self.metrics.record("CREATE", 0.000003)
+        self.metrics.record("CREATE", 0.000003, "DirectoryAlreadyExistsError")
+        self.metrics.record("CREATE", 2.0)
+        stats = self.metrics.commands["CREATE"]
+        self.assertEqual(stats.count, 3)
+        self.assertEqual(stats.errors, {"DirectoryAlreadyExistsError": 1})
+        self.assertEqual(stats.buckets[LATENCY_BUCKETS.index(0.000005)], 2)
+        self.assertEqual(stats.buckets[-1], 1)
+        self.assertEqual(stats.quantile(0.5), 0.000005)
+        self.assertIsNone(stats.quantile(0.99))
+
+    def test_exposition(self):
+        """Test the Prometheus text format."""
+        self.metrics.record("MOVE", 0.00002, "DirectoryNotFoundError")
+        self.metrics.record("CREATE", 0.001)
+        lines = self.metrics.exposition(42).splitlines()
+        self.assertIn("directory_nodes 42", lines)
+        self.assertIn('directory_commands_total{command="CREATE"} 1', lines)
+        self.assertIn('directory_command_errors_total{command="MOVE",error="DirectoryNotFoundError"} 1', lines)
+        self.assertIn('directory_command_duration_seconds_bucket{command="MOVE",le="1e-05"} 0', lines)
+        self.assertIn('directory_command_duration_seconds_bucket{command="MOVE",le="2.5e-05"} 1', lines)
+        self.assertIn('directory_command_duration_seconds_bucket{command="CREATE",le="+Inf"} 1', lines)
+        self.assertIn('directory_command_duration_seconds_count{command="CREATE"} 1', lines)
+        for line in lines:
+            if not line.startswith("#"):
+                name, value = line.rsplit(" ", 1)
+                float(value)
+
+    def test_summary(self):
+        """Test the METRICS summary lines."""
+        self.metrics.record("LIST", 0.00004)
+        self.metrics.record("DELETE", 0.00001, "KeyError")
+        self.assertEqual(list(self.metrics.iter_summary(7)), [
+            "nodes: 7",
+            "DELETE: 1 calls, avg 10.0 us, p99 <= 10 us, errors (KeyError: 1)",
+            "LIST: 1 calls, avg 40.0 us, p99 <= 50 us",
+        ])
+
+    def test_write(self):
+        """Test writing the metrics file atomically."""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "metrics.prom")
+            metrics = Metrics(path)
+            metrics.record("CREATE", 0.00001)
+            metrics.write(3)
+            with open(path) as f:
+                self.assertIn("directory_nodes 3\n", f.read())
+            self.assertEqual(os.listdir(tmp), ["metrics.prom"])
+
+    def test_write_periodically(self):
+        """Test that the metrics file is rewritten on the interval while no command is recorded."""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "metrics.prom")
+            metrics = Metrics(path, interval=0.01)
+            nodes = [5]
+            written = threading.Event()
+
+            def count():
+                if nodes[0] == 6:
+                    written.set()
+                return nodes[0]
+
+            metrics.start(count)
+            try:
+                deadline = time.monotonic() + 5
+                while not os.path.exists(path) and time.monotonic() < deadline:
+                    time.sleep(0.01)
+                nodes[0] = 6
+                self.assertTrue(written.wait(5))
+            finally:
+                metrics.close()
+            with open(path) as f:
+                self.assertIn("directory_nodes 6\n", f.read())
+            self.assertIsNone(metrics._writer)
+            # Without a file there is nothing to write, so no thread is started
+            unwritten = Metrics()
+            unwritten.start(count)
+            self.assertIsNone(unwritten._writer)
+            unwritten.close()
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,45 @@
+import unittest
+
+from name_index import NameIndex
+from node import Node
+
+
+class TestNameIndex(unittest.TestCase):
+    def setUp(self):
+        self.root = Node()
+        for path in ("src/lib", "src/app/lib", "docs", "doc", "data/src"):
+            node = self.root
+            for name in path.split("/"):
+                node = node.get(name) or node.add_child(name)
+        self.index = NameIndex()
+        for _, child in self.root.items():
+            self.index.add_subtree(child)
+
+    def names(self, pattern: str) -> list:
+        return sorted(node.name for node in self.index.match(pattern))
+
+    def test_exact_name(self):
+        """Test looking up a name used by one and by several directories."""
+        self.assertEqual(self.names("docs"), ["docs"])
+        self.assertEqual(self.names("lib"), ["lib", "lib"])
+        self.assertEqual(self.names("missing"), [])
+
+    def test_prefix_and_glob(self):
+        """Test prefix ranges and general glob patterns."""
+        self.assertEqual(self.names("doc*"), ["doc", "docs"])
+        self.assertEqual(self.names("d*a"), ["data"])
+        self.assertEqual(self.names("*c"), ["doc", "src", "src"])
+        self.assertEqual(self.names("?ib"), ["lib", "lib"])
+        self.assertEqual(len(self.names("*")), 8)
+
+    def test_remove_subtree(self):
+        """Test that removed subtrees disappear and shared names survive."""
+        self.index.remove_subtree(self.root["src"])
+        self.assertEqual(self.names("lib"), [])
+        self.assertEqual(self.names("src"), ["src"])
+        self.assertIs(next(self.index.match("src")), self.root["data"]["src"])
+        self.assertEqual(len(self.index), 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,36 @@
+import unittest
+
+from paths import ParsedPath, parse_path
+
+
+class TestPaths(unittest.TestCase):
+    def test_parse_path_valid(self):
+        """Test parsing valid paths into normalized components."""
+        parsed = parse_path("root/folder")
+        self.assertIsInstance(parsed, ParsedPath)
+        self.assertEqual(parsed, "root/folder")
+        self.assertEqual(parsed.parts, ("root", "folder"))
+
+    def test_parse_path_normalizes(self):
+        """Test that slashes and surrounding whitespace are normalized."""
+        self.assertEqual(parse_path(" /root//folder/ ").parts, ("root", "folder"))
+        self.assertEqual(parse_path("/root//folder/"), "root/folder")
+
+    def test_parse_path_invalid(self):
+        """Test that invalid paths are rejected."""
+        for path in ("", "/", "//root", "root//", "root/folder|x", "root/ /folder", "a:b"):
+            self.assertIsNone(parse_path(path), path)
+
+    def test_parse_path_is_cached(self):
+        """Test that repeated paths are parsed only once."""
+        self.assertIs(parse_path("cached/path"), parse_path("cached/path"))
+
+    def test_components_are_interned(self):
+        """Test that components share one string object with equal names."""
+        first = parse_path("".join(["inter", "ned"]) + "/a")
+        second = parse_path("b/" + "".join(["int", "erned"]))
+        self.assertIs(first.parts[0], second.parts[1])
+
+
+if __name__ == "__main__":
+    unittest.main()
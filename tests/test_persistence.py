@@ -0,0 +1,191 @@
+import os
+import tempfile
+import unittest
+
+from directory_structure import DirectoryStructure, Node
+from exceptions import CorruptDataError
+from persistence import Journal, MutationLog, load_snapshot, write_snapshot
+
+
+def listing(structure):
+    """Returns the full LIST output of a structure as a list of lines."""
+    return list(structure.iter_directory())
+
+
+class TestPersistence(unittest.TestCase):
+    def setUp(self):
+        """Create a fresh data directory for each test."""
+        self.tmp = tempfile.TemporaryDirectory()
+        self.data_dir = self.tmp.name
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def open_structure(self, **options):
+        """Open a structure restored from the data directory."""
+        structure = DirectoryStructure()
+        journal = Journal(self.data_dir, **options)
+        journal.open(structure)
+        return structure, journal
+
+    def test_snapshot_round_trip(self):
+        """Test that a snapshot preserves the tree, including awkward names."""
+        structure = DirectoryStructure()
+        for path in ("a/b/c", "a/d", "tab\there/new\nline", "back\\slash"):
+            structure.create_directory(path)
+        path = os.path.join(self.data_dir, "snapshot")
+        write_snapshot(structure.directory, path, 42)
+        root, seq = load_snapshot(path)
+        restored = DirectoryStructure()
+        restored.reset(root)
+        self.assertEqual(seq, 42)
+        self.assertEqual(listing(restored), listing(structure))
+
+    def test_snapshot_bad_header(self):
+        """Test that a file that is not a snapshot is rejected."""
+        path = os.path.join(self.data_dir, "snapshot")
+        with open(path, "w") as f:
+            f.write("not a snapshot\n")
+        with self.assertRaises(CorruptDataError):
+            load_snapshot(path)
+
+    def test_recover_from_log(self):
+        """Test that mutations are replayed from the log on reopen."""
+        structure, journal = self.open_structure()
+        structure.create_directory("a/b")
+        structure.create_directory("c")
+        structure.move_directory("a/b", "c")
+        structure.delete_directory("a")
+        expected = listing(structure)
+        journal.close()
+
+        restored, journal = self.open_structure()
+        self.assertEqual(listing(restored), expected)
+        self.assertEqual(journal.seq, 4)
+        journal.close()
+
+    def test_failed_mutations_are_not_logged(self):
+        """Test that only successful mutations reach the log."""
+        structure, journal = self.open_structure()
+        structure.create_directory("a")
+        with self.assertRaises(Exception):
+            structure.create_directory("a")
+        journal.close()
+        records = list(MutationLog.read(journal.log_path))
+        self.assertEqual([record[1:] for record in records], [(1, "CREATE", ["a"])])
+
+    def test_snapshot_then_replay_tail(self):
+        """Test recovery from a snapshot plus the log records written after it."""
+        structure, journal = self.open_structure(snapshot_every=3)
+        for path in ("a", "b", "c", "d/e"):
+            structure.create_directory(path)
+        journal.close()
+        self.assertEqual(len(list(MutationLog.read(journal.log_path))), 1)
+
+        restored, journal = self.open_structure()
+        self.assertEqual(listing(restored), ["a", "b", "c", "d", "  e"])
+        journal.close()
+
+    def test_torn_record_is_discarded(self):
+        """Test that a partially written last record is ignored and truncated."""
+        structure, journal = self.open_structure()
+        structure.create_directory("a")
+        journal.close()
+        with open(journal.log_path, "a") as f:
+            f.write('[2, "CREATE", "b')
+
+        restored, journal = self.open_structure()
+        self.assertEqual(listing(restored), ["a"])
+        restored.create_directory("c")
+        journal.close()
+
+        restored, journal = self.open_structure()
+        self.assertEqual(listing(restored), ["a", "c"])
+        journal.close()
+
+    def test_load_is_captured_by_a_snapshot(self):
+        """Test that a LOAD survives a restart even if its image file changes."""
+        image = os.path.join(self.data_dir, "tree.img")
+        source = DirectoryStructure()
+        source.create_directory("loaded/tree")
+        source.save(image)
+
+        structure, journal = self.open_structure()
+        structure.create_directory("discarded")
+        structure.load(image)
+        structure.create_directory("after")
+        journal.close()
+        os.remove(image)
+
+        restored, journal = self.open_structure()
+        self.assertEqual(listing(restored), ["after", "loaded", "  tree"])
+        journal.close()
+
+    def test_transaction_logged_as_one_batch(self):
+        """Test that a committed transaction is logged between markers and synced once."""
+        structure, journal = self.open_structure()
+        structure.begin()
+        structure.create_directory("a")
+        structure.create_directory("b")
+        self.assertEqual(list(MutationLog.read(journal.log_path)), [])
+        syncs = []
+        original_sync = journal.log.sync
+        journal.log.sync = lambda: (syncs.append(True), original_sync())
+        structure.commit()
+        self.assertEqual(len(syncs), 1)
+        journal.close()
+        records = [record[1:] for record in MutationLog.read(journal.log_path)]
+        self.assertEqual(records, [(1, "BEGIN", []), (2, "CREATE", ["a"]), (3, "CREATE", ["b"]), (4, "COMMIT", [])])
+
+        restored, journal = self.open_structure()
+        self.assertEqual(listing(restored), ["a", "b"])
+        self.assertEqual(journal.seq, 4)
+        journal.close()
+
+    def test_uncommitted_batch_is_discarded(self):
+        """Test that a transaction cut off before its COMMIT record is not replayed."""
+        structure, journal = self.open_structure()
+        structure.create_directory("a")
+        journal.close()
+        with open(journal.log_path, "a") as f:
+            f.write('[2, "BEGIN"]\n[3, "CREATE", "b"]\n')
+
+        restored, journal = self.open_structure()
+        self.assertEqual(listing(restored), ["a"])
+        restored.create_directory("c")
+        journal.close()
+
+        restored, journal = self.open_structure()
+        self.assertEqual(listing(restored), ["a", "c"])
+        journal.close()
+
+    def test_group_commit(self):
+        """Test that the log is only synced once per group of records."""
+        log = MutationLog(os.path.join(self.data_dir, "log"), fsync_every=3)
+        log.append(1, "CREATE", ["a"])
+        log.append(2, "CREATE", ["b"])
+        self.assertEqual(log._pending, 2)
+        log.append(3, "CREATE", ["c"])
+        self.assertEqual(log._pending, 0)
+        log.close()
+
+    def test_unreplayable_log(self):
+        """Test that a log that does not match the snapshot is reported."""
+        with open(os.path.join(self.data_dir, Journal.LOG_FILE), "w") as f:
+            f.write('[1, "DELETE", "missing/path"]\n')
+        with self.assertRaises(CorruptDataError):
+            self.open_structure()
+
+    def test_reset(self):
+        """Test replacing the tree of a structure."""
+        structure = DirectoryStructure()
+        structure.create_directory("old/path")
+        root = Node()
+        root.add_child("new")
+        structure.reset(root)
+        self.assertEqual(listing(structure), ["new"])
+        self.assertIsNone(structure._cached(("old",)))
+
+
+if __name__ == "__main__":
+    unittest.main()
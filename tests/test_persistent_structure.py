@@ -0,0 +1,238 @@
+import io
+import os
+import random
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+
+from directory_structure import DirectoryStructure
+from exceptions import DirectoryAlreadyExistsError, CannotDeleteDirectoryError, CannotMoveDirectoryError, \
+    DirectoryNotFoundError, InvalidPathError, RootDirectoryError, TransactionError
+from node import Node
+from persistent_structure import PersistentDirectoryStructure, PersistentNode, freeze
+
+
+def listing(structure) -> list:
+    return list(structure.iter_directory())
+
+
+def counters(node) -> tuple:
+    """Computes the subtree counters of node by walking it."""
+    descendants = height = 0
+    for _, child in node.items():
+        child_descendants, child_height = counters(child)
+        descendants += child_descendants + 1
+        height = max(height, child_height + 1)
+    return descendants, height
+
+
+class TestPersistentDirectoryStructure(unittest.TestCase):
+    def setUp(self):
+        self.ds = PersistentDirectoryStructure()
+
+    def test_create_and_list(self):
+        """Test creating nested directories and listing them."""
+        self.ds.create_directory("a/b/c")
+        self.ds.create_directory("a/d")
+        self.assertEqual(listing(self.ds), ["a", "  b", "    c", "  d"])
+        with self.assertRaises(DirectoryAlreadyExistsError):
+            self.ds.create_directory("a/b")
+        with self.assertRaises(InvalidPathError):
+            self.ds.create_directory("a//b")
+
+    def test_snapshot_is_isolated_from_writes(self):
+        """Test that a snapshot keeps showing the tree as it was when taken."""
+        self.ds.create_directory("a/b")
+        self.ds.create_directory("c")
+        snapshot = self.ds.snapshot()
+        lines = self.ds.iter_directory(snapshot=snapshot)
+        self.assertEqual(next(lines), "a")
+
+        self.ds.create_directory("a/x")
+        self.ds.move_directory("c", "a")
+        self.ds.delete_directory("a/b")
+
+        self.assertEqual(list(lines), ["  b", "c"])
+        self.assertEqual(listing(self.ds), ["a", "  c", "  x"])
+
+    def test_writes_share_unchanged_subtrees(self):
+        """Test that a write only copies the directories on its path."""
+        self.ds.create_directory("a/b")
+        self.ds.create_directory("c/d")
+        before = self.ds.snapshot()
+        self.ds.create_directory("a/e")
+        after = self.ds.snapshot()
+        self.assertIsNot(after, before)
+        self.assertIsNot(after["a"], before["a"])
+        self.assertIs(after["a"]["b"], before["a"]["b"])
+        self.assertIs(after["c"], before["c"])
+        self.assertNotIn("e", before["a"])
+
+    def test_errors_leave_the_tree_unchanged(self):
+        """Test that failing operations publish no new root."""
+        self.ds.create_directory("a/b")
+        root = self.ds.snapshot()
+        with self.assertRaises(CannotDeleteDirectoryError):
+            self.ds.delete_directory("x/y")
+        with self.assertRaises(KeyError):
+            self.ds.delete_directory("a/x")
+        with self.assertRaises(RootDirectoryError):
+            self.ds.delete_directory("")
+        with self.assertRaises(DirectoryNotFoundError):
+            self.ds.move_directory("a/x", "c")
+        with self.assertRaises(CannotMoveDirectoryError):
+            self.ds.move_directory("a", "a/b")
+        self.assertIs(self.ds.snapshot(), root)
+
+    def test_move_semantics(self):
+        """Test prefix-named destinations, moves into the source and into the own parent."""
+        self.ds.create_directory("a/b/x")
+        self.ds.create_directory("a/bc")
+        root = self.ds.snapshot()
+        self.ds.move_directory("a/bc", "a")
+        self.assertIs(self.ds.snapshot(), root)
+        with self.assertRaises(CannotMoveDirectoryError):
+            self.ds.move_directory("a/b", "a/b/x/y")
+        self.ds.move_directory("a/b", "a/bc")
+        self.assertEqual(listing(self.ds), ["a", "  bc", "    b", "      x"])
+
+    def test_matches_mutable_engine(self):
+        """Test random command sequences against the mutable engine."""
+        rng = random.Random(12)
+        names = ["a", "b", "c"]
+        for _ in range(300):
+            mutable = DirectoryStructure()
+            persistent = PersistentDirectoryStructure()
+            for _ in range(40):
+                operation = rng.choice(["CREATE", "CREATE", "MOVE", "DELETE"])
+                paths = ["/".join(rng.choice(names) for _ in range(rng.randint(1, 3))) for _ in range(2)]
+                results = []
+                for structure in (mutable, persistent):
+                    try:
+                        if operation == "CREATE":
+                            structure.create_directory(paths[0])
+                        elif operation == "MOVE":
+                            structure.move_directory(*paths)
+                        else:
+                            structure.delete_directory(paths[0])
+                        results.append(None)
+                    except Exception as e:
+                        results.append(type(e))
+                self.assertEqual(results[0], results[1], (operation, paths))
+                self.assertEqual(listing(mutable), listing(persistent), (operation, paths))
+                self.assertEqual(persistent.stat_directory(), counters(persistent.snapshot()))
+                self.assertEqual(persistent.stat_directory(), mutable.stat_directory())
+                self.assertEqual(persistent.find_directories("a*"), mutable.find_directories("a*"))
+
+    def test_stat_directory(self):
+        """Test that snapshots keep their own counters."""
+        self.ds.create_directory("a/b/c")
+        snapshot = self.ds.snapshot()
+        self.ds.delete_directory("a/b")
+        self.assertEqual(self.ds.stat_directory("a"), (0, 0))
+        self.assertEqual(self.ds.stat_directory("a", snapshot=snapshot), (2, 2))
+        with self.assertRaises(DirectoryNotFoundError):
+            self.ds.stat_directory("a/b")
+
+    def test_find_directories(self):
+        """Test finding directories in the current tree or in a snapshot."""
+        self.ds.create_directory("a/lib")
+        self.ds.create_directory("b/lib")
+        snapshot = self.ds.snapshot()
+        self.ds.delete_directory("a")
+        self.assertEqual(self.ds.find_directories("lib"), ["b/lib"])
+        self.assertEqual(self.ds.find_directories("l?b", snapshot=snapshot), ["a/lib", "b/lib"])
+        self.assertEqual(self.ds.find_directories("*", "b"), ["b/lib"])
+        with self.assertRaises(DirectoryNotFoundError):
+            self.ds.find_directories("lib", "a")
+
+    def test_transaction_isolated_until_commit(self):
+        """Test that snapshots only show committed transactions."""
+        events = []
+        self.ds.listeners.append(lambda *event: events.append(event))
+        self.ds.create_directory("a")
+        self.ds.begin()
+        self.ds.create_directory("b")
+        self.assertEqual(listing(self.ds), ["a", "b"])
+        self.assertEqual(list(self.ds.iter_directory(snapshot=self.ds.snapshot())), ["a"])
+        self.ds.commit()
+        self.assertEqual(list(self.ds.iter_directory(snapshot=self.ds.snapshot())), ["a", "b"])
+        self.assertEqual(events, [("CREATE", "a"), ("BEGIN",), ("CREATE", "b"), ("COMMIT",)])
+
+    def test_transaction_rollback(self):
+        """Test that ROLLBACK brings back the committed root itself."""
+        self.ds.create_directory("a/b")
+        root = self.ds.snapshot()
+        self.ds.begin()
+        self.ds.delete_directory("a/b")
+        self.ds.create_directory("c")
+        with self.assertRaises(TransactionError):
+            self.ds.begin()
+        self.ds.rollback()
+        self.assertIs(self.ds.root, root)
+        with self.assertRaises(TransactionError):
+            self.ds.commit()
+
+    def test_create_many(self):
+        """Test that create_many reports per-path results."""
+        results = self.ds.create_many(["a/b", "a/b", "a//c"])
+        self.assertIsNone(results[0])
+        self.assertIsInstance(results[1], DirectoryAlreadyExistsError)
+        self.assertIsInstance(results[2], InvalidPathError)
+
+    def test_add_tree(self):
+        """Test adding a detached subtree, shared by no earlier snapshot."""
+        self.ds.create_directory("a")
+        snapshot = self.ds.snapshot()
+        events = []
+        self.ds.listeners.append(lambda *event: events.append(event))
+        subtree = Node()
+        subtree.add_chain(["x", "y"])
+        self.ds.add_tree("a/b/new", subtree)
+        self.assertEqual(listing(self.ds), ["a", "  b", "    new", "      x", "        y"])
+        self.assertEqual(self.ds.stat_directory(), counters(self.ds.snapshot()))
+        self.assertEqual(list(self.ds.iter_directory(snapshot=snapshot)), ["a"])
+        self.assertEqual(events, [("CREATE", "a/b/new"), ("CREATE", "a/b/new/x"), ("CREATE", "a/b/new/x/y")])
+        with self.assertRaises(DirectoryAlreadyExistsError):
+            self.ds.add_tree("a/b", Node())
+
+    def test_print_directory(self):
+        """Test that the shared LIST printing works on snapshots."""
+        self.ds.create_directory("a/b")
+        output = io.StringIO()
+        with redirect_stdout(output):
+            self.ds.print_directory(max_depth=1)
+        self.assertEqual(output.getvalue(), "a\n")
+        snapshot = self.ds.snapshot()
+        self.ds.create_directory("a/c")
+        self.assertEqual(list(self.ds.iter_entries(snapshot=snapshot)), [(0, "a"), (1, "b")])
+        output = io.StringIO()
+        with redirect_stdout(output):
+            self.ds.print_directory("a", list_format="paths")
+        self.assertEqual(output.getvalue(), "a/b\na/c\n")
+
+    def test_save_load_and_listeners(self):
+        """Test SAVE/LOAD round trips and mutation notifications."""
+        events = []
+        self.ds.listeners.append(lambda *event: events.append(event))
+        self.ds.create_directory("a/b")
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "tree.img")
+            self.ds.save(path)
+            self.ds.delete_directory("a")
+            self.ds.load(path)
+        self.assertIsInstance(self.ds.snapshot(), PersistentNode)
+        self.assertEqual(listing(self.ds), ["a", "  b"])
+        self.assertEqual(events, [("CREATE", "a/b"), ("DELETE", "a"), ("LOAD", path)])
+
+    def test_freeze(self):
+        """Test copying a mutable tree into persistent nodes."""
+        root = Node()
+        root.add_child("x").add_child("y")
+        frozen = freeze(root)
+        self.assertEqual(list(frozen["x"]), ["y"])
+        self.assertEqual(len(frozen["x"]["y"]), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
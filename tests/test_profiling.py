@@ -0,0 +1,51 @@
+import io
+import tracemalloc
+import unittest
+
+from directory_manager import DirectoryManager
+from profiling import Profiler
+
+
+class TestProfiler(unittest.TestCase):
+    def test_report_covers_commands(self):
+        """Test that the CPU report shows the structure operations run by commands."""
+        profiler = Profiler()
+        manager = DirectoryManager(profiler=profiler)
+        manager.process("CREATE", ["a/b"])
+        manager.process("MOVE", ["a/b", "a"])
+        report = "\n".join(profiler.iter_report())
+        self.assertIn("create_directory", report)
+        self.assertIn("move_directory", report)
+        profiler.close()
+
+    def test_empty_report(self):
+        """Test the report before any command ran."""
+        profiler = Profiler()
+        self.assertEqual(list(profiler.iter_report())[1], "(no commands profiled yet)")
+
+    def test_allocations(self):
+        """Test that allocation tracing is reported and stopped on close."""
+        was_tracing = tracemalloc.is_tracing()
+        profiler = Profiler(cpu=False, allocations=True, top=3)
+        manager = DirectoryManager(profiler=profiler)
+        for i in range(100):
+            manager.process("CREATE", [f"a/b{i}"])
+        report = list(profiler.iter_report())
+        self.assertEqual(report[0], "Top 3 allocation sites:")
+        self.assertLessEqual(len(report), 4)
+        profiler.close()
+        self.assertEqual(tracemalloc.is_tracing(), was_tracing)
+
+    def test_slow_log(self):
+        """Test that only commands above the threshold are logged, with their arguments."""
+        slow_log = io.StringIO()
+        profiler = Profiler(cpu=False, slow_log=slow_log, slow_threshold=0.5)
+        profiler.command_done("CREATE", ["a/b"], 0.001)
+        profiler.command_done("MOVE", ["a/b", "c"], 0.75)
+        lines = slow_log.getvalue().splitlines()
+        self.assertEqual(len(lines), 1)
+        self.assertTrue(lines[0].endswith(" 750.000 ms MOVE a/b c"))
+
+
+if __name__ == "__main__":
+    unittest.main()
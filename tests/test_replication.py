@@ -0,0 +1,178 @@
+import io
+import os
+import random
+import socket
+import tempfile
+import threading
+import unittest
+from contextlib import redirect_stdout
+from unittest.mock import patch
+
+from concurrency import ConcurrentDirectoryStructure
+from directories import main
+from directory_manager import DirectoryManager
+from directory_structure import DirectoryStructure
+from exceptions import ReadOnlyError
+from replication import ChangeFeed, ReplicaDirectoryStructure
+
+
+def run(manager, commands) -> str:
+    output = io.StringIO()
+    with redirect_stdout(output):
+        manager.run_batch(commands)
+    return output.getvalue()
+
+
+class TestReplication(unittest.TestCase):
+    def setUp(self):
+        self.primary = DirectoryStructure()
+        self.primary.create_directory("existing/before")
+        self.feed = ChangeFeed(compact_every=10, heartbeat=0.05)
+        self.feed.attach(self.primary)
+        self.replicas = []
+
+    def tearDown(self):
+        self.feed.close()
+        for replica in self.replicas:
+            replica.close()
+
+    def replica(self) -> ReplicaDirectoryStructure:
+        ours, theirs = socket.socketpair()
+        self.feed.subscribe(ours)
+        replica = ReplicaDirectoryStructure(theirs)
+        self.replicas.append(replica)
+        return replica
+
+    def assertCaughtUp(self, replica):
+        self.assertTrue(replica.wait(self.feed.seq, timeout=5))
+        self.assertEqual(list(replica.iter_directory()), list(self.primary.iter_directory()))
+        self.assertEqual(list(replica.iter_entries()), list(self.primary.iter_entries()))
+        self.assertEqual(replica.stat_directory(), self.primary.stat_directory())
+        self.assertEqual(replica.find_directories("*a*"), self.primary.find_directories("*a*"))
+
+    def test_replica_follows_primary(self):
+        """Test that replicas apply random changes, transactions and compactions in order."""
+        early = self.replica()
+        rng = random.Random(21)
+        names = ["a", "b", "c"]
+        manager = DirectoryManager(self.primary)
+        commands = []
+        for _ in range(400):
+            paths = ["/".join(rng.choice(names) for _ in range(rng.randint(1, 3))) for _ in range(2)]
+            operation = rng.choice(["CREATE", "CREATE", "MOVE", "DELETE", "BEGIN", "COMMIT", "ROLLBACK"])
+            commands.append(f"MOVE {paths[0]} {paths[1]}" if operation == "MOVE" else
+                            f"{operation} {paths[0]}" if operation in ("CREATE", "DELETE") else operation)
+        run(manager, commands)
+        late = self.replica()
+        self.assertCaughtUp(early)
+        self.assertCaughtUp(late)
+        self.assertEqual(early.lag(), (0, 0.0))
+
+    def test_load_is_published_as_an_image(self):
+        """Test that a LOAD on the primary replaces the replica's copy."""
+        replica = self.replica()
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "tree.img")
+            saved = DirectoryStructure()
+            saved.create_directory("loaded/x")
+            saved.save(path)
+            self.primary.load(path)
+            self.primary.create_directory("loaded/y")
+        self.assertCaughtUp(replica)
+        self.assertEqual(list(replica.iter_directory()), ["loaded", "  x", "  y"])
+
+    def test_listing_releases_the_lock_between_chunks(self):
+        """Test that a LIST on a replica lets the feed be applied while it runs."""
+        replica = self.replica()
+        for i in range(10):
+            self.primary.create_directory(f"dir{i}/sub")
+        self.assertCaughtUp(replica)
+        replica.LIST_CHUNK_LINES = 4
+        lines = replica.iter_directory()
+        entries = replica.iter_entries()
+        self.assertEqual(next(lines), "dir0")
+        self.assertEqual(next(entries), (0, "dir0"))
+        self.assertTrue(replica._lock.acquire(blocking=False))
+        replica._lock.release()
+        self.primary.create_directory("late")
+        self.assertTrue(replica.wait(self.feed.seq, timeout=5))
+        # The listings go on over the root's children as they were when they started
+        self.assertEqual(len(list(lines)), 21)
+        self.assertEqual(len(list(entries)), 21)
+        self.assertEqual(run(DirectoryManager(replica), ["LIST dir3", "LIST --format paths --limit 2"]),
+                         "sub\ndir0\ndir0/sub\nExiting...\n")
+        self.assertEqual(run(DirectoryManager(replica), ["LIST"]),
+                         "".join(line + "\n" for line in self.primary.iter_directory()) + "Exiting...\n")
+
+    def test_replica_is_read_only(self):
+        """Test that a replica rejects changes but serves reads and reports its lag."""
+        replica = self.replica()
+        self.assertCaughtUp(replica)
+        with self.assertRaises(ReadOnlyError):
+            replica.create_directory("x")
+        manager = DirectoryManager(replica)
+        self.assertEqual(run(manager, ["CREATE x", "MOVE existing y", "BEGIN", "COUNT", "LIST", "LAG"]),
+                         "Read-only replica, not allowed: CREATE\n"
+                         "Read-only replica, not allowed: MOVE\n"
+                         "Read-only replica, not allowed: BEGIN\n"
+                         "2\nexisting\n  before\nlag: 0 events, 0.000s\nExiting...\n")
+        self.assertEqual(run(DirectoryManager(), ["LAG"]), "Not a replica\nExiting...\n")
+        with tempfile.TemporaryDirectory() as tmp:
+            self.assertEqual(replica.export_directory("existing", tmp), (1, 0))
+            self.assertEqual(os.listdir(tmp), ["before"])
+
+    def test_feed_of_a_shared_tree(self):
+        """Test that a feed on a tree shared by threads neither deadlocks nor sends an image out of step."""
+        self.feed.close()
+        self.primary = ConcurrentDirectoryStructure()
+        self.feed = ChangeFeed(compact_every=10, heartbeat=0.05)
+        self.feed.attach(self.primary)
+        early = self.replica()
+
+        def writer(index):
+            for i in range(50):
+                self.primary.create_directory(f"w{index}-{i}")
+                self.primary.create_directory(f"w{index}-{i}/x")
+                if i % 5 == 0:
+                    self.primary.delete_directory(f"w{index}-{i}")
+
+        threads = [threading.Thread(target=writer, args=(index,), daemon=True) for index in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(10)
+            self.assertFalse(thread.is_alive(), "writer did not finish (deadlock?)")
+        late = self.replica()
+        self.assertCaughtUp(early)
+        self.assertCaughtUp(late)
+        self.assertEqual(self.primary.stat_directory(), (4 * 40 * 2, 2))
+        with self.feed._condition:
+            self.assertTrue(self.feed._condition.wait_for(lambda: self.feed._image_seq > 0, timeout=5))
+
+    def test_disconnect(self):
+        """Test that a replica notices when its primary goes away."""
+        replica = self.replica()
+        self.assertCaughtUp(replica)
+        self.feed.close()
+        self.assertFalse(replica.wait(self.feed.seq + 1, timeout=5))
+        self.assertFalse(replica.connected)
+        self.assertEqual(run(DirectoryManager(replica), ["LAG", "LIST"]),
+                         "lag: 0 events, 0.000s (disconnected)\nexisting\n  before\nExiting...\n")
+
+    def test_main_replica_of(self):
+        """Test serving a batch of reads from a replica of a primary's --feed."""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "feed.sock")
+            self.feed.listen(path)
+            script = os.path.join(tmp, "commands.txt")
+            with open(script, "w") as f:
+                f.write("LIST\nCREATE x\n")
+            result = os.path.join(tmp, "output.txt")
+            with open(result, "w") as out, patch("sys.stdout", out), patch("sys.stderr", io.StringIO()):
+                main(["--replica-of", path, "--batch", script])
+            with open(result) as f:
+                self.assertEqual(f.read(), "existing\n  before\nRead-only replica, not allowed: CREATE\nExiting...\n")
+
+
+if __name__ == "__main__":
+    unittest.main()
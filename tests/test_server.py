@@ -0,0 +1,122 @@
+import asyncio
+import os
+import socket
+import tempfile
+import unittest
+
+from directory_manager import DirectoryManager
+from server import execute, start_server
+
+
+async def read_response(reader) -> list:
+    """Read one framed response and return its lines."""
+    count = int(await reader.readline())
+    return [(await reader.readline()).decode().rstrip("\n") for _ in range(count)]
+
+
+class TestServer(unittest.TestCase):
+    def setUp(self):
+        self.manager = DirectoryManager()
+
+    def test_execute_frames_output(self):
+        """Test that command output is captured and prefixed with its line count."""
+        self.assertEqual(execute(self.manager, "CREATE a/b"), ("0\n", False))
+        self.assertEqual(execute(self.manager, "LIST"), ("2\na\n  b\n", False))
+        self.assertEqual(execute(self.manager, "CREATE a"), ("1\nDirectory already exists: a\n", False))
+        self.assertEqual(execute(self.manager, "   "), ("0\n", False))
+        self.assertEqual(execute(self.manager, "EXIT"), ("0\n", True))
+
+    def test_pipelined_connections_share_the_tree(self):
+        """Test pipelined commands on two TCP connections against one tree."""
+        async def scenario():
+            server = await start_server(self.manager, "127.0.0.1", 0)
+            port = server.sockets[0].getsockname()[1]
+            async with server:
+                first_reader, first_writer = await asyncio.open_connection("127.0.0.1", port)
+                second_reader, second_writer = await asyncio.open_connection("127.0.0.1", port)
+
+                first_writer.write(b"CREATE a/b\nCREATE a\nCREATE c\n")
+                self.assertEqual(await read_response(first_reader), [])
+                self.assertEqual(await read_response(first_reader), ["Directory already exists: a"])
+                self.assertEqual(await read_response(first_reader), [])
+
+                # A command split over two writes is executed once complete
+                second_writer.write(b"MOVE a/b")
+                await second_writer.drain()
+                second_writer.write(b" c\nLIST\nEXIT\n")
+                self.assertEqual(await read_response(second_reader), [])
+                self.assertEqual(await read_response(second_reader), ["a", "c", "  b"])
+                self.assertEqual(await read_response(second_reader), [])
+                self.assertEqual(await second_reader.read(), b"")
+
+                first_writer.close()
+                second_writer.close()
+
+        asyncio.run(scenario())
+
+    def test_transaction_holds_other_connections(self):
+        """Test that other connections wait while a transaction is open."""
+        async def scenario():
+            server = await start_server(self.manager, "127.0.0.1", 0)
+            port = server.sockets[0].getsockname()[1]
+            async with server:
+                first_reader, first_writer = await asyncio.open_connection("127.0.0.1", port)
+                second_reader, second_writer = await asyncio.open_connection("127.0.0.1", port)
+
+                first_writer.write(b"BEGIN\nCREATE a\n")
+                self.assertEqual(await read_response(first_reader), [])
+                self.assertEqual(await read_response(first_reader), [])
+
+                second_writer.write(b"LIST\n")
+                with self.assertRaises(asyncio.TimeoutError):
+                    await asyncio.wait_for(second_reader.readline(), 0.1)
+
+                first_writer.write(b"CREATE b\nCOMMIT\n")
+                self.assertEqual(await read_response(first_reader), [])
+                self.assertEqual(await read_response(first_reader), [])
+                self.assertEqual(await read_response(second_reader), ["a", "b"])
+
+                first_writer.close()
+                second_writer.close()
+
+        asyncio.run(scenario())
+
+    def test_disconnect_rolls_back(self):
+        """Test that a connection closing mid-transaction has it rolled back."""
+        async def scenario():
+            server = await start_server(self.manager, "127.0.0.1", 0)
+            port = server.sockets[0].getsockname()[1]
+            async with server:
+                first_reader, first_writer = await asyncio.open_connection("127.0.0.1", port)
+                second_reader, second_writer = await asyncio.open_connection("127.0.0.1", port)
+
+                first_writer.write(b"CREATE keep\nBEGIN\nCREATE a\n")
+                for _ in range(3):
+                    self.assertEqual(await read_response(first_reader), [])
+                second_writer.write(b"LIST\n")
+                first_writer.close()
+                self.assertEqual(await read_response(second_reader), ["keep"])
+                self.assertFalse(self.manager.in_transaction)
+                second_writer.close()
+
+        asyncio.run(scenario())
+
+    @unittest.skipUnless(hasattr(socket, "AF_UNIX"), "Unix sockets are not available")
+    def test_unix_socket(self):
+        """Test serving commands over a Unix socket."""
+        async def scenario():
+            with tempfile.TemporaryDirectory() as tmp:
+                path = os.path.join(tmp, "directories.sock")
+                server = await start_server(self.manager, path=path)
+                async with server:
+                    reader, writer = await asyncio.open_unix_connection(path)
+                    writer.write(b"CREATE x\nLIST\n")
+                    self.assertEqual(await read_response(reader), [])
+                    self.assertEqual(await read_response(reader), ["x"])
+                    writer.close()
+
+        asyncio.run(scenario())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,174 @@
+import io
+import os
+import random
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+
+from directory_manager import DirectoryManager
+from exceptions import CannotDeleteDirectoryError, CannotMoveDirectoryError, DirectoryAlreadyExistsError, \
+    DirectoryNotFoundError, TransactionError
+from node import Node
+from persistence import Journal
+from sharding import ShardedDirectoryStructure, shard_of
+
+
+def run(manager, commands) -> str:
+    output = io.StringIO()
+    with redirect_stdout(output):
+        manager.run_batch(commands)
+    return output.getvalue()
+
+
+class TestShardedDirectoryStructure(unittest.TestCase):
+    def setUp(self):
+        self.ds = ShardedDirectoryStructure(3)
+
+    def tearDown(self):
+        self.ds.close()
+
+    def test_partitioned_by_top_level_directory(self):
+        """Test that each top-level directory lives in the shard its name hashes to."""
+        self.assertEqual(shard_of("fruits", 3), shard_of("fruits", 3))
+        for name in "abcdefgh":
+            self.ds.create_directory(f"{name}/x")
+        counts = [self.ds._call(shard, "stat_directory")[0] for shard in range(3)]
+        self.assertEqual(counts, [2 * sum(shard_of(name, 3) == shard for name in "abcdefgh") for shard in range(3)])
+        self.assertEqual(self.ds.stat_directory(), (16, 2))
+        self.assertEqual(list(self.ds.iter_directory()), [line for name in "abcdefgh" for line in (name, "  x")])
+        self.assertEqual(list(self.ds.iter_entries()), [entry for name in "abcdefgh" for entry in ((0, name), (1, "x"))])
+        self.assertEqual(list(self.ds.iter_entries("c")), [(0, "x")])
+
+    def test_matches_mutable_engine(self):
+        """Test random command sequences, with pipelined and cross-shard commands, against the mutable engine."""
+        rng = random.Random(20)
+        names = ["a", "b", "c", "d", "e"]
+        commands = []
+        for _ in range(1500):
+            paths = ["/".join(rng.choice(names) for _ in range(rng.randint(1, 3))) for _ in range(2)]
+            command = rng.choice(["CREATE", "CREATE", "CREATE", "MOVE", "MOVE", "DELETE", "LIST",
+                                  "COUNT", "STATS", "FIND"])
+            if command == "MOVE":
+                commands.append(f"MOVE {paths[0]} {paths[1]}")
+            elif command == "FIND":
+                commands.append(f"FIND {rng.choice(names)}*")
+            elif command in ("CREATE", "DELETE", "COUNT", "STATS"):
+                commands.append(f"{command} {paths[0]}")
+            else:
+                commands.append("LIST")
+        commands.append("LIST --depth 2")
+        manager = DirectoryManager(self.ds)
+        manager.PIPELINE_WINDOW = 7
+        self.assertEqual(run(manager, commands), run(DirectoryManager(), commands))
+
+    def test_errors_keep_type_and_attributes(self):
+        """Test that errors raised in a shard are rebuilt with their type, message and attributes."""
+        self.ds.create_directory("a/b")
+        with self.assertRaises(DirectoryAlreadyExistsError):
+            self.ds.create_directory("a/b")
+        with self.assertRaises(CannotDeleteDirectoryError) as context:
+            self.ds.delete_directory("x/y")
+        self.assertEqual(context.exception.folder, "x")
+        self.assertEqual(str(context.exception), "Cannot delete x/y - x does not exist")
+        with self.assertRaises(CannotMoveDirectoryError):
+            self.ds.move_directory("a", "a/b")
+        with self.assertRaises(DirectoryNotFoundError):
+            self.ds.move_directory("q/r", "a")
+
+    def test_cross_shard_move(self):
+        """Test that a subtree moved to another shard arrives whole and leaves its source."""
+        first = "a"
+        second = next(name for name in "bcdefgh" if shard_of(name, 3) != shard_of(first, 3))
+        self.ds.create_directory(f"{first}/x/y/z")
+        self.ds.create_directory(f"{first}/x/w")
+        self.ds.create_directory(f"{second}/x")
+        self.ds.move_directory(f"{first}/x", second)
+        self.assertEqual(list(self.ds.iter_directory()), [first, second, "  x", "    w", "    y", "      z"])
+        self.assertEqual(self.ds.stat_directory(second), (4, 3))
+        self.assertEqual(self.ds.find_directories("z"), [f"{second}/x/y/z"])
+
+    def test_export_per_shard(self):
+        """Test that each shard exports the top-level directories it owns."""
+        for name in "abcdef":
+            self.ds.create_directory(f"{name}/x/y")
+        with tempfile.TemporaryDirectory() as tmp:
+            self.assertEqual(self.ds.export_directory(None, tmp), (18, 0))
+            self.assertEqual(self.ds.export_directory("c/x", os.path.join(tmp, "copy")), (1, 0))
+            self.assertEqual(sorted(os.listdir(tmp)), ["a", "b", "c", "copy", "d", "e", "f"])
+            self.assertTrue(os.path.isdir(os.path.join(tmp, "f", "x", "y")))
+            self.assertEqual(os.listdir(os.path.join(tmp, "copy")), ["y"])
+            with self.assertRaises(DirectoryNotFoundError):
+                self.ds.export_directory("g", tmp)
+
+    def test_add_tree(self):
+        """Test that a bulk-added subtree goes to the shard that owns it."""
+        subtree = Node()
+        subtree.add_chain(["x", "y"])
+        events = []
+        self.ds.listeners.append(lambda *event: events.append(event))
+        self.ds.add_tree("top/new", subtree)
+        self.assertEqual(self.ds._call(self.ds.shard_of("top"), "stat_directory"), (4, 4))
+        self.assertEqual(list(self.ds.iter_directory()), ["top", "  new", "    x", "      y"])
+        self.assertEqual(events, [("CREATE", "top/new"), ("CREATE", "top/new/x"), ("CREATE", "top/new/x/y")])
+        with self.assertRaises(DirectoryAlreadyExistsError):
+            self.ds.add_tree("top", Node())
+
+    def test_listeners_see_successes_in_order(self):
+        """Test that pipelined and direct commands are reported to listeners in order."""
+        events = []
+        self.ds.listeners.append(lambda *event: events.append(event))
+        for path in ("a", "b", "c", "a"):
+            self.ds.submit("create_directory", path)
+        self.assertEqual(self.ds.pending, 4)
+        errors = self.ds.collect()
+        self.assertEqual([type(error) for error in errors], [type(None)] * 3 + [DirectoryAlreadyExistsError])
+        self.ds.move_directory("c", "b")
+        self.ds.delete_directory("a")
+        self.assertEqual(events, [("BEGIN",), ("CREATE", "a"), ("CREATE", "b"), ("CREATE", "c"), ("COMMIT",),
+                                  ("MOVE", "c", "b"), ("DELETE", "a")])
+
+    def test_save_load_and_reset(self):
+        """Test saving the whole tree, loading it back into each shard and resetting it."""
+        for path in ("a/b", "c/d/e", "f"):
+            self.ds.create_directory(path)
+        expected = list(self.ds.iter_directory())
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "tree.img")
+            self.ds.save(path)
+            self.ds.reset()
+            self.assertEqual(self.ds.stat_directory(), (0, 0))
+            self.ds.load(path)
+            self.assertEqual(list(self.ds.iter_directory()), expected)
+        self.ds.reset(self.ds.directory)
+        self.assertEqual(list(self.ds.iter_directory()), expected)
+
+    def test_journal_recovery(self):
+        """Test that a journal replays into a sharded tree."""
+        with tempfile.TemporaryDirectory() as tmp:
+            journal = Journal(tmp)
+            journal.open(self.ds)
+            self.ds.create_directory("a/b")
+            self.ds.create_directory("c")
+            self.ds.move_directory("c", "a")
+            journal.close()
+
+            restored = ShardedDirectoryStructure(2)
+            try:
+                journal = Journal(tmp)
+                journal.open(restored)
+                journal.close()
+                self.assertEqual(list(restored.iter_directory()), ["a", "  b", "  c"])
+            finally:
+                restored.close()
+
+    def test_transactions_not_supported(self):
+        """Test that BEGIN fails on a sharded tree."""
+        with self.assertRaises(TransactionError):
+            self.ds.begin()
+        self.assertFalse(self.ds.in_transaction)
+        self.assertEqual(run(DirectoryManager(self.ds), ["BEGIN", "CREATE a", "LIST"]),
+                         "Transactions are not supported on a sharded tree\na\nExiting...\n")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,179 @@
+import io
+import os
+import random
+import tempfile
+import unittest
+from contextlib import redirect_stdout, suppress
+from unittest.mock import patch
+
+from directories import main, parse_args
+from directory_manager import DirectoryManager
+from directory_structure import DirectoryStructure
+from exceptions import DirectoryAlreadyExistsError, DirectoryNotFoundError
+from spilling import SpillFile, SpillingDirectoryStructure
+
+
+class TestSpilling(unittest.TestCase):
+    def setUp(self):
+        self.ds = SpillingDirectoryStructure(14)
+        for top in "ab":
+            for unit in "xyz":
+                self.ds.create_directory(f"{top}/{unit}/1/2")
+                self.ds.create_directory(f"{top}/{unit}/3")
+
+    def tearDown(self):
+        self.ds.close()
+
+    def test_least_recently_used_units_are_spilled(self):
+        """Test that the tree is kept within the budget by spilling the units used longest ago."""
+        stats = self.ds.memory_stats()
+        self.assertEqual(stats["directories"], 26)
+        self.assertEqual(stats["resident"], 14)
+        self.assertEqual(stats["spilled_units"], 4)
+        self.assertGreater(stats["spill_bytes"], 0)
+        self.assertTrue(self.ds.directory["b"]["z"].loaded)
+        self.assertFalse(self.ds.directory["a"]["x"].loaded)
+
+    def test_stubs_are_paged_in_transparently(self):
+        """Test that commands reaching a spilled unit page it back in and see all of it."""
+        self.assertEqual(self.ds.stat_directory("a/x"), (3, 2))
+        self.assertEqual(self.ds.misses, 0)
+        self.ds.create_directory("a/x/1/new")
+        self.assertEqual((self.ds.misses, self.ds.page_ins), (1, 1))
+        self.ds.move_directory("a/y/1", "b/z")
+        self.ds.delete_directory("b/x/3")
+        with self.assertRaises(DirectoryNotFoundError):
+            self.ds.move_directory("a/y/1", "b")
+        self.assertEqual(list(self.ds.iter_directory("a/x")), ["1", "  2", "  new", "3"])
+        self.assertEqual(self.ds.stat_directory(), (24, 4))
+        self.assertEqual(self.ds.find_directories("new"), ["a/x/1/new"])
+        self.assertLessEqual(self.ds.resident_directories, 14)
+        self.assertGreater(self.ds.page_in_seconds, 0)
+
+    def test_matches_unbounded_structure(self):
+        """Test random commands, transactions and listings against a structure without a budget."""
+        rng = random.Random(24)
+        expected = DirectoryStructure()
+        for structure in (self.ds, expected):
+            structure.reset()
+        for _ in range(1500):
+            paths = ["/".join(rng.choice("abc") for _ in range(rng.randint(1, 5))) for _ in range(2)]
+            operation = rng.choice(["create", "create", "move", "delete", "transaction"])
+            commit = rng.random() < 0.5
+            for structure in (self.ds, expected):
+                with suppress(Exception):
+                    if operation == "create":
+                        structure.create_directory(paths[0])
+                    elif operation == "move":
+                        structure.move_directory(*paths)
+                    elif operation == "delete":
+                        structure.delete_directory(paths[0])
+                    else:
+                        structure.begin()
+                        try:
+                            structure.create_directory(paths[1] + "/t")
+                            structure.delete_directory(paths[0])
+                        finally:
+                            structure.commit() if commit else structure.rollback()
+            self.assertEqual(self.ds.stat_directory(), expected.stat_directory())
+        self.assertEqual(list(self.ds.iter_directory()), list(expected.iter_directory()))
+        self.assertEqual(self.ds.find_directories("*a"), expected.find_directories("*a"))
+        self.assertGreater(self.ds.evictions, 0)
+
+    def test_listing_keeps_the_budget(self):
+        """Test that a listing of a tree larger than the budget spills as it goes."""
+        self.ds.LIST_CHUNK_LINES = 2
+        lines = self.ds.iter_directory()
+        self.assertEqual(next(lines), "a")
+        for _ in range(30):
+            next(lines, None)
+            self.assertLessEqual(self.ds.resident_directories, 14 + 3)
+        self.assertGreater(self.ds.page_ins, 0)
+
+    def test_export_keeps_the_budget(self):
+        """Test that exporting a tree larger than the budget creates every directory one unit at a time."""
+        resident = []
+        with tempfile.TemporaryDirectory() as tmp, patch("filesystem.PROGRESS_INTERVAL", 0):
+            progress = lambda *_: resident.append(self.ds.resident_directories)
+            self.assertEqual(self.ds.export_directory(None, tmp, workers=2, progress=progress), (26, 0))
+            self.assertEqual(self.ds.export_directory("a/x", os.path.join(tmp, "copy")), (3, 0))
+            found = sorted(os.path.relpath(os.path.join(parent, name), tmp)
+                           for parent, names, _ in os.walk(tmp) for name in names)
+        self.assertEqual(len(found), 26 + 1 + 3)
+        self.assertIn(os.path.join("a", "x", "1", "2"), found)
+        self.assertLessEqual(max(resident), 14 + 3)
+        self.assertGreater(self.ds.page_ins, 0)
+        with self.assertRaises(DirectoryNotFoundError):
+            self.ds.export_directory("c", tmp)
+
+    def test_load_keeps_the_image_on_disk(self):
+        """Test that LOAD turns the units still in the image into stubs."""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "tree.img")
+            self.ds.save(path)
+            self.ds.load(path)
+            self.assertEqual(self.ds.memory_stats()["resident"], 8)
+            self.assertEqual(len(self.ds._stubs), 6)
+            self.assertEqual(list(self.ds.iter_directory("b/y")), ["1", "  2", "3"])
+            self.assertEqual(self.ds.stat_directory(), (26, 4))
+
+    def test_add_tree_registers_units(self):
+        """Test that units below a directory added in one step can be spilled."""
+        self.ds.reset()
+        self.ds.memory_budget = 25
+        subtree = SpillingDirectoryStructure(100)
+        for unit in range(20):
+            subtree.create_directory(f"u{unit}/1")
+        self.ds.add_tree("imported", subtree.directory)
+        subtree.close()
+        self.assertEqual(self.ds.stat_directory(), (41, 3))
+        self.assertEqual(self.ds.resident_directories, 25)
+        with self.assertRaises(DirectoryAlreadyExistsError):
+            self.ds.create_directory("imported/u7/1")
+
+    def test_spill_file(self):
+        """Test reading records back and compacting the file once most of it is dead."""
+        spill_file = SpillFile()
+        try:
+            with patch("spilling.COMPACT_MIN_BYTES", 0):
+                for key in range(4):
+                    spill_file.put(key, bytes([key]) * 10)
+                self.assertEqual(spill_file.take(1), b"\1" * 10)
+                spill_file.discard(0)
+                self.assertEqual(spill_file._end, 20)
+                spill_file.discard(2)
+                self.assertEqual((spill_file._end, spill_file.live), (10, 10))
+                self.assertEqual(spill_file.take(3), b"\3" * 10)
+                self.assertEqual(spill_file._end, 0)
+        finally:
+            spill_file.close()
+
+    def test_memory_command(self):
+        """Test the MEMORY report, and that it needs a memory budget."""
+        output = io.StringIO()
+        with redirect_stdout(output):
+            DirectoryManager(self.ds).process("MEMORY", [])
+            DirectoryManager().process("MEMORY", [])
+        lines = output.getvalue().splitlines()
+        self.assertEqual(lines[0], f"resident: {self.ds.resident_directories} of 26 directories (budget 14)")
+        self.assertTrue(lines[1].startswith("spilled: 4 subtrees, "))
+        self.assertEqual(lines[-1], "No memory budget")
+
+    def test_main_memory_budget(self):
+        """Test running a batch within a memory budget from the command line."""
+        with self.assertRaises(SystemExit), patch("sys.stderr", io.StringIO()):
+            parse_args(["--engine", "persistent", "--memory-budget", "10"])
+        with tempfile.TemporaryDirectory() as tmp:
+            script = os.path.join(tmp, "commands.txt")
+            with open(script, "w") as f:
+                f.write("".join(f"CREATE t/{i}/a/b\n" for i in range(10)) + "COUNT t/0\nMEMORY\n")
+            result = os.path.join(tmp, "output.txt")
+            with open(result, "w") as out, patch("sys.stdout", out), patch("sys.stderr", io.StringIO()):
+                main(["--memory-budget", "20", "--spill-dir", tmp, "--batch", script])
+            with open(result) as f:
+                lines = f.read().splitlines()
+            self.assertEqual(lines[:2], ["2", "resident: 19 of 31 directories (budget 20)"])
+
+
+if __name__ == "__main__":
+    unittest.main()
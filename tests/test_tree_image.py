@@ -0,0 +1,112 @@
+import os
+import tempfile
+import unittest
+
+from directory_structure import DirectoryStructure
+from exceptions import CorruptDataError
+from tree_image import decode_image, encode_image, load_image, write_image
+
+
+class TestTreeImage(unittest.TestCase):
+    def setUp(self):
+        """Save a small tree to a fresh image file for each test."""
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "tree.img")
+        self.ds = DirectoryStructure()
+        for path in ("a/b/c", "a/d", "e/f/g/h", "e/ü", "i"):
+            self.ds.create_directory(path)
+        self.ds.save(self.path)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_round_trip(self):
+        """Test that a loaded image lists exactly like the saved tree."""
+        loaded = DirectoryStructure()
+        loaded.load(self.path)
+        self.assertEqual(list(loaded.iter_directory()), list(self.ds.iter_directory()))
+
+    def test_load_is_lazy(self):
+        """Test that only the directories that are reached get materialised."""
+        loaded = DirectoryStructure()
+        loaded.load(self.path)
+        self.assertFalse(loaded.directory.loaded)
+        loaded.create_directory("a/b/x")
+        a, e = loaded.directory["a"], loaded.directory["e"]
+        self.assertTrue(a.loaded)
+        self.assertTrue(a["b"].loaded)
+        self.assertFalse(e.loaded)
+        self.assertEqual(list(loaded.iter_directory("e/f", max_depth=1)), ["g"])
+        self.assertTrue(e["f"].loaded)
+        self.assertFalse(e["f"]["g"].loaded)
+
+    def test_counters_without_loading(self):
+        """Test that subtree counters are read from the image, not by loading it."""
+        loaded = DirectoryStructure()
+        loaded.load(self.path)
+        self.assertEqual(loaded.stat_directory(), self.ds.stat_directory())
+        self.assertEqual(loaded.stat_directory("e"), (4, 3))
+        self.assertFalse(loaded.directory["e"].loaded)
+        loaded.delete_directory("e/f/g")
+        self.assertEqual(loaded.stat_directory("e"), (2, 1))
+        self.assertEqual(loaded.stat_directory(), (8, 3))
+
+    def test_find_on_loaded_tree(self):
+        """Test that FIND indexes a loaded image and follows later changes."""
+        loaded = DirectoryStructure()
+        loaded.load(self.path)
+        self.assertEqual(loaded.find_directories("?"), ["a", "a/b", "a/b/c", "a/d", "e", "e/f", "e/f/g",
+                                                        "e/f/g/h", "e/ü", "i"])
+        loaded.move_directory("e/f", "i")
+        self.assertEqual(loaded.find_directories("h"), ["i/f/g/h"])
+        loaded.load(self.path)
+        self.assertEqual(loaded.find_directories("h"), ["e/f/g/h"])
+
+    def test_commands_on_loaded_tree(self):
+        """Test moving and deleting directories that are not loaded yet."""
+        loaded = DirectoryStructure()
+        loaded.load(self.path)
+        loaded.move_directory("e/f", "i")
+        loaded.delete_directory("a/b")
+        self.assertEqual(list(loaded.iter_directory()),
+                         ["a", "  d", "e", "  ü", "i", "  f", "    g", "      h"])
+
+    def test_save_over_loaded_image(self):
+        """Test saving a lazily loaded tree over its own image file."""
+        loaded = DirectoryStructure()
+        loaded.load(self.path)
+        loaded.create_directory("j")
+        loaded.save(self.path)
+        reloaded = DirectoryStructure()
+        reloaded.load(self.path)
+        self.assertEqual(list(reloaded.iter_directory()), list(self.ds.iter_directory()) + ["j"])
+
+    def test_empty_tree(self):
+        """Test saving and loading an empty tree."""
+        write_image(DirectoryStructure().directory, self.path)
+        self.assertEqual(len(load_image(self.path)), 0)
+
+    def test_graft_encoded_subtree(self):
+        """Test that a subtree encoded in memory can be grafted into another tree."""
+        subtree = decode_image(encode_image(self.ds.directory["e"]), "e")
+        self.assertEqual((subtree.name, subtree.descendants, subtree.height), ("e", 4, 3))
+        other = DirectoryStructure()
+        other.create_directory("x")
+        other.graft("x/y", subtree)
+        self.assertEqual(list(other.iter_directory()), ["x", "  y", "    e", "      f", "        g", "          h",
+                                                        "      ü"])
+        self.assertEqual(other.stat_directory(), (7, 6))
+        self.assertEqual(other.find_directories("h"), ["x/y/e/f/g/h"])
+
+    def test_corrupt_image(self):
+        """Test that a file that is not an image is rejected."""
+        with open(self.path, "wb") as f:
+            f.write(b"definitely not a tree image, but long enough")
+        with self.assertRaises(CorruptDataError):
+            load_image(self.path)
+        with self.assertRaises(CorruptDataError):
+            decode_image(b"short")
+
+
+if __name__ == "__main__":
+    unittest.main()
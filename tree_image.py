@@ -0,0 +1,242 @@
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+from exceptions import CorruptDataError
+from node import ChildLoader, Node
+
+# Header: magic, format version, string count, node count, reserved,
+# offset of the string data, offset of the node array
+HEADER = struct.Struct("<8sIIIIQQ")
+IMAGE_MAGIC = b"DIRIMAGE"
+IMAGE_FORMAT = 2
+# Each node is four unsigned 32-bit integers: the index of its name in the
+# string table, its number of children, the size of its subtree (including
+# itself), so the next sibling of node i is node i + size(i), and the height
+# of its subtree
+NODE_FIELDS = 4
+
+
+def _little_endian(values: array) -> array:
+    """
+    Returns values in little-endian byte order.
+    """
+    if sys.byteorder == "big":
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values
+
+
+def encode_image(root: Node) -> bytes:
+    """
+    Encodes the tree below root as a binary tree image.
+
+    The image holds a string table with every distinct directory name and a
+    flat, preorder array of fixed-size node records that refer to their name
+    by index.
+
+    Args:
+        root (Node): The root of the tree to encode (its own name is not stored)
+
+    Returns:
+        bytes: The image
+    """
+    string_index = {"": 0}
+    strings = [b""]
+    nodes = array("I", (0, len(root), 0, root.height))
+    stack = [(0, iter(root.items()))]
+    while stack:
+        position, children = stack[-1]
+        entry = next(children, None)
+        if entry is None:
+            stack.pop()
+            nodes[position * NODE_FIELDS + 2] = len(nodes) // NODE_FIELDS - position
+            continue
+        name, node = entry
+        index = string_index.get(name)
+        if index is None:
+            index = string_index[name] = len(strings)
+            strings.append(name.encode("utf-8"))
+        stack.append((len(nodes) // NODE_FIELDS, iter(node.items())))
+        nodes.extend((index, len(node), 0, node.height))
+
+    offsets = array("Q", [0])
+    total = 0
+    for encoded in strings:
+        total += len(encoded)
+        offsets.append(total)
+    data_offset = HEADER.size + len(offsets) * offsets.itemsize
+    node_offset = data_offset + total
+    padding = -node_offset % 8
+    node_offset += padding
+
+    return b"".join((
+        HEADER.pack(IMAGE_MAGIC, IMAGE_FORMAT, len(strings), len(nodes) // NODE_FIELDS, 0, data_offset, node_offset),
+        _little_endian(offsets).tobytes(),
+        b"".join(strings),
+        b"\0" * padding,
+        _little_endian(nodes).tobytes(),
+    ))
+
+
+def write_image(root: Node, path: str) -> None:
+    """
+    Atomically writes the tree below root as a binary tree image file. The
+    file is written next to path and renamed over it, so an image that is
+    currently memory-mapped is never modified in place.
+
+    Args:
+        root (Node): The root of the tree to save
+        path (str): The file to write
+    """
+    temporary = path + ".tmp"
+    with open(temporary, "wb") as f:
+        f.write(encode_image(root))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary, path)
+
+
+class TreeImage:
+    """
+    A memory-mapped tree image. Nothing is decoded up front: the children of
+    a node are only turned into Node objects when load() is called for them,
+    and names are decoded (and interned) the first time they are needed.
+    """
+
+    def __init__(self, path: str, data=None):
+        """
+        Maps an image file written by write_image, or reads an image
+        returned by encode_image from memory.
+
+        Args:
+            path (str): The image file, or a name for the image in error messages
+            data (bytes, optional): The image itself, in which case path is not opened
+
+        Raises:
+            CorruptDataError: If the file is not a valid tree image
+        """
+        self.path = path
+        if data is not None:
+            size = len(data)
+            if size < HEADER.size:
+                raise CorruptDataError(path, "Unknown tree image format")
+            self._map = data
+        else:
+            with open(path, "rb") as f:
+                size = os.fstat(f.fileno()).st_size
+                if size < HEADER.size:
+                    raise CorruptDataError(path, "Unknown tree image format")
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, string_count, node_count, _, data_offset, node_offset = HEADER.unpack_from(self._map)
+        if magic != IMAGE_MAGIC or version != IMAGE_FORMAT:
+            raise CorruptDataError(path, "Unknown tree image format")
+        node_end = node_offset + node_count * NODE_FIELDS * 4
+        if node_count == 0 or data_offset != HEADER.size + (string_count + 1) * 8 or node_end != size:
+            raise CorruptDataError(path)
+
+        view = memoryview(self._map)
+        self._offsets = view[HEADER.size:data_offset].cast("Q")
+        self._nodes = view[node_offset:node_end].cast("I")
+        if sys.byteorder == "big":
+            self._offsets = _little_endian(array("Q", self._offsets))
+            self._nodes = _little_endian(array("I", self._nodes))
+        self._data_offset = data_offset
+        self._names = [None] * string_count
+        self.node_count = node_count
+
+    def name(self, index: int) -> str:
+        """
+        Returns the string with the given index in the string table.
+        """
+        name = self._names[index]
+        if name is None:
+            start = self._data_offset + self._offsets[index]
+            end = self._data_offset + self._offsets[index + 1]
+            name = self._names[index] = sys.intern(str(self._map[start:end], "utf-8"))
+        return name
+
+    def node(self, position: int, name: str) -> Node:
+        """
+        Creates the (still unloaded) Node for the record at position.
+        """
+        record = position * NODE_FIELDS
+        if self._nodes[record + 1]:
+            return Node(name, ImageChildren(self, position), self._nodes[record + 2] - 1, self._nodes[record + 3])
+        return Node(name)
+
+    def children(self, position: int):
+        """
+        Materialises the direct children of the record at position.
+
+        Returns:
+            dict: Child name to Node map, or None if the node has no children
+        """
+        nodes = self._nodes
+        count = nodes[position * NODE_FIELDS + 1]
+        if not count:
+            return None
+        children = {}
+        child = position + 1
+        for _ in range(count):
+            record = child * NODE_FIELDS
+            name = self.name(nodes[record])
+            children[name] = self.node(child, name)
+            child += nodes[record + 2]
+        return children
+
+    def root(self) -> Node:
+        """
+        Returns the root of the image, with its children not yet loaded.
+        """
+        return self.node(0, "")
+
+
+class ImageChildren(ChildLoader):
+    """
+    The not yet materialised children of a node stored in a TreeImage.
+    """
+    __slots__ = ("image", "position")
+
+    def __init__(self, image: TreeImage, position: int):
+        self.image = image
+        self.position = position
+
+    def load(self):
+        return self.image.children(self.position)
+
+
+def load_image(path: str) -> Node:
+    """
+    Memory-maps a tree image and returns its lazily loaded root.
+
+    Args:
+        path (str): The image file
+
+    Returns:
+        Node: The root of the tree
+
+    Raises:
+        CorruptDataError: If the file is not a valid tree image
+    """
+    return TreeImage(path).root()
+
+
+def decode_image(data: bytes, name: str = "") -> Node:
+    """
+    Returns the lazily loaded root of an image returned by encode_image.
+
+    Args:
+        data (bytes): The image
+        name (str, optional): Name to give the root. Defaults to "".
+
+    Returns:
+        Node: The root of the tree, detached
+
+    Raises:
+        CorruptDataError: If data is not a valid tree image
+    """
+    return TreeImage("<memory>", data).node(0, name)